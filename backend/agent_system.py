@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel, validator
+
+# Adjust the Python module search path to correctly point to the project root directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.llm_agent import LLMAgent, PromptRequest
+from utilities.external_memory import ExternalMemory
+from utilities.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class PlanStep(BaseModel):
+    """
+    Represents one sub-task of a plan: a prompt that reads named inputs and produces named outputs.
+
+    Occurrences of "{name}" in the prompt are replaced by the value of the input called name.
+    The step's response is saved under each of its outputs.
+
+    A step with a recall query gets "{memory}" replaced by the recall_k memory chunks most
+    similar to the query (after its own placeholders are filled), instead of the whole memory.
+    """
+    id: str
+    prompt: str
+    inputs: List[str] = []
+    outputs: List[str] = []
+    max_tokens: int = 1024
+    temperature: float = 0
+    recall: Optional[str] = None
+    recall_k: int = 5
+
+
+class TaskPlan(BaseModel):
+    """
+    Represents a plan of steps whose data dependencies form a directed acyclic graph.
+    """
+    steps: List[PlanStep]
+
+    @validator("steps")
+    def check_graph(cls, steps):
+        ids = [step.id for step in steps]
+        if len(set(ids)) != len(ids):
+            raise ValueError("step ids must be unique")
+        producers = {}
+        for step in steps:
+            for output in step.outputs:
+                if output in producers:
+                    raise ValueError(f"output {output!r} is produced by both {producers[output]!r} and {step.id!r}")
+                producers[output] = step.id
+        # Every step is visited at most once by a topological sort unless there is a cycle
+        if len(topological_order(steps)) != len(steps):
+            raise ValueError("steps contain a dependency cycle")
+        return steps
+
+    def fingerprint(self) -> str:
+        """
+        Returns a stable hash of the plan, used as the default run ID.
+        """
+        return hashlib.sha256(json.dumps(self.dict(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def dependencies(steps: List[PlanStep]) -> Dict[str, List[str]]:
+    """
+    Returns, for every step ID, the IDs of the steps producing its inputs.
+
+    Inputs no step produces are expected to be in external memory before the run starts.
+    """
+    producers = {output: step.id for step in steps for output in step.outputs}
+    return {step.id: sorted({producers[name] for name in step.inputs if name in producers}) for step in steps}
+
+
+def topological_order(steps: List[PlanStep]) -> List[str]:
+    """
+    Returns the step IDs in dependency order, leaving out any that sit on a cycle.
+    """
+    remaining = {step_id: len(deps) for step_id, deps in dependencies(steps).items()}
+    dependents: Dict[str, List[str]] = {step.id: [] for step in steps}
+    for step_id, deps in dependencies(steps).items():
+        for dep in deps:
+            dependents[dep].append(step_id)
+    ready = [step_id for step_id, count in remaining.items() if count == 0]
+    order = []
+    while ready:
+        step_id = ready.pop()
+        order.append(step_id)
+        for dependent in dependents[step_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    return order
+
+
+class DAGScheduler:
+    """
+    Control unit that runs a task plan on a bounded pool of LLM agents.
+
+    A step starts as soon as all the steps producing its inputs have finished, so independent
+    steps run in parallel. Outputs are passed to dependents through external memory, together
+    with a per-step completion marker. The marker is written in the same transaction as the
+    outputs, or, when outputs are indexed for recall, after the outputs and the index are on
+    disk; running the same plan again with the same run ID skips every step that already completed.
+    """
+
+    def __init__(self, plan: TaskPlan, memory: ExternalMemory, agent_factory: Callable[[], LLMAgent],
+                 max_workers: int = 4, run_id: Optional[str] = None):
+        """
+        Initializes an instance of the DAGScheduler class.
+
+        Args:
+            plan (TaskPlan): The plan to run.
+            memory (ExternalMemory): Where inputs are read from and outputs and checkpoints are written to.
+            agent_factory (Callable[[], LLMAgent]): Creates the agents of the worker pool.
+            max_workers (int, optional): Maximum number of steps running at once.
+            run_id (str, optional): Namespace of the run in memory. Defaults to the plan fingerprint.
+        """
+        self.plan = plan
+        self.memory = memory
+        self.max_workers = max_workers
+        self.run_id = run_id or plan.fingerprint()
+        self.steps = {step.id: step for step in plan.steps}
+        self.dependencies = dependencies(plan.steps)
+        self.dependents: Dict[str, List[str]] = {step_id: [] for step_id in self.steps}
+        for step_id, deps in self.dependencies.items():
+            for dep in deps:
+                self.dependents[dep].append(step_id)
+        self.produced = {name for step in plan.steps for name in step.outputs}
+        # Outputs only need embedding when a step may recall them
+        self.index_outputs = any(step.recall for step in plan.steps)
+        self.agents: "queue.Queue[LLMAgent]" = queue.Queue()
+        for _ in range(max_workers):
+            self.agents.put(agent_factory())
+
+    def output_key(self, name: str) -> str:
+        return f"{self.run_id}/outputs/{name}"
+
+    def _checkpoint_key(self, step_id: str) -> str:
+        return f"{self.run_id}/completed/{step_id}"
+
+    def completed_steps(self) -> List[str]:
+        """
+        Returns the IDs of the steps checkpointed as completed in this run.
+        """
+        markers = self.memory.retrieve_many(self._checkpoint_key(step_id) for step_id in self.steps)
+        return [step_id for step_id in self.steps if markers[self._checkpoint_key(step_id)]]
+
+    def _run_step(self, step: PlanStep):
+        # Plan outputs live in the run namespace; anything else is read as seeded by the caller
+        keys = {name: self.output_key(name) if name in self.produced else name for name in step.inputs}
+        values = self.memory.retrieve_many(keys.values())
+        prompt, query = step.prompt, step.recall
+        for name, key in keys.items():
+            if values[key] is None:
+                raise ValueError(f"Input {name!r} of step {step.id!r} is not in external memory")
+            prompt = prompt.replace(f"{{{name}}}", str(values[key]))
+            query = query.replace(f"{{{name}}}", str(values[key])) if query else query
+        if query:
+            recalled = self.memory.recall(query, k=step.recall_k)
+            prompt = prompt.replace("{memory}", "\n\n".join(str(value) for value in recalled.values()))
+
+        agent = self.agents.get()
+        try:
+            response = agent.send_prompt(PromptRequest(prompt=prompt, max_tokens=step.max_tokens, temperature=step.temperature))
+        finally:
+            self.agents.put(agent)
+
+        items = {self.output_key(name): response.response for name in step.outputs}
+        if self.index_outputs and items:
+            # The index only reaches disk on flush, so it is written before the checkpoint;
+            # a crash in between then only repeats the step
+            self.memory.save_chunks(items)
+            self.memory.flush()
+            items = {}
+        items[self._checkpoint_key(step.id)] = True
+        self.memory.save_many(items)
+        logger.info("Step %s completed", step.id)
+
+    def run(self) -> Dict[str, str]:
+        """
+        Runs every step that has not completed yet.
+
+        If a step fails, no new steps are started; the ones already running finish and are
+        checkpointed, and the first error is raised.
+
+        Returns:
+            Dict[str, str]: Every output of the plan by name.
+        """
+        done = set(self.completed_steps())
+        if done:
+            logger.info("Resuming run %s with %d of %d steps completed", self.run_id, len(done), len(self.steps))
+        remaining = {
+            step_id: sum(dep not in done for dep in deps)
+            for step_id, deps in self.dependencies.items() if step_id not in done
+        }
+        ready = [step_id for step_id, count in remaining.items() if count == 0]
+        running: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while ready or running:
+                if error is None:
+                    for step_id in ready:
+                        running[executor.submit(self._run_step, self.steps[step_id])] = step_id
+                ready = []
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step_id = running.pop(future)
+                    if future.exception() is not None:
+                        logger.error("Step %s failed: %s", step_id, future.exception())
+                        error = error or future.exception()
+                        continue
+                    done.add(step_id)
+                    for dependent in self.dependents[step_id]:
+                        if dependent not in remaining:
+                            continue
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            ready.append(dependent)
+
+        if error is not None:
+            raise error
+        names = [name for step in self.plan.steps for name in step.outputs]
+        values = self.memory.retrieve_many(self.output_key(name) for name in names)
+        return {name: values[self.output_key(name)] for name in names}
+
+
+def trigger_system(plan_path: str = "plan.json", max_workers: int = 4, run_id: Optional[str] = None,
+                   memory_path: str = "memory_db", model: str = "gpt-4", coalesce: bool = False,
+                   memory_engine: str = "sqlite") -> Dict[str, str]:
+    """
+    Runs the task plan in a JSON file with the multi-agent system, resuming an earlier run of it.
+
+    Args:
+        plan_path (str, optional): Path to the plan, a JSON object with a list of steps.
+        max_workers (int, optional): Number of agents running steps in parallel.
+        run_id (str, optional): Namespace of the run. Defaults to the plan fingerprint.
+        memory_path (str, optional): External memory database used for outputs and checkpoints.
+        model (str, optional): The model the agents use.
+        coalesce (bool, optional): Whether agents share one upstream call for identical prompts in flight together.
+        memory_engine (str, optional): Storage engine of the external memory, "sqlite" or "log".
+
+    Returns:
+        Dict[str, str]: Every output of the plan by name.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+    with open(plan_path, "r", encoding="utf-8") as f:
+        plan = TaskPlan(**json.load(f))
+    with ExternalMemory(memory_path, engine=memory_engine) as memory:
+        single_flight = SingleFlight() if coalesce else None
+        scheduler = DAGScheduler(
+            plan, memory, lambda: LLMAgent(api_key=api_key, model=model, single_flight=single_flight), max_workers, run_id
+        )
+        return scheduler.run()
@@ -0,0 +1,372 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from pydantic import ValidationError
+
+# Adjust the Python module search path to correctly point to the project root directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.main import Services, _sse, create_app
+from models.schemas import PromptRequest
+from utilities.admission import AdmissionQueue, Overloaded
+
+logger = logging.getLogger(__name__)
+
+Receive = Callable[[], Awaitable[Dict]]
+Send = Callable[[Dict], Awaitable[None]]
+
+# The prompt routes served natively; "batch" is a route of its own
+_PROMPT = re.compile(r"^/prompt/(?!batch$)([^/]+)$")
+_PROMPT_STREAM = re.compile(r"^/prompt/([^/]+)/stream$")
+
+
+async def _read_body(receive: Receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return body
+
+
+async def _wait_for_disconnect(receive: Receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_json(send: Send, status: int, payload, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    body = json.dumps(payload, default=str).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AsyncApp:
+    """
+    ASGI app serving the prompt API without holding a thread per in-flight prompt.
+
+    POST /prompt/<id> and /prompt/<id>/stream are handled on the event loop with an
+    AsyncLLMAgent, behind an AdmissionQueue that answers 503 once both its in-flight and
+    queue limits are reached. Every other route is passed to the Flask app of create_app,
+    run on a pool of ASYNC_WSGI_THREADS threads of its own, so both modes share one set of
+    routes, conversations and metrics, and slow Flask routes cannot take the threads the
+    prompt routes use for history and context. A client disconnecting cancels its upstream call.
+
+    The async agent uses one model and does not coalesce prompts: MODEL_ROUTES only
+    contributes its first model, and COALESCE_PROMPTS applies to the Flask routes alone.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Initializes an instance of the AsyncApp class.
+
+        Args:
+            config (Dict, optional): Settings overriding the ones taken from the environment and .env file.
+        """
+        self.flask_app = create_app(config)
+        self.services: Services = self.flask_app.extensions["lmauto"]
+        settings = self.services.config
+        self.admission = self.services.admission = AdmissionQueue(
+            max_in_flight=settings["ASYNC_MAX_IN_FLIGHT"], max_queue=settings["ASYNC_MAX_QUEUE"],
+            queue_timeout=settings["ASYNC_QUEUE_TIMEOUT"],
+        )
+        self.wsgi_executor = ThreadPoolExecutor(max_workers=settings["ASYNC_WSGI_THREADS"], thread_name_prefix="wsgi")
+        if settings["MODEL_ROUTES"] and not settings["ASYNC_AGENT_FACTORY"]:
+            logger.warning(
+                "MODEL_ROUTES is set, but the async prompt routes neither route nor hedge; they only use %s",
+                settings["MODEL_ROUTES"][0]["model"],
+            )
+        if settings["COALESCE_PROMPTS"]:
+            logger.warning("COALESCE_PROMPTS is set, but the async prompt routes do not coalesce identical prompts")
+
+    async def __call__(self, scope: Dict, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        path, method = scope["path"], scope["method"]
+        if method == "POST":
+            match = _PROMPT.match(path)
+            if match:
+                await self._observe(self._prompt, "/prompt/<conversation_id>", scope, receive, send, unquote(match.group(1)))
+                return
+            match = _PROMPT_STREAM.match(path)
+            if match:
+                await self._observe(
+                    self._prompt_stream, "/prompt/<conversation_id>/stream", scope, receive, send, unquote(match.group(1))
+                )
+                return
+        await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                agent = self.services._async_agent
+                if agent is not None:
+                    await agent.close()
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _observe(self, handler, route: str, scope: Dict, receive: Receive, send: Send, conversation_id: str):
+        """
+        Runs a native handler with the request metrics the Flask hooks record for the other routes.
+        """
+        metrics = self.services.metrics
+        statuses = []
+
+        async def send_and_record(message: Dict):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        metrics.in_flight.inc(route=route)
+        try:
+            await handler(route, receive, send_and_record, conversation_id)
+        finally:
+            metrics.in_flight.dec(route=route)
+            metrics.request_seconds.observe(time.perf_counter() - started, route=route, method="POST")
+            # 499 as in nginx: the client went away before a response was started
+            metrics.requests.inc(route=route, method="POST", status=statuses[0] if statuses else 499)
+
+    async def _validate(self, route: str, receive: Receive, send: Send, conversation_id: str) -> Optional[PromptRequest]:
+        """
+        Checks the conversation and parses the body, answering the request itself if either is invalid.
+        """
+        conversations = self.services.conversations
+        if not await asyncio.to_thread(conversations.exists, conversation_id):
+            logger.error(f"Invalid conversation ID: {conversation_id}")
+            await _send_json(send, 404, {"error": "Invalid conversation ID"})
+            return None
+        body = await _read_body(receive)
+        try:
+            with self.services.metrics.phase("validate", route):
+                prompt_data = json.loads(body)
+                return PromptRequest(**prompt_data)
+        except ValidationError as e:
+            logger.error(f"Validation error on prompt data: {e.errors()}", exc_info=True)
+            await _send_json(send, 400, {"error": e.errors()})
+        except (ValueError, TypeError) as e:
+            logger.error(f"Invalid prompt body: {e}")
+            await _send_json(send, 400, {"error": "Expected a JSON object"})
+        return None
+
+    async def _shed(self, send: Send, error: Overloaded):
+        logger.warning(f"Shedding a prompt: {error}")
+        await _send_json(send, 503, {"error": str(error)}, [(b"retry-after", str(max(1, round(error.retry_after))).encode())])
+
+    async def _prompt(self, route: str, receive: Receive, send: Send, conversation_id: str):
+        prompt_request = await self._validate(route, receive, send, conversation_id)
+        if prompt_request is None:
+            return
+        services, metrics = self.services, self.services.metrics
+        conversations = services.conversations
+        try:
+            await self.admission.acquire()
+        except Overloaded as e:
+            await self._shed(send, e)
+            return
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            agent = services.async_agent
+            with metrics.phase("context", route):
+                # Add prompt to conversation history
+                await asyncio.to_thread(conversations.append, conversation_id, {"role": "user", "content": prompt_request.prompt})
+                history = await asyncio.to_thread(
+                    services.context.build, conversation_id, agent.model, prompt_request.max_tokens
+                )
+
+            with metrics.upstream(agent.model, route):
+                upstream = asyncio.ensure_future(agent.send_prompt(prompt_request, history))
+                await asyncio.wait({upstream, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not upstream.done():
+                    upstream.cancel()
+                    logger.info(f"Client disconnected; cancelled the prompt in conversation {conversation_id}")
+                    return
+                response = upstream.result()
+            metrics.record_usage(response.model or agent.model, response.usage, conversation_id, cached=response.cached)
+
+            with metrics.phase("store", route):
+                # Add response to conversation history
+                await asyncio.to_thread(conversations.append, conversation_id, {"role": "assistant", "content": response.response})
+
+            logger.info(f"Prompt sent successfully in conversation {conversation_id}")
+            with metrics.phase("serialize", route):
+                await _send_json(send, 200, response.dict())
+        except Overloaded as e:
+            await self._shed(send, e)
+        except Exception as e:
+            logger.error(f"Failed to send prompt in conversation {conversation_id}: {e}", exc_info=True)
+            await _send_json(send, 500, {"error": str(e)})
+        finally:
+            disconnected.cancel()
+            self.admission.release()
+
+    async def _prompt_stream(self, route: str, receive: Receive, send: Send, conversation_id: str):
+        prompt_request = await self._validate(route, receive, send, conversation_id)
+        if prompt_request is None:
+            return
+        services, metrics = self.services, self.services.metrics
+        conversations = services.conversations
+        try:
+            await self.admission.acquire()
+        except Overloaded as e:
+            await self._shed(send, e)
+            return
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        parts: List[str] = []
+        try:
+            try:
+                agent = services.async_agent
+                with metrics.phase("context", route):
+                    # Add prompt to conversation history
+                    await asyncio.to_thread(conversations.append, conversation_id, {"role": "user", "content": prompt_request.prompt})
+                    history = await asyncio.to_thread(
+                        services.context.build, conversation_id, agent.model, prompt_request.max_tokens
+                    )
+            except Exception as e:
+                logger.error(f"Failed to send prompt in conversation {conversation_id}: {e}", exc_info=True)
+                await _send_json(send, 500, {"error": str(e)})
+                return
+
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")],
+            })
+
+            async def relay():
+                started = time.perf_counter()
+                meta: Dict = {}
+                with metrics.upstream(agent.model, route):
+                    async for delta in agent.send_prompt_stream(prompt_request, history, meta=meta):
+                        if not parts:
+                            metrics.phase_seconds.observe(time.perf_counter() - started, route=route, phase="first_token")
+                        parts.append(delta)
+                        await send({"type": "http.response.body", "body": _sse({"delta": delta}).encode(), "more_body": True})
+                metrics.record_usage(
+                    meta.get("model", agent.model), meta.get("usage"), conversation_id, cached=meta.get("cached", False)
+                )
+
+            streaming = asyncio.ensure_future(relay())
+            await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not streaming.done():
+                streaming.cancel()
+                logger.info(f"Client disconnected; cancelled the stream in conversation {conversation_id}")
+                return
+            try:
+                streaming.result()
+                final = _sse({"response": "".join(parts)}, event="done")
+                logger.info(f"Prompt streamed successfully in conversation {conversation_id}")
+            except Exception as e:
+                logger.error(f"Failed to stream prompt in conversation {conversation_id}: {e}", exc_info=True)
+                final = _sse({"error": str(e)}, event="error")
+            await send({"type": "http.response.body", "body": final.encode()})
+        finally:
+            disconnected.cancel()
+            self.admission.release()
+            # The history keeps whatever part of the answer was produced, as in the threaded mode
+            if parts:
+                await asyncio.to_thread(conversations.append, conversation_id, {"role": "assistant", "content": "".join(parts)})
+
+    async def _wsgi(self, scope: Dict, receive: Receive, send: Send):
+        """
+        Serves a request with the Flask app on a thread of the WSGI pool.
+        """
+        loop = asyncio.get_running_loop()
+        body = await _read_body(receive)
+        host, port = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", ""),
+            "PATH_INFO": scope["path"],
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": host,
+            "SERVER_PORT": str(port),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+            if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[name] = value
+            else:
+                key = f"HTTP_{name}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        started = {}
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            started["status"], started["headers"] = int(status.split(" ", 1)[0]), headers
+
+        def run():
+            result = self.flask_app(environ, start_response)
+            return result, iter(result)
+
+        result, chunks = await loop.run_in_executor(self.wsgi_executor, run)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": started["status"],
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in started["headers"]],
+            })
+            # Chunk by chunk, so that streamed responses such as long history exports stay streamed
+            while True:
+                chunk = await loop.run_in_executor(self.wsgi_executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                await loop.run_in_executor(self.wsgi_executor, close)
+
+
+def create_asgi_app(config: Optional[Dict] = None) -> AsyncApp:
+    """
+    Creates the web app for an ASGI server.
+
+    Args:
+        config (Dict, optional): Settings overriding the ones taken from the environment and .env file.
+
+    Returns:
+        AsyncApp: The app, e.g. for uvicorn --factory "backend.asgi:create_asgi_app".
+    """
+    return AsyncApp(config)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('The async serving mode needs an ASGI server, e.g. pip install uvicorn')
+    uvicorn.run(create_asgi_app(), port=8000)
@@ -0,0 +1,237 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+# Adjust the Python module search path to correctly point to the project root directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.llm_agent import LLMAgent, PromptRequest
+
+
+class Checkpoint:
+    """
+    Compact record of the input lines already processed, identified by byte offset.
+
+    Every line before the watermark is done; the completed lines past it are stored
+    individually. A line that is slow to finish, e.g. one stuck in retries, holds the
+    watermark back, so every line completed after it is stored until it finishes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0
+        # offset -> offset of the following line, for finished lines past the watermark
+        self.done: Dict[int, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.watermark = state["watermark"]
+            self.done = {offset: next_offset for offset, next_offset in state["done"]}
+
+    def is_done(self, offset: int) -> bool:
+        return offset < self.watermark or offset in self.done
+
+    def mark_done(self, offset: int, next_offset: int):
+        """
+        Records a finished line and advances the watermark past every contiguous finished line.
+        """
+        self.done[offset] = next_offset
+        while self.watermark in self.done:
+            self.watermark = self.done.pop(self.watermark)
+
+    def save(self):
+        # Replace the file atomically so a crash leaves either the old or the new checkpoint
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done.items())}, f)
+        os.replace(tmp_path, self.path)
+
+
+# Output records are written with their input offset first
+_RECORD_OFFSET = re.compile(rb'^\{"offset": (\d+)')
+
+
+def written_offsets(path: str, watermark: int) -> Set[int]:
+    """
+    Returns the input offsets past the watermark that already have a complete record in an output file.
+
+    Records are only checkpointed after they are written, so after a crash the output may hold
+    records of lines the checkpoint does not know are done.
+    """
+    offsets = set()
+    if not os.path.exists(path):
+        return offsets
+    with open(path, "rb") as f:
+        for line in f:
+            match = _RECORD_OFFSET.match(line)
+            # A line without a newline is a record cut short by the crash
+            if match and line.endswith(b"\n") and int(match.group(1)) >= watermark:
+                offsets.add(int(match.group(1)))
+    return offsets
+
+
+def read_lines(path: str, start: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    Yields (offset, next_offset, line) for every line of a file from a byte offset on,
+    reading one line at a time.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            next_offset = offset + len(line)
+            yield offset, next_offset, line
+            offset = next_offset
+
+
+class Progress:
+    """
+    Throughput counters for a batch run.
+    """
+
+    def __init__(self, total_bytes: int, start_bytes: int):
+        self.started = time.monotonic()
+        self.total_bytes = total_bytes
+        self.start_bytes = start_bytes
+        self.bytes_done = start_bytes
+        self.rows = 0
+        self.errors = 0
+        self.tokens = 0
+
+    def report(self) -> Dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        bytes_rate = (self.bytes_done - self.start_bytes) / elapsed
+        remaining = max(self.total_bytes - self.bytes_done, 0)
+        return {
+            "rows": self.rows,
+            "errors": self.errors,
+            "rows_per_second": self.rows / elapsed,
+            "tokens_per_second": self.tokens / elapsed,
+            "eta_seconds": remaining / bytes_rate if bytes_rate else None,
+        }
+
+
+def format_progress(report: Dict) -> str:
+    eta = report["eta_seconds"]
+    return (
+        f"{report['rows']} rows ({report['errors']} errors), {report['rows_per_second']:.1f} rows/s, "
+        f"{report['tokens_per_second']:.0f} tokens/s, ETA {f'{eta:.0f}s' if eta is not None else 'unknown'}"
+    )
+
+
+def _process_line(agent: LLMAgent, line: bytes, line_offset: int, max_retries: int) -> Dict:
+    record: Dict = {"offset": line_offset}
+    try:
+        data = json.loads(line)
+        if isinstance(data, dict) and "id" in data:
+            record["id"] = data["id"]
+        response = agent.send_prompt_with_retry(PromptRequest(**data), max_retries)
+        record["response"] = response.dict()
+    except ValidationError as e:
+        record["error"] = e.errors()
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def run_jsonl(input_path: str, output_path: str, agent: LLMAgent, max_concurrency: int = 8,
+              checkpoint_path: Optional[str] = None, max_retries: int = 5,
+              on_progress: Optional[Callable[[Dict], None]] = None, progress_interval: float = 10.0) -> Dict:
+    """
+    Runs every prompt in a JSONL file through an agent and appends the results to another JSONL file.
+
+    The input is streamed one line at a time and at most max_concurrency prompts are in flight.
+    Each output record carries the byte offset of its input line (and its "id", if it had one),
+    since records are written in completion order. The checkpoint is saved after every window
+    of completed lines. Restarting with the same checkpoint and output skips the finished lines,
+    including those whose records were written after the last checkpoint, so each line gets
+    one complete record; prompts in flight during a crash are sent again. A record cut short
+    by a crash stays in the output as an incomplete line.
+
+    Args:
+        input_path (str): The JSONL file of PromptRequest objects.
+        output_path (str): The JSONL file results are appended to.
+        agent (LLMAgent): The agent sending the prompts.
+        max_concurrency (int, optional): Maximum number of prompts in flight.
+        checkpoint_path (str, optional): Where progress is kept. Defaults to output_path + ".checkpoint".
+        max_retries (int, optional): Retries per prompt for rate limit, server and connection errors.
+        on_progress (Callable[[Dict], None], optional): Receives a progress report every progress_interval seconds.
+        progress_interval (float, optional): Seconds between progress reports.
+
+    Returns:
+        Dict: The final progress report.
+    """
+    checkpoint = Checkpoint(checkpoint_path or f"{output_path}.checkpoint")
+    if os.path.exists(checkpoint.path):
+        written = written_offsets(output_path, checkpoint.watermark)
+    else:
+        # A fresh run: records already in the output belong to another run
+        written = set()
+        checkpoint.save()
+    progress = Progress(os.path.getsize(input_path), checkpoint.watermark)
+    running: Dict[Future, Tuple[int, int]] = {}
+    last_report = time.monotonic()
+    completed_since_save = 0
+
+    def finish(finished):
+        nonlocal completed_since_save
+        for future in finished:
+            line_offset, next_offset = running.pop(future)
+            record = future.result()
+            output.write(json.dumps(record) + "\n")
+            checkpoint.mark_done(line_offset, next_offset)
+            progress.rows += 1
+            progress.errors += "error" in record
+            progress.tokens += ((record.get("response") or {}).get("usage") or {}).get("total_tokens", 0)
+            progress.bytes_done += next_offset - line_offset
+            completed_since_save += 1
+        if completed_since_save >= max_concurrency:
+            output.flush()
+            checkpoint.save()
+            completed_since_save = 0
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        if output.tell() > 0:
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # End the incomplete record, so the next one starts on a line of its own
+                    output.write("\n")
+        for line_offset, next_offset, line in read_lines(input_path, checkpoint.watermark):
+            if checkpoint.is_done(line_offset):
+                continue
+            if not line.strip():
+                checkpoint.mark_done(line_offset, next_offset)
+                continue
+            if line_offset in written:
+                checkpoint.mark_done(line_offset, next_offset)
+                progress.bytes_done += next_offset - line_offset
+                continue
+            while len(running) >= max_concurrency:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                finish(finished)
+            running[executor.submit(_process_line, agent, line, line_offset, max_retries)] = (line_offset, next_offset)
+
+            if on_progress is not None and time.monotonic() - last_report >= progress_interval:
+                on_progress(progress.report())
+                last_report = time.monotonic()
+
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            finish(finished)
+        output.flush()
+        checkpoint.save()
+
+    report = progress.report()
+    if on_progress is not None:
+        on_progress(report)
+    return report
@@ -3,16 +3,13 @@ import os
 import sys
 
 import typer
-from backend.agent_system import trigger_system
-from flask import Flask
-from openai.api import Model, OpenAI
 
 # Adjust the Python module search path to correctly point to the project root directory
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-
-app = Flask(__name__)
+# Commands import Flask, OpenAI and the agent system themselves, so that startup and
+# --help only pay for what a command actually uses.
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,18 +17,31 @@ logger = logging.getLogger(__name__)
 
 cli = typer.Typer()
 
+
+def _api_key() -> str:
+    """
+    Returns the OpenAI API key from the environment or the .env file.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+    return api_key
+
+
 @cli.command()
 def init_agents(model_name: str = typer.Option(..., help="The name of the model to use")):
     """
     Initialize the LLM agents.
     """
     try:
+        from models.llm_agent import LLMAgent
+
         # Initialize the LLM agents
-        OpenAI.api_key = os.getenv("OPENAI_API_KEY")
-        if OpenAI.api_key is None:
-            raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
-        models = Model.list()["data"]
-        model_ids = [model["id"] for model in models]
+        api_key = _api_key()
+        model_ids = [model.id for model in LLMAgent(api_key=api_key).client.models.list()]
         if model_name not in model_ids:
             typer.echo("Available models:")
             for i, model_id in enumerate(model_ids):
@@ -51,7 +61,9 @@ def start_server(port: int = typer.Option(8000, help="The port on which to run t
     Start the Flask web server on a specified port.
     """
     try:
-        app.run(port=port)
+        from backend.main import create_app
+
+        create_app().run(port=port)
         logger.info(f"Flask server started successfully on port {port}")
         typer.echo(f"Server started on port {port}")
     except Exception as e:
@@ -60,13 +72,26 @@ def start_server(port: int = typer.Option(8000, help="The port on which to run t
 
 
 @cli.command(name="trigger-system")
-def trigger_system_command():
+def trigger_system_command(
+    plan: str = typer.Option("plan.json", help="Path to the JSON task plan"),
+    workers: int = typer.Option(4, help="Number of agents running independent steps in parallel"),
+    run_id: str = typer.Option(None, help="Run to resume; defaults to a fingerprint of the plan"),
+    memory: str = typer.Option("memory_db", help="External memory database for outputs and checkpoints"),
+    coalesce: bool = typer.Option(False, help="Share one API call between identical prompts in flight together"),
+    memory_engine: str = typer.Option("sqlite", help='External memory engine: "sqlite" or the append-only "log"'),
+):
     """
     Trigger the multi-agent system.
     """
     try:
+        from backend.agent_system import trigger_system
+
+        _api_key()
         # Trigger the multi-agent system
-        trigger_system()
+        outputs = trigger_system(plan_path=plan, max_workers=workers, run_id=run_id, memory_path=memory, coalesce=coalesce,
+                                 memory_engine=memory_engine)
+        for name, value in outputs.items():
+            typer.echo(f"{name}:\n{value}\n")
         logger.info("Multi-agent system has been triggered.")
         typer.echo("Multi-agent system triggered.")
     except Exception as e:
@@ -75,6 +100,39 @@ def trigger_system_command():
         raise e
 
 
+@cli.command(name="run-batch")
+def run_batch_command(
+    input_path: str = typer.Argument(..., help="JSONL file with one prompt request per line"),
+    output_path: str = typer.Option(..., "--output", help="JSONL file results are appended to"),
+    concurrency: int = typer.Option(8, help="Maximum number of prompts in flight"),
+    checkpoint: str = typer.Option(None, help="Checkpoint file; defaults to the output path plus .checkpoint"),
+    model: str = typer.Option("gpt-4", help="The name of the model to use"),
+    rpm: float = typer.Option(None, help="Requests per minute allowed by the provider; unlimited if unset"),
+    tpm: float = typer.Option(None, help="Tokens per minute allowed by the provider; unlimited if unset"),
+    progress_interval: float = typer.Option(10.0, help="Seconds between progress reports"),
+):
+    """
+    Run every prompt in a JSONL file through the agent, resuming from the checkpoint if there is one.
+    """
+    try:
+        from backend.batch_runner import format_progress, run_jsonl
+        from models.llm_agent import LLMAgent
+        from utilities.rate_limiter import RateLimiter
+
+        agent = LLMAgent(
+            api_key=_api_key(), model=model, rate_limiter=RateLimiter(requests_per_minute=rpm, tokens_per_minute=tpm)
+        )
+        report = run_jsonl(
+            input_path, output_path, agent, max_concurrency=concurrency, checkpoint_path=checkpoint,
+            on_progress=lambda report: typer.echo(format_progress(report)), progress_interval=progress_interval,
+        )
+        logger.info("Batch run finished: %s", report)
+    except Exception as e:
+        logger.error("Error during the batch run: %s", e, exc_info=True)
+        typer.echo(f"Error occurred: {e}")
+        raise typer.Exit(code=1)
+
+
 def run():
     """
     Entry point for running the CLI with module execution method.
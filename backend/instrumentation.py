@@ -0,0 +1,204 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from flask import Flask, Response, g, request
+
+from utilities.metrics import DEFAULT_BUCKETS, UPSTREAM_BUCKETS, MetricsRegistry, TokenUsage
+
+PHASE_BUCKETS = tuple(sorted(set(DEFAULT_BUCKETS) | set(UPSTREAM_BUCKETS)))
+
+
+def _route() -> str:
+    # The URL rule rather than the path, so conversation ids do not become label values
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _queue_start(header: str) -> Optional[float]:
+    """
+    Parses an X-Request-Start header ("t=<epoch>" in seconds, milliseconds or microseconds)
+    as set by nginx, HAProxy or a platform router in front of the workers.
+    """
+    try:
+        value = float(header.strip().lstrip("t="))
+    except ValueError:
+        return None
+    if value > 1e14:
+        return value / 1e6
+    if value > 1e11:
+        return value / 1e3
+    return value
+
+
+class AppMetrics:
+    """
+    Request, phase and token metrics of one app, exposed in Prometheus format on /metrics.
+    """
+
+    def __init__(self, max_conversations: int = 10000):
+        """
+        Initializes an instance of the AppMetrics class.
+
+        Args:
+            max_conversations (int, optional): Conversations whose token usage is kept.
+        """
+        self.registry = registry = MetricsRegistry()
+        self.requests = registry.counter(
+            "lmauto_http_requests_total", "HTTP requests handled.", ("route", "method", "status")
+        )
+        self.request_seconds = registry.histogram(
+            "lmauto_http_request_duration_seconds", "Time from the start of handling to the end of the response.",
+            ("route", "method"), PHASE_BUCKETS,
+        )
+        self.queue_seconds = registry.histogram(
+            "lmauto_http_request_queue_seconds", "Time between the proxy's X-Request-Start and a worker picking the request up.",
+        )
+        self.in_flight = registry.gauge("lmauto_http_requests_in_flight", "HTTP requests being handled.", ("route",))
+        self.phase_seconds = registry.histogram(
+            "lmauto_request_phase_seconds", "Time spent per phase of a request.", ("route", "phase"), PHASE_BUCKETS
+        )
+        self.upstream_in_flight = registry.gauge(
+            "lmauto_upstream_requests_in_flight", "Completion calls waiting on the upstream API.", ("model",)
+        )
+        self.upstream_errors = registry.counter(
+            "lmauto_upstream_errors_total", "Completion calls that raised.", ("model",)
+        )
+        self.tokens = registry.counter(
+            "lmauto_upstream_tokens_total", "Tokens reported by the upstream API.", ("model", "kind")
+        )
+        self.cache_entries = registry.gauge("lmauto_response_cache_entries", "Entries in the response cache.", ("tier",))
+        self.cache_lookups = registry.counter(
+            "lmauto_response_cache_lookups_total", "Response cache lookups.", ("result",)
+        )
+        self.single_flight = registry.counter(
+            "lmauto_single_flight_total", "Upstream calls made and duplicate requests that joined one in flight.", ("kind",)
+        )
+        self.single_flight_in_flight = registry.gauge(
+            "lmauto_single_flight_in_flight", "Coalesced upstream calls in flight.", ("kind",)
+        )
+        self.admission = registry.gauge(
+            "lmauto_admission", "Prompts in flight and queued in the async serving mode.", ("kind",)
+        )
+        self.admission_decisions = registry.counter(
+            "lmauto_admission_total", "Prompts admitted and shed by the async serving mode.", ("kind",)
+        )
+        self.concurrency_limit = registry.gauge(
+            "lmauto_upstream_concurrency_limit", "Adaptive limit on concurrent upstream calls.", ("model",)
+        )
+        self.circuit_state = registry.gauge(
+            "lmauto_upstream_circuit_state", "1 for the current state of each model's circuit breaker.", ("model", "state")
+        )
+        self.pool_connections = registry.gauge(
+            "lmauto_http_pool_connections", "Connections of the shared upstream HTTP pool.", ("state",)
+        )
+        self.conversation_usage = TokenUsage(max_conversations)
+
+    @contextmanager
+    def phase(self, name: str, route: Optional[str] = None) -> Iterator[None]:
+        """
+        Times a phase of a request on the given route, by default the current Flask request's.
+        """
+        with self.phase_seconds.time(route=route or _route(), phase=name):
+            yield
+
+    @contextmanager
+    def upstream(self, model: str, route: Optional[str] = None) -> Iterator[None]:
+        """
+        Times a call to the agent as the "upstream" phase and counts it as in flight.
+        """
+        self.upstream_in_flight.inc(model=model)
+        try:
+            with self.phase("upstream", route):
+                yield
+        except Exception:
+            self.upstream_errors.inc(model=model)
+            raise
+        finally:
+            self.upstream_in_flight.dec(model=model)
+
+    def record_usage(self, model: str, usage: Optional[Dict], conversation_id: Optional[str] = None,
+                     cached: bool = False):
+        """
+        Adds the token usage of one completion to the per-model and per-conversation totals.
+
+        A response served from the response cache only counts towards its conversation,
+        since the upstream API did not process it again.
+        """
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        if not cached:
+            self.tokens.inc(prompt_tokens, model=model, kind="prompt")
+            self.tokens.inc(completion_tokens, model=model, kind="completion")
+        if conversation_id is not None:
+            self.conversation_usage.add(conversation_id, prompt_tokens, completion_tokens)
+
+    def render(self, response_cache=None, single_flight=None, admission=None, upstream: Optional[Dict] = None) -> str:
+        """
+        Returns every metric in the Prometheus text format, refreshing the sampled metrics first.
+        """
+        if response_cache is not None:
+            stats = response_cache.stats()
+            self.cache_entries.set(stats["memory_entries"], tier="memory")
+            self.cache_entries.set(stats["disk_entries"], tier="disk")
+            for result in ("memory_hits", "disk_hits", "misses"):
+                self.cache_lookups.set(stats[result], result=result)
+        if single_flight is not None:
+            stats = single_flight.stats()
+            for kind in ("calls", "joins", "stream_calls", "stream_joins"):
+                self.single_flight.set(stats[kind], kind=kind)
+            self.single_flight_in_flight.set(stats["in_flight"], kind="calls")
+            self.single_flight_in_flight.set(stats["streams_in_flight"], kind="streams")
+        if admission is not None:
+            stats = admission.stats()
+            for kind in ("in_flight", "queued"):
+                self.admission.set(stats[kind], kind=kind)
+            for kind in ("admitted", "shed"):
+                self.admission_decisions.set(stats[kind], kind=kind)
+        for model, guards in (upstream or {}).items():
+            if guards["concurrency"] is not None:
+                self.concurrency_limit.set(guards["concurrency"]["limit"], model=model)
+            if guards["circuit"] is not None:
+                for state in ("closed", "open", "half_open"):
+                    self.circuit_state.set(int(guards["circuit"]["state"] == state), model=model, state=state)
+        # Only reported once an agent has loaded the HTTP client, so scraping does not import httpx
+        http_client = sys.modules.get("models.http_client")
+        if http_client is not None:
+            stats = http_client.pool_stats()
+            self.pool_connections.set(stats.get("connections_in_use", 0), state="in_use")
+            self.pool_connections.set(stats.get("connections_idle", 0), state="idle")
+        return self.registry.render()
+
+    def install(self, app: Flask):
+        """
+        Registers the request hooks recording durations, statuses and in-flight counts.
+        """
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+            g.metrics_route = _route()
+            self.in_flight.inc(route=g.metrics_route)
+            header = request.headers.get("X-Request-Start")
+            queued_at = _queue_start(header) if header else None
+            if queued_at is not None:
+                self.queue_seconds.observe(max(0.0, time.time() - queued_at))
+
+        @app.after_request
+        def record_status(response: Response) -> Response:
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def stop_timer(error=None):
+            # Runs after a streamed response has been fully sent
+            started = g.pop("metrics_started", None)
+            if started is None:
+                return
+            route, method = g.pop("metrics_route"), request.method
+            self.in_flight.dec(route=route)
+            self.request_seconds.observe(time.perf_counter() - started, route=route, method=method)
+            status = g.pop("metrics_status", 500 if error is not None else 200)
+            self.requests.inc(route=route, method=method, status=status)
@@ -1,87 +1,509 @@
+import json
 import logging
 import os
 import sys
-import uuid
-from typing import Dict, List
+import threading
+import time
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, stream_with_context
 from pydantic import ValidationError
 
 # Adjust the Python module search path to correctly point to the project root directory
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.models.llm_agent import LLMAgent, PromptRequest
+from backend.instrumentation import AppMetrics
+from models.context_window import SUMMARY, ContextManager, LLMSummarizer
+from models.schemas import PromptRequest
+from utilities.admission import Overloaded
+from utilities.circuit_breaker import CircuitBreaker
+from utilities.concurrency_limiter import AdaptiveConcurrencyLimiter
+from utilities.conversation_store import ConversationStore, InMemoryConversationStore, SQLiteConversationStore
+from utilities.rate_limiter import RateLimiter
+from utilities.response_cache import ResponseCache
+from utilities.single_flight import SingleFlight
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)  # Changed to DEBUG for detailed logging
 
-# Load environment variables
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set in the environment variables.")  # Ensure your OPENAI_API_KEY is set in the .env file.
+def default_config() -> Dict:
+    """
+    Returns the app settings taken from the environment.
+    """
+    return {
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
+        "MODEL": os.getenv("OPENAI_MODEL", "gpt-4"),
+        # Optional model pool as JSON, e.g. [{"model": "gpt-4o-mini", "max_prompt_tokens": 2000}, {"model": "gpt-4"}];
+        # requests are then routed per prompt and slow calls hedged after the HEDGE_PERCENTILE latency
+        "MODEL_ROUTES": json.loads(os.getenv("MODEL_ROUTES", "null")),
+        "HEDGE_PERCENTILE": float(os.getenv("HEDGE_PERCENTILE", "95")) or None,
+        # Alternative API endpoint, e.g. benchmarks/mock_openai.py for load tests
+        "OPENAI_BASE_URL": os.getenv("OPENAI_BASE_URL"),
+        # Optional response cache, enabled by pointing RESPONSE_CACHE_DIR at a writable directory
+        "RESPONSE_CACHE_DIR": os.getenv("RESPONSE_CACHE_DIR"),
+        # Provider quota shared by every call from this process; unset means unlimited
+        "OPENAI_RPM": float(os.getenv("OPENAI_RPM", "0")) or None,
+        "OPENAI_TPM": float(os.getenv("OPENAI_TPM", "0")) or None,
+        "BATCH_MAX_CONCURRENCY": int(os.getenv("BATCH_MAX_CONCURRENCY", "8")),
+        # Share one upstream call between identical prompts in flight at the same time
+        "COALESCE_PROMPTS": os.getenv("COALESCE_PROMPTS", "").lower() in ("1", "true", "yes"),
+        # Conversation history; set CONVERSATION_DB to share it between worker processes on the host
+        "CONVERSATION_DB": os.getenv("CONVERSATION_DB"),
+        # Prompt assembly within the model context window: "sliding", "last_turns" or "summary"
+        "CONTEXT_STRATEGY": os.getenv("CONTEXT_STRATEGY", "sliding"),
+        "CONTEXT_MAX_TURNS": int(os.getenv("CONTEXT_MAX_TURNS", "20")),
+        # Largest page of /history; full histories longer than this are streamed
+        "HISTORY_PAGE_SIZE": int(os.getenv("HISTORY_PAGE_SIZE", "500")),
+        # Guards of every model's upstream calls: the highest adaptive concurrency limit (0 disables it),
+        # and the failures in a row that open its circuit breaker (0 disables it) for CIRCUIT_RESET_SECONDS
+        "UPSTREAM_MAX_CONCURRENCY": int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "200")),
+        "CIRCUIT_FAILURE_THRESHOLD": int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+        "CIRCUIT_RESET_SECONDS": float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+        # Backpressure of the async serving mode (backend/asgi.py): prompts in flight at once, prompts
+        # waiting for a slot, and seconds one may wait; prompts beyond that are answered with 503
+        "ASYNC_MAX_IN_FLIGHT": int(os.getenv("ASYNC_MAX_IN_FLIGHT", "1000")),
+        "ASYNC_MAX_QUEUE": int(os.getenv("ASYNC_MAX_QUEUE", "1000")),
+        "ASYNC_QUEUE_TIMEOUT": float(os.getenv("ASYNC_QUEUE_TIMEOUT", "30")) or None,
+        # Threads running the routes the async mode passes to Flask, kept apart from the prompt routes' threads
+        "ASYNC_WSGI_THREADS": int(os.getenv("ASYNC_WSGI_THREADS", "16")),
+        # Callables taking the Services and returning the agent, or the async agent, mainly for tests
+        "AGENT_FACTORY": None,
+        "ASYNC_AGENT_FACTORY": None,
+    }
 
-# Initialize Flask app
-app = Flask(__name__)
 
-# Initialize the LLM agent
-agent = LLMAgent(api_key=OPENAI_API_KEY, model="gpt-4")
+class Services:
+    """
+    The components behind the routes of one app.
 
-# In-memory storage for conversation history (replace with a database for production)
-conversations: Dict[str, List[Dict]] = {}
+    The agent, and the context manager that may depend on it, are only built when a request
+    first needs them, so creating the app needs neither the OpenAI library nor an API key.
+    """
 
-@app.route('/')
+    def __init__(self, config: Dict):
+        self.config = config
+        self.lock = threading.Lock()
+        cache_dir = config["RESPONSE_CACHE_DIR"]
+        self.response_cache = ResponseCache(directory=cache_dir) if cache_dir else None
+        self.rate_limiter = RateLimiter(requests_per_minute=config["OPENAI_RPM"], tokens_per_minute=config["OPENAI_TPM"])
+        self.single_flight = SingleFlight() if config["COALESCE_PROMPTS"] else None
+        conversation_db = config["CONVERSATION_DB"]
+        self.conversations: ConversationStore = (
+            SQLiteConversationStore(conversation_db) if conversation_db else InMemoryConversationStore()
+        )
+        self.metrics = AppMetrics()
+        # The AdmissionQueue of the async serving mode, which sets it
+        self.admission = None
+        self._agent = None
+        self._async_agent = None
+        # model -> (concurrency limiter, circuit breaker), shared by the blocking and the async agent
+        self._guards: Dict[str, tuple] = {}
+        self._guards_lock = threading.Lock()
+        self._context: Optional[ContextManager] = None
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            with self.lock:
+                if self._agent is None:
+                    factory = self.config["AGENT_FACTORY"] or Services._create_agent
+                    self._agent = factory(self)
+        return self._agent
+
+    def guards(self, model: str) -> tuple:
+        """
+        Returns the concurrency limiter and circuit breaker of a model's upstream calls, either of which may be None.
+        """
+        # A lock of its own, since agents are created while holding self.lock
+        with self._guards_lock:
+            if model not in self._guards:
+                max_limit, threshold = self.config["UPSTREAM_MAX_CONCURRENCY"], self.config["CIRCUIT_FAILURE_THRESHOLD"]
+                limiter = AdaptiveConcurrencyLimiter(initial_limit=max(1, max_limit // 4), max_limit=max_limit) if max_limit else None
+                breaker = CircuitBreaker(
+                    model, consecutive_failures=threshold, reset_timeout=self.config["CIRCUIT_RESET_SECONDS"]
+                ) if threshold else None
+                self._guards[model] = (limiter, breaker)
+            return self._guards[model]
+
+    def _create_agent(self):
+        # Imported here because the OpenAI client dominates the import time of the app
+        from models.llm_agent import LLMAgent
+
+        api_key = self.config["OPENAI_API_KEY"]
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY is not set in the environment variables.")  # Ensure your OPENAI_API_KEY is set in the .env file.
+
+        def create(model: str) -> LLMAgent:
+            limiter, breaker = self.guards(model)
+            return LLMAgent(
+                api_key=api_key, model=model, cache=self.response_cache, rate_limiter=self.rate_limiter,
+                base_url=self.config["OPENAI_BASE_URL"], single_flight=self.single_flight,
+                concurrency_limiter=limiter, circuit_breaker=breaker,
+            )
+
+        if self.config["MODEL_ROUTES"]:
+            from models.router import ModelRoute, ModelRouter
+
+            routes = [ModelRoute(**route) for route in self.config["MODEL_ROUTES"]]
+            # Enough hedge threads for every model's upstream concurrency limit
+            max_workers = self.config["UPSTREAM_MAX_CONCURRENCY"] * len(routes) or 32
+            return ModelRouter(routes, create, hedge_percentile=self.config["HEDGE_PERCENTILE"], max_workers=max_workers)
+        return create(self.config["MODEL"])
+
+    @property
+    def async_agent(self):
+        if self._async_agent is None:
+            with self.lock:
+                if self._async_agent is None:
+                    factory = self.config["ASYNC_AGENT_FACTORY"] or Services._create_async_agent
+                    self._async_agent = factory(self)
+        return self._async_agent
+
+    def _create_async_agent(self):
+        from models.async_llm_agent import AsyncLLMAgent
+
+        api_key = self.config["OPENAI_API_KEY"]
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
+        # Routing and hedging are not applied in the async mode (AsyncApp warns about it); the first route is the model used
+        routes = self.config["MODEL_ROUTES"]
+        model = routes[0]["model"] if routes else self.config["MODEL"]
+        limiter, breaker = self.guards(model)
+        return AsyncLLMAgent(
+            api_key=api_key, model=model, cache=self.response_cache, rate_limiter=self.rate_limiter,
+            base_url=self.config["OPENAI_BASE_URL"], concurrency_limiter=limiter, circuit_breaker=breaker,
+        )
+
+    @property
+    def context(self) -> ContextManager:
+        if self._context is None:
+            strategy = self.config["CONTEXT_STRATEGY"]
+            summarizer = LLMSummarizer(self.agent) if strategy == SUMMARY else None
+            with self.lock:
+                if self._context is None:
+                    self._context = ContextManager(
+                        self.conversations, strategy=strategy, max_turns=self.config["CONTEXT_MAX_TURNS"], summarizer=summarizer
+                    )
+        return self._context
+
+
+routes = Blueprint("lmauto", __name__)
+
+
+def _services() -> Services:
+    return current_app.extensions["lmauto"]
+
+
+@routes.route('/')
 def hello_world():
-    app.logger.info("Hello world endpoint called.")
+    current_app.logger.info("Hello world endpoint called.")
     return 'Hello, LMAuto!'
 
-@app.route('/start-conversation', methods=['POST'])
+@routes.route('/start-conversation', methods=['POST'])
 def start_conversation():
-    conversation_id = str(uuid.uuid4())
-    conversations[conversation_id] = []
-    app.logger.info(f"Started new conversation with ID: {conversation_id}")
+    conversation_id = _services().conversations.create()
+    current_app.logger.info(f"Started new conversation with ID: {conversation_id}")
     return jsonify({"conversation_id": conversation_id}), 201
 
-@app.route('/prompt/<conversation_id>', methods=['POST'])
+@routes.route('/prompt/<conversation_id>', methods=['POST'])
 def send_prompt(conversation_id: str):
-    if conversation_id not in conversations:
-        app.logger.error(f"Invalid conversation ID: {conversation_id}")
+    services = _services()
+    conversations = services.conversations
+    if not conversations.exists(conversation_id):
+        current_app.logger.error(f"Invalid conversation ID: {conversation_id}")
         return jsonify({"error": "Invalid conversation ID"}), 404
 
+    metrics = services.metrics
     try:
-        prompt_data = request.get_json()
-        prompt_request = PromptRequest(**prompt_data)
+        with metrics.phase("validate"):
+            prompt_data = request.get_json()
+            prompt_request = PromptRequest(**prompt_data)
+
+        agent = services.agent
+        with metrics.phase("context"):
+            # Add prompt to conversation history
+            conversations.append(conversation_id, {"role": "user", "content": prompt_request.prompt})
+            history = services.context.build(conversation_id, agent.model, prompt_request.max_tokens)
+
+        # With a model router the prompt may be served by another model than the one it was assembled for
+        model = agent.model_for(prompt_request, history)
+        with metrics.upstream(model):
+            response = agent.send_prompt(prompt_request, history)
+        metrics.record_usage(response.model or model, response.usage, conversation_id, cached=response.cached)
+
+        with metrics.phase("store"):
+            # Add response to conversation history
+            conversations.append(conversation_id, {"role": "assistant", "content": response.response})
 
-        # Add prompt to conversation history
-        conversations[conversation_id].append({"role": "user", "content": prompt_request.prompt})
+        current_app.logger.info(f"Prompt sent successfully in conversation {conversation_id}")
+        with metrics.phase("serialize"):
+            return jsonify(response.dict()), 200
+
+    except ValidationError as e:
+        current_app.logger.error(f"Validation error on prompt data: {e.errors()}", exc_info=True)
+        return jsonify({"error": e.errors()}), 400
+    except Overloaded as e:
+        current_app.logger.warning(f"Shedding a prompt in conversation {conversation_id}: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(max(1, round(e.retry_after)))}
+    except Exception as e:
+        current_app.logger.error(f"Failed to send prompt in conversation {conversation_id}: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@routes.route('/prompt/batch', methods=['POST'])
+def send_prompt_batch():
+    services = _services()
+    batch_data = request.get_json(silent=True)
+    prompts = batch_data.get("prompts") if isinstance(batch_data, dict) else None
+    if not isinstance(prompts, list):
+        current_app.logger.error("Batch request without a list of prompts")
+        return jsonify({"error": "Expected a JSON object with a list of prompts"}), 400
+    limit = services.config["BATCH_MAX_CONCURRENCY"]
+    try:
+        max_concurrency = min(int(batch_data.get("max_concurrency", limit)), limit)
+    except (TypeError, ValueError):
+        current_app.logger.error("Batch request with an invalid max_concurrency")
+        return jsonify({"error": "max_concurrency must be an integer"}), 400
+
+    # Invalid items are reported in place so the rest of the batch still runs
+    metrics = services.metrics
+    results: List[Dict] = [None] * len(prompts)
+    valid_indices, valid_requests = [], []
+    with metrics.phase("validate"):
+        for index, prompt_data in enumerate(prompts):
+            try:
+                valid_requests.append(PromptRequest(**prompt_data))
+                valid_indices.append(index)
+            except (ValidationError, TypeError) as e:
+                errors = e.errors() if isinstance(e, ValidationError) else str(e)
+                results[index] = {"index": index, "response": None, "error": errors}
+
+    try:
+        agent = services.agent
+        with metrics.upstream(agent.model):
+            items = agent.send_batch(valid_requests, max_concurrency=max_concurrency)
+    except Exception as e:
+        current_app.logger.error(f"Failed to process prompt batch: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    for index, item in zip(valid_indices, items):
+        results[index] = dict(item.dict(), index=index)
+        if item.response is not None:
+            metrics.record_usage(item.response.model or agent.model, item.response.usage, cached=item.response.cached)
 
-        response = agent.send_prompt(prompt_request, conversations[conversation_id])
+    current_app.logger.info(f"Batch of {len(prompts)} prompts processed")
+    with metrics.phase("serialize"):
+        return jsonify({"results": results}), 200
 
-        # Add response to conversation history
-        conversations[conversation_id].append({"role": "assistant", "content": response.response})
+def _sse(data: Dict, event: str = None) -> str:
+    """
+    Formats a payload as a Server-Sent Events message.
+    """
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
 
-        app.logger.info(f"Prompt sent successfully in conversation {conversation_id}")
-        return jsonify(response.dict()), 200
+@routes.route('/prompt/<conversation_id>/stream', methods=['POST'])
+def send_prompt_stream(conversation_id: str):
+    services = _services()
+    conversations = services.conversations
+    if not conversations.exists(conversation_id):
+        current_app.logger.error(f"Invalid conversation ID: {conversation_id}")
+        return jsonify({"error": "Invalid conversation ID"}), 404
 
+    metrics = services.metrics
+    try:
+        with metrics.phase("validate"):
+            prompt_data = request.get_json()
+            prompt_request = PromptRequest(**prompt_data)
     except ValidationError as e:
-        app.logger.error(f"Validation error on prompt data: {e.errors()}", exc_info=True)
+        current_app.logger.error(f"Validation error on prompt data: {e.errors()}", exc_info=True)
         return jsonify({"error": e.errors()}), 400
+
+    try:
+        agent = services.agent
+        with metrics.phase("context"):
+            # Add prompt to conversation history
+            conversations.append(conversation_id, {"role": "user", "content": prompt_request.prompt})
+            history = services.context.build(conversation_id, agent.model, prompt_request.max_tokens)
+        model = agent.model_for(prompt_request, history)
     except Exception as e:
-        app.logger.error(f"Failed to send prompt in conversation {conversation_id}: {e}", exc_info=True)
+        current_app.logger.error(f"Failed to send prompt in conversation {conversation_id}: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
+    logger = current_app.logger
+    route = request.url_rule.rule
+
+    def generate():
+        parts: List[str] = []
+        started = time.perf_counter()
+        meta: Dict = {}
+        try:
+            with metrics.upstream(model):
+                for delta in agent.send_prompt_stream(prompt_request, history, meta=meta):
+                    if not parts:
+                        metrics.phase_seconds.observe(time.perf_counter() - started, route=route, phase="first_token")
+                    parts.append(delta)
+                    yield _sse({"delta": delta})
+            metrics.record_usage(meta.get("model", model), meta.get("usage"), conversation_id, cached=meta.get("cached", False))
+            yield _sse({"response": "".join(parts)}, event="done")
+            logger.info(f"Prompt streamed successfully in conversation {conversation_id}")
+        except Exception as e:
+            logger.error(f"Failed to stream prompt in conversation {conversation_id}: {e}", exc_info=True)
+            yield _sse({"error": str(e)}, event="error")
+        finally:
+            # Runs on completion, upstream failure and client disconnect alike, so the
+            # history keeps whatever part of the answer was produced.
+            if parts:
+                conversations.append(conversation_id, {"role": "assistant", "content": "".join(parts)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+def _stream_history(conversations: ConversationStore, conversation_id: str, total: int, page_size: int):
+    """
+    Yields the first total messages of a conversation as a JSON array, one page at a time.
+    """
+    yield "["
+    for start in range(0, total, page_size):
+        try:
+            page = conversations.get_messages(conversation_id, start=start, limit=min(page_size, total - start))
+        except KeyError:
+            # Deleted or expired mid-export; end the array so the body stays valid JSON
+            break
+        yield ("," if start else "") + ",".join(json.dumps(message) for message in page)
+    yield "]"
 
-@app.route('/history/<conversation_id>', methods=['GET'])
+@routes.route('/history/<conversation_id>', methods=['GET'])
 def get_conversation_history(conversation_id: str):
-    if conversation_id not in conversations:
-        app.logger.error(f"Invalid conversation ID: {conversation_id}")
+    services = _services()
+    conversations = services.conversations
+    try:
+        total = conversations.count(conversation_id)
+    except KeyError:
+        current_app.logger.error(f"Invalid conversation ID: {conversation_id}")
+        return jsonify({"error": "Invalid conversation ID"}), 404
+
+    args = request.args
+    try:
+        start = int(args.get("cursor", args.get("since", 0)))
+        limit = int(args["limit"]) if "limit" in args else None
+    except ValueError:
+        return jsonify({"error": "cursor, since and limit must be integers"}), 400
+    if start < 0 or (limit is not None and limit <= 0):
+        return jsonify({"error": "cursor and since must be >= 0 and limit > 0"}), 400
+    paged = bool({"cursor", "since", "limit"} & set(args))
+    page_size = services.config["HISTORY_PAGE_SIZE"]
+    limit = min(limit or page_size, page_size)
+
+    # Histories are append-only, so the message count and the page identify a version of the response
+    etag = f"h{total}-{start}-{limit}" if paged else f"h{total}"
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    current_app.logger.info(f"Retrieving conversation history for ID: {conversation_id}")
+
+    if not paged:
+        # The full history, as a bare list; long ones are streamed rather than built in memory
+        if total > page_size:
+            body = _stream_history(conversations, conversation_id, total, page_size)
+            return Response(body, mimetype="application/json", headers=headers)
+        return jsonify(conversations.get_messages(conversation_id, limit=total)), 200, headers
+
+    messages = conversations.get_messages(conversation_id, start=start, limit=min(limit, max(0, total - start)))
+    end = start + len(messages)
+    return jsonify({
+        "messages": messages,
+        "start": start,
+        "count": total,
+        "next_cursor": end if end < total else None,
+    }), 200, headers
+
+@routes.route('/usage/<conversation_id>', methods=['GET'])
+def get_conversation_usage(conversation_id: str):
+    services = _services()
+    if not services.conversations.exists(conversation_id):
+        current_app.logger.error(f"Invalid conversation ID: {conversation_id}")
         return jsonify({"error": "Invalid conversation ID"}), 404
-    app.logger.info(f"Retrieving conversation history for ID: {conversation_id}")
-    return jsonify(conversations[conversation_id]), 200
+    usage = services.metrics.conversation_usage.get(conversation_id)
+    return jsonify(usage or {"prompt_tokens": 0, "completion_tokens": 0, "requests": 0}), 200
+
+@routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    services = _services()
+    # The agent is not created just to be scraped
+    upstream = services._agent.upstream_stats() if hasattr(services._agent, "upstream_stats") else None
+    body = services.metrics.render(services.response_cache, services.single_flight, services.admission, upstream)
+    return Response(body, content_type=services.metrics.registry.CONTENT_TYPE)
+
+@routes.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    response_cache = _services().response_cache
+    if response_cache is None:
+        return jsonify({"error": "Response cache is disabled"}), 404
+    return jsonify(response_cache.stats()), 200
+
+@routes.route('/single-flight/stats', methods=['GET'])
+def get_single_flight_stats():
+    single_flight = _services().single_flight
+    if single_flight is None:
+        return jsonify({"error": "Prompt coalescing is disabled"}), 404
+    return jsonify(single_flight.stats()), 200
+
+@routes.route('/admission/stats', methods=['GET'])
+def get_admission_stats():
+    admission = _services().admission
+    if admission is None:
+        return jsonify({"error": "Admission control only applies to the async serving mode"}), 404
+    return jsonify(admission.stats()), 200
+
+@routes.route('/router/stats', methods=['GET'])
+def get_router_stats():
+    services = _services()
+    if not services.config["MODEL_ROUTES"]:
+        return jsonify({"error": "Model routing is disabled"}), 404
+    return jsonify(services.agent.stats_snapshot()), 200
+
+@routes.route('/upstream/stats', methods=['GET'])
+def get_upstream_stats():
+    agent = _services().agent
+    if not hasattr(agent, "upstream_stats"):
+        return jsonify({"error": "The agent has no upstream guards"}), 404
+    return jsonify(agent.upstream_stats()), 200
+
+@routes.route('/http-pool/stats', methods=['GET'])
+def get_http_pool_stats():
+    # Imported here so that creating the app does not load httpx
+    from models.http_client import pool_stats
+
+    return jsonify(pool_stats()), 200
+
+
+def create_app(config: Optional[Dict] = None) -> Flask:
+    """
+    Creates the web app.
+
+    Args:
+        config (Dict, optional): Settings overriding the ones taken from the environment and .env file.
+
+    Returns:
+        Flask: The app, e.g. for gunicorn "backend.main:create_app()".
+    """
+    # Configure logging
+    logging.basicConfig(level=logging.DEBUG)  # Changed to DEBUG for detailed logging
+
+    # Load environment variables
+    load_dotenv()
+    settings = default_config()
+    settings.update(config or {})
+
+    app = Flask(__name__)
+    app.config.update(settings)
+    services = app.extensions["lmauto"] = Services(app.config)
+    services.metrics.install(app)
+    app.register_blueprint(routes)
+    return app
+
 
 if __name__ == '__main__':
+    app = create_app()
     try:
         app.run(port=8000)
         app.logger.info("Flask server started successfully on port 8000")
     except Exception as e:
-        app.logger.error(f"Failed to start the Flask application: {e}", exc_info=True)
\ No newline at end of file
+        app.logger.error(f"Failed to start the Flask application: {e}", exc_info=True)
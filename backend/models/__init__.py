@@ -1,8 +1,6 @@
 import logging
 import os
 import sys
-import uuid
-from typing import Dict, List
 
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
@@ -11,6 +9,8 @@ from pydantic import ValidationError
 # Adjust the Python module search path to correctly point to the project root directory
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+from utilities.conversation_store import ConversationStore, InMemoryConversationStore, SQLiteConversationStore
+
 from .llm_agent import LLMAgent, PromptRequest
 
 # Configure logging
@@ -29,8 +29,9 @@ app = Flask(__name__)
 # Initialize the LLM agent
 agent = LLMAgent(api_key=OPENAI_API_KEY, model="gpt-4")
 
-# In-memory storage for conversation history (replace with a database for production)
-conversations: Dict[str, List[Dict]] = {}
+# Conversation history; set CONVERSATION_DB to share it between worker processes on the host
+CONVERSATION_DB = os.getenv("CONVERSATION_DB")
+conversations: ConversationStore = SQLiteConversationStore(CONVERSATION_DB) if CONVERSATION_DB else InMemoryConversationStore()
 
 @app.route('/')
 def hello_world():
@@ -39,14 +40,13 @@ def hello_world():
 
 @app.route('/start-conversation', methods=['POST'])
 def start_conversation():
-    conversation_id = str(uuid.uuid4())
-    conversations[conversation_id] = []
+    conversation_id = conversations.create()
     app.logger.info(f"Started new conversation with ID: {conversation_id}")
     return jsonify({"conversation_id": conversation_id}), 201
 
 @app.route('/prompt/<conversation_id>', methods=['POST'])
 def send_prompt(conversation_id: str):
-    if conversation_id not in conversations:
+    if not conversations.exists(conversation_id):
         app.logger.error(f"Invalid conversation ID: {conversation_id}")
         return jsonify({"error": "Invalid conversation ID"}), 404
 
@@ -55,12 +55,12 @@ def send_prompt(conversation_id: str):
         prompt_request = PromptRequest(**prompt_data)
 
         # Add prompt to conversation history
-        conversations[conversation_id].append({"role": "user", "content": prompt_request.prompt})
+        conversations.append(conversation_id, {"role": "user", "content": prompt_request.prompt})
 
-        response = agent.send_prompt(prompt_request, conversations[conversation_id])
+        response = agent.send_prompt(prompt_request, conversations.get_messages(conversation_id))
 
         # Add response to conversation history
-        conversations[conversation_id].append({"role": "assistant", "content": response.response})
+        conversations.append(conversation_id, {"role": "assistant", "content": response.response})
 
         app.logger.info(f"Prompt sent successfully in conversation {conversation_id}")
         return jsonify(response.dict()), 200
@@ -74,10 +74,10 @@ def send_prompt(conversation_id: str):
 
 @app.route('/history/<conversation_id>', methods=['GET'])
 def get_conversation_history(conversation_id: str):
-    if conversation_id not in conversations:
+    if not conversations.exists(conversation_id):
         app.logger.error(f"Invalid conversation ID: {conversation_id}")
         return jsonify({"error": "Invalid conversation ID"}), 404
-    return jsonify(conversations[conversation_id]), 200
+    return jsonify(conversations.get_messages(conversation_id)), 200
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,216 @@
+"""
+Load benchmark for the prompt API.
+
+Serves the app against the local mock OpenAI server (benchmarks/mock_openai.py), or drives an
+already running deployment with --target, at a series of concurrency levels. Each simulated
+user starts a conversation, then alternates prompts and history reads. The report gives the
+throughput and p50/p95/p99 latency of every route per level, and the results are written as
+JSON so that a later run can be compared against them:
+
+    python benchmarks/load.py --concurrency 1,8,32 --output baseline.json
+    python benchmarks/load.py --concurrency 1,8,32 --output after.json --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from mock_openai import MockOpenAIServer
+
+ROUTES = ("start-conversation", "prompt", "history")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Returns the nearest-rank percentile of the values, or 0 when there are none.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples: List[Tuple[float, bool]], elapsed: float) -> Dict:
+    """
+    Summarizes the (latency, ok) samples of one route.
+    """
+    latencies = [latency for latency, _ in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, ok in samples if not ok),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "p99_ms": 1000 * percentile(latencies, 99),
+    }
+
+
+def _user(client: httpx.Client, turns: int, prompt: str, max_tokens: int, samples: Dict[str, List]):
+    def timed(route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = client.request(method, url, **kwargs)
+            ok = response.is_success
+        except httpx.HTTPError:
+            response, ok = None, False
+        samples[route].append((time.perf_counter() - started, ok))
+        return response if ok else None
+
+    response = timed("start-conversation", "POST", "/start-conversation")
+    if response is None:
+        return
+    conversation_id = response.json()["conversation_id"]
+    for _ in range(turns):
+        timed("prompt", "POST", f"/prompt/{conversation_id}", json={"prompt": prompt, "max_tokens": max_tokens})
+        timed("history", "GET", f"/history/{conversation_id}")
+
+
+def run_level(target: str, concurrency: int, users: int, turns: int, prompt: str, max_tokens: int) -> Dict:
+    """
+    Runs `users` simulated users, `concurrency` at a time, and summarizes every route.
+
+    Args:
+        target (str): Base URL of the app.
+        concurrency (int): Number of users active at once.
+        users (int): Total number of users, each with their own conversation.
+        turns (int): Prompts (each followed by a history read) per user.
+        prompt (str): Prompt text.
+        max_tokens (int): max_tokens of every prompt.
+
+    Returns:
+        Dict: Per-route summaries plus the wall-clock duration of the level.
+    """
+    samples: Dict[str, List] = {route: [] for route in ROUTES}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(base_url=target, limits=limits, timeout=120) as client:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(_user, client, turns, prompt, max_tokens, samples) for _ in range(users)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "duration_s": elapsed,
+        "routes": {route: summarize(route_samples, elapsed) for route, route_samples in samples.items()},
+    }
+
+
+@contextmanager
+def local_app(mock: MockOpenAIServer, port: int = 0) -> Iterator[str]:
+    """
+    Serves the app, pointed at the mock server, from a background thread and yields its URL.
+    """
+    from werkzeug.serving import make_server
+
+    from backend.main import create_app
+
+    app = create_app({"OPENAI_API_KEY": "mock", "OPENAI_BASE_URL": mock.base_url})
+    # Request logging would dominate the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+    app.logger.setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """
+    Returns report lines with the relative change of every metric against a baseline run.
+    """
+    lines = []
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        for route, summary in level["routes"].items():
+            old = before["routes"].get(route)
+            if not old:
+                continue
+            changes = []
+            for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                delta = (summary[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+                changes.append(f"{metric} {old[metric]:.1f} -> {summary[metric]:.1f} ({delta:+.1f}%)")
+            lines.append(f"c={level['concurrency']:<4} {route:<20} " + ", ".join(changes))
+    return lines
+
+
+def format_level(level: Dict) -> List[str]:
+    lines = [f"concurrency {level['concurrency']} ({level['duration_s']:.2f}s)"]
+    for route, summary in level["routes"].items():
+        lines.append(
+            f"  {route:<20} {summary['requests']:>6} req {summary['errors']:>4} err "
+            f"{summary['throughput_rps']:>8.1f} rps  p50 {summary['p50_ms']:7.1f} ms  "
+            f"p95 {summary['p95_ms']:7.1f} ms  p99 {summary['p99_ms']:7.1f} ms"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the prompt API.")
+    parser.add_argument("--target", help="URL of a running app; by default one is served against the mock API")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--users", type=int, default=0, help="Users per level; defaults to 4 x concurrency")
+    parser.add_argument("--turns", type=int, default=5, help="Prompts per user")
+    parser.add_argument("--prompt", default="Summarize the benefits of connection pooling in one sentence.")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--latency", default="lognormal:0.05,0.5", help="Latency distribution of the mock API")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    mock_settings = {"latency": args.latency, "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate}
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": dict(vars(args), mock=None if args.target else mock_settings),
+        "levels": [],
+    }
+
+    def run_all(target: str):
+        for concurrency in levels:
+            level = run_level(
+                target, concurrency, args.users or 4 * concurrency, args.turns, args.prompt, args.max_tokens
+            )
+            results["levels"].append(level)
+            print("\n".join(format_level(level)))
+
+    if args.target:
+        run_all(args.target)
+    else:
+        with MockOpenAIServer(**mock_settings) as mock, local_app(mock) as target:
+            run_all(target)
+            results["mock_counters"] = dict(mock.counters)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            print("\n".join(["", f"compared with {args.compare}"] + compare(results, json.load(file))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for load tests and end-to-end tests.
+
+Replies echo the last message, one word per token, after a latency drawn from a configurable
+distribution. Streaming, server errors and 429 rate limits can be injected:
+
+    python benchmarks/mock_openai.py --port 8089 --latency lognormal:0.8,0.5 --rate-limit-rate 0.02
+
+Point an agent at it with OPENAI_BASE_URL=http://127.0.0.1:8089/v1.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Returns a sampler of latencies in seconds from a spec such as "fixed:0.05",
+    "uniform:0.02,0.2" or "lognormal:<median>,<sigma>".
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class _Server(ThreadingHTTPServer):
+    # A deep accept backlog, so bursts of thousands of connections are not dropped and retried
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockOpenAIServer:
+    """
+    Serves /v1/chat/completions from a background thread.
+
+    Args:
+        port (int, optional): Port to listen on; 0 picks a free one.
+        latency (str, optional): Latency distribution before the first byte of a reply.
+        tokens_per_second (float, optional): Pace of streamed tokens; 0 sends them at once.
+        completion_tokens (int, optional): Tokens per reply, capped by the request's max_tokens.
+        error_rate (float, optional): Share of requests answered with a 500.
+        rate_limit_rate (float, optional): Share of requests answered with a 429.
+        retry_after (float, optional): Seconds advertised in the Retry-After headers of a 429.
+    """
+
+    def __init__(self, port: int = 0, latency: str = "fixed:0", tokens_per_second: float = 0,
+                 completion_tokens: int = 20, error_rate: float = 0, rate_limit_rate: float = 0,
+                 retry_after: float = 0.01):
+        self.sample_latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {"requests": 0, "streams": 0, "disconnects": 0, "errors": 0, "rate_limited": 0}
+        self.httpd = _Server(("127.0.0.1", port), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                server._count("requests")
+
+                draw = random.random()
+                if draw < server.rate_limit_rate:
+                    server._count("rate_limited")
+                    headers = {"Retry-After": str(math.ceil(server.retry_after)), "retry-after-ms": str(int(server.retry_after * 1000))}
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+                    return
+                if draw < server.rate_limit_rate + server.error_rate:
+                    server._count("errors")
+                    self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                    return
+
+                time.sleep(server.sample_latency())
+                messages = body.get("messages") or [{"content": ""}]
+                words = (messages[-1].get("content") or "ok").split() or ["ok"]
+                count = min(body.get("max_tokens") or server.completion_tokens, server.completion_tokens)
+                tokens = [words[i % len(words)] for i in range(count)]
+                prompt_tokens = sum(len((message.get("content") or "").split()) for message in messages)
+                response_id = f"chatcmpl-mock-{random.getrandbits(48):x}"
+                model = body.get("model", "gpt-4")
+
+                if body.get("stream"):
+                    server._count("streams")
+                    try:
+                        usage = None
+                        if (body.get("stream_options") or {}).get("include_usage"):
+                            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                                     "total_tokens": prompt_tokens + len(tokens)}
+                        self._stream(response_id, model, tokens, usage)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client closed the stream early, e.g. a cancelled hedge
+                        server._count("disconnects")
+                    return
+                self._send_json(200, {
+                    "id": response_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(tokens)}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)},
+                })
+
+            def _stream(self, response_id: str, model: str, tokens, usage: Optional[Dict] = None):
+                # Without a length the connection is closed after the stream, like an SSE response
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                created = int(time.time())
+
+                def chunk(delta: Dict, finish_reason=None) -> bytes:
+                    payload = {"id": response_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                               "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+                self.wfile.write(chunk({"role": "assistant", "content": ""}))
+                for i, token in enumerate(tokens):
+                    if server.tokens_per_second:
+                        time.sleep(1 / server.tokens_per_second)
+                    self.wfile.write(chunk({"content": token if i == 0 else f" {token}"}))
+                    self.wfile.flush()
+                self.wfile.write(chunk({}, finish_reason="stop"))
+                if usage is not None:
+                    payload = {"id": response_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                               "choices": [], "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="fixed:0.05", help='e.g. "fixed:0.05", "uniform:0.02,0.2", "lognormal:0.8,0.5"')
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--completion-tokens", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        port=args.port, latency=args.latency, tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+    )
+    print(f"Mock OpenAI API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
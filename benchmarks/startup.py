@@ -0,0 +1,105 @@
+"""
+Measures the cold-start cost of the CLI and of creating the web app.
+
+Each scenario runs in a fresh interpreter under ``python -X importtime``. The report gives
+the wall-clock time, the total import time and the slowest top-level imports, and the run
+fails if a scenario exceeds its budget or imports a module it must not load:
+
+    python benchmarks/startup.py --repeat 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "cli-help": {
+        "args": ["-m", "backend.cli", "--help"],
+        "budget_ms": 500,
+        "forbidden": ["openai", "flask", "httpx", "backend.agent_system"],
+    },
+    "create-app": {
+        "args": ["-c", "from backend.main import create_app; create_app()"],
+        "budget_ms": 1000,
+        "forbidden": ["openai", "httpx"],
+    },
+}
+
+
+def measure(args: List[str]) -> Dict:
+    """
+    Runs a Python command under -X importtime and returns its timings and imported modules.
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+
+    modules, top_level = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append(name.strip())
+        # Nested imports are indented past the single separating space; top-level cumulative times add up to the total
+        if not name[1:].startswith(" "):
+            top_level.append((int(cumulative), name.strip()))
+    return {
+        "wall_seconds": wall,
+        "import_seconds": sum(us for us, _ in top_level) / 1e6,
+        "slowest_imports": [{"module": name, "seconds": us / 1e6} for us, name in sorted(top_level, reverse=True)[:10]],
+        "modules": modules,
+    }
+
+
+def run_scenario(name: str, repeat: int) -> Dict:
+    scenario = SCENARIOS[name]
+    runs = [measure(scenario["args"]) for _ in range(repeat)]
+    imported = set(runs[0]["modules"])
+    report = {
+        "scenario": name,
+        "wall_seconds_median": statistics.median(run["wall_seconds"] for run in runs),
+        "import_seconds_median": statistics.median(run["import_seconds"] for run in runs),
+        "slowest_imports": runs[0]["slowest_imports"],
+        "forbidden_imports": [module for module in scenario["forbidden"] if module in imported],
+        "budget_ms": scenario["budget_ms"],
+    }
+    report["over_budget"] = report["import_seconds_median"] * 1000 > scenario["budget_ms"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenarios to run (default: all)")
+    parser.add_argument("--json", help="Also write the reports to this file")
+    args = parser.parse_args()
+
+    reports = [run_scenario(name, args.repeat) for name in args.scenario or SCENARIOS]
+    for report in reports:
+        print(
+            f"{report['scenario']}: imports {report['import_seconds_median'] * 1000:.0f} ms "
+            f"(budget {report['budget_ms']} ms), wall {report['wall_seconds_median'] * 1000:.0f} ms"
+        )
+        for item in report["slowest_imports"][:5]:
+            print(f"    {item['seconds'] * 1000:7.1f} ms  {item['module']}")
+        if report["forbidden_imports"]:
+            print(f"    imports it should defer: {', '.join(report['forbidden_imports'])}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    sys.exit(1 if any(r["over_budget"] or r["forbidden_imports"] for r in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import math
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+
+# Adjust the Python module search path to correctly point to the project root directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.http_client import create_async_http_client
+from models.llm_agent import LLMAgent, retry_delay
+from models.schemas import PromptRequest, PromptResponse
+from utilities.admission import Overloaded
+from utilities.circuit_breaker import CircuitBreaker
+from utilities.concurrency_limiter import AdaptiveConcurrencyLimiter
+from utilities.rate_limiter import RateLimiter
+from utilities.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLLMAgent:
+    """
+    Represents an LLM agent that interacts with the OpenAI API from an asyncio event loop.
+
+    It behaves like LLMAgent, but a call waiting on the API holds no thread, so one process
+    can keep thousands of prompts in flight. Cancelling the awaiting task closes the upstream
+    connection. Response cache lookups and writes run on a worker thread, since the cache
+    may read and write files. A call beyond the concurrency limiter's limit waits for a slot
+    without blocking the event loop, sharing the limit with the blocking agent's calls.
+    """
+
+    def __init__(self, api_key: str, model: str = "gpt-4", cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None, base_url: Optional[str] = None,
+                 concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, max_retries: int = 2):
+        """
+        Initializes an instance of the AsyncLLMAgent class.
+
+        Args:
+            api_key (str): The OpenAI API key.
+            model (str, optional): The model to use. Defaults to "gpt-4".
+            cache (ResponseCache, optional): Response cache consulted before calling the API.
+            rate_limiter (RateLimiter, optional): Request and token budget every API call waits for.
+            base_url (str, optional): API endpoint, e.g. a local mock server. Defaults to OPENAI_BASE_URL or the OpenAI API.
+            concurrency_limiter (AdaptiveConcurrencyLimiter, optional): Adaptive limit on this agent's calls in flight.
+            circuit_breaker (CircuitBreaker, optional): Fails calls fast while the upstream keeps failing.
+            max_retries (int, optional): Retries of a call failing with a rate limit, server or connection error.
+        """
+        self.api_key = api_key
+        self.model = model
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max_retries
+        # As for LLMAgent, the agent rather than the client retries, through the rate limiter and the upstream guards
+        self.client = AsyncOpenAI(
+            api_key=self.api_key, base_url=base_url, http_client=create_async_http_client(), max_retries=0
+        )
+
+    # Message assembly, cache keys and the upstream guards are the same as for the blocking agent
+    _build_messages = LLMAgent._build_messages
+    _cache_key = LLMAgent._cache_key
+    _guarded = LLMAgent._guarded
+    model_for = LLMAgent.model_for
+    available = LLMAgent.available
+    upstream_stats = LLMAgent.upstream_stats
+
+    @asynccontextmanager
+    async def _guard(self, timed: bool = True) -> AsyncIterator[None]:
+        """
+        Runs an upstream call under the agent's circuit breaker and concurrency limiter, like LLMAgent._guard.
+        """
+        probe = self.circuit_breaker.before_call() if self.circuit_breaker is not None else False
+        if self.concurrency_limiter is not None:
+            try:
+                await self.concurrency_limiter.acquire_async()
+            except (Overloaded, asyncio.CancelledError):
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(None, probe)
+                raise
+        with self._guarded(probe, timed):
+            yield
+
+    async def _wait_for_budget(self, request: PromptRequest, messages: List[Dict]):
+        """
+        Waits until the rate limiter admits a call, without blocking the event loop.
+        """
+        if self.rate_limiter is not None:
+            prompt_chars = sum(len(message.get("content") or "") for message in messages)
+            wait = self.rate_limiter.reserve(math.ceil(prompt_chars / 4) + request.max_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def send_prompt(self, request: PromptRequest, messages: Optional[List[Dict]] = None) -> PromptResponse:
+        """
+        Sends a prompt to the OpenAI API and returns the response.
+
+        Args:
+            request (PromptRequest): The prompt request.
+            messages (List[Dict], optional): The conversation history to send instead of the bare prompt.
+
+        Returns:
+            PromptResponse: The response from the OpenAI API.
+        """
+        messages = self._build_messages(request, messages)
+        cache_key = self._cache_key(request, messages)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return PromptResponse.from_cache(cached)
+
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_budget(request, messages)
+            try:
+                async with self._guard():
+                    response = await self.client.chat.completions.create(
+                        model=self.model, messages=messages, max_tokens=request.max_tokens, temperature=request.temperature
+                    )
+                break
+            except Exception as e:
+                delay = retry_delay(e, attempt, self.max_retries)
+                if delay is None:
+                    logger.error(f"Failed to send prompt: {e}", exc_info=True)
+                    raise
+                logger.warning(f"Retrying a call to {self.model} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+        try:
+            choices = [{"content": choice.message.content} for choice in response.choices]
+            usage = response.usage.dict() if response.usage is not None else None
+            prompt_response = PromptResponse(id=response.id, choices=choices, usage=usage, model=self.model)
+            if cache_key is not None:
+                await asyncio.to_thread(self.cache.set, cache_key, prompt_response.dict())
+            return prompt_response
+        except ValidationError as ve:
+            logger.error(f"Validation error: {ve}", exc_info=True)
+            raise
+
+    async def send_prompt_stream(self, request: PromptRequest, messages: Optional[List[Dict]] = None,
+                                 meta: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        Sends a prompt to the OpenAI API and yields the response tokens as they arrive.
+
+        The upstream stream is closed when the generator is exhausted, closed early or cancelled.
+        A call that fails before the stream starts is retried like send_prompt.
+
+        Args:
+            request (PromptRequest): The prompt request.
+            messages (List[Dict], optional): The conversation history to send instead of the bare prompt.
+            meta (Dict, optional): Receives the "model", the "usage" and "cached" as for LLMAgent.send_prompt_stream.
+
+        Yields:
+            str: The content deltas of the first choice.
+        """
+        if meta is not None:
+            meta["model"] = self.model
+        messages = self._build_messages(request, messages)
+        cache_key = self._cache_key(request, messages)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                response = PromptResponse.from_cache(cached)
+                if meta is not None:
+                    meta.update(usage=response.usage, cached=True)
+                if response.response:
+                    yield response.response
+                return
+
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_budget(request, messages)
+            started = False
+            try:
+                # Stream durations include the time the client takes to read them
+                async with self._guard(timed=False):
+                    stream = await self.client.chat.completions.create(
+                        model=self.model, messages=messages, max_tokens=request.max_tokens,
+                        temperature=request.temperature, stream=True, stream_options={"include_usage": True}
+                    )
+                    started = True
+                    response_id = None
+                    usage = None
+                    parts: List[str] = []
+                    try:
+                        async for chunk in stream:
+                            response_id = chunk.id
+                            # The usage arrives in a last chunk without choices
+                            if getattr(chunk, "usage", None) is not None:
+                                usage = chunk.usage.dict()
+                                if meta is not None:
+                                    meta["usage"] = usage
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                parts.append(delta)
+                                yield delta
+                        # Only a stream that ran to completion is a reusable response
+                        if cache_key is not None and response_id is not None:
+                            entry = PromptResponse(
+                                id=response_id, choices=[{"content": "".join(parts)}], usage=usage, model=self.model
+                            ).dict()
+                            await asyncio.to_thread(self.cache.set, cache_key, entry)
+                    except Exception as e:
+                        logger.error(f"Failed while streaming prompt response: {e}", exc_info=True)
+                        raise
+                    finally:
+                        await stream.close()
+                return
+            except Exception as e:
+                delay = None if started else retry_delay(e, attempt, self.max_retries)
+                if delay is None:
+                    if not started:
+                        logger.error(f"Failed to send prompt: {e}", exc_info=True)
+                    raise
+                logger.warning(f"Retrying a call to {self.model} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        """
+        Closes the agent's HTTP connections.
+        """
+        await self.client.close()
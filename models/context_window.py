@@ -0,0 +1,289 @@
+import math
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from models.schemas import PromptRequest
+from utilities.conversation_store import to_wire_message
+
+try:
+    import tiktoken
+except ImportError:  # Optional; token counts fall back to a character-based estimate
+    tiktoken = None
+
+# Context window sizes, in tokens, of the models we use
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Tokens the chat format adds per message and once to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Tokens of the instructions LLMSummarizer wraps around the summary and the messages it folds in
+SUMMARY_PROMPT_TOKENS = 64
+
+SLIDING_WINDOW = "sliding"
+LAST_TURNS = "last_turns"
+SUMMARY = "summary"
+STRATEGIES = (SLIDING_WINDOW, LAST_TURNS, SUMMARY)
+
+Summarizer = Callable[[str, List[Dict]], str]
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(message: Dict, model: str = "gpt-4") -> int:
+    """
+    Returns the number of prompt tokens a chat message takes up.
+
+    Uses tiktoken when it is installed and otherwise estimates four characters per token.
+    """
+    content = message.get("content") or ""
+    if tiktoken is not None:
+        tokens = len(_encoding(model).encode(content))
+    else:
+        tokens = math.ceil(len(content) / 4)
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+def context_limit(model: str) -> int:
+    """
+    Returns the context window size of a model, matching dated variants by prefix.
+    """
+    for name in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_TOKENS[name]
+    return DEFAULT_CONTEXT_TOKENS
+
+
+class ContextWindow:
+    """
+    The slice of one conversation that is still eligible to be sent to the model.
+
+    Every message is counted once when it enters the window and kept together with its
+    count, in the store's own form (see ConversationStore.get_stored_messages), so that
+    windows share message bodies with the store; wire dicts are only built for the prompt
+    being sent. Messages that fall out are dropped or, with the summary strategy, folded into a
+    rolling summary, so the work per turn is bounded by the window rather than the history.
+    The window is trimmed to a fixed ceiling and each prompt built from it within the budget
+    of its turn, so a turn reserving many completion tokens does not shrink later prompts.
+    """
+
+    def __init__(self, model: str, strategy: str, budget: int, max_turns: int, summarizer: Optional[Summarizer]):
+        """
+        Initializes an instance of the ContextWindow class.
+
+        Args:
+            model (str): The model the prompts are for.
+            strategy (str): One of "sliding", "last_turns" or "summary".
+            budget (int): Context window size of the model, which also bounds each summarizer call.
+            max_turns (int): Turns kept besides the system message with "last_turns".
+            summarizer (Callable, optional): Folds evicted messages into the previous summary.
+        """
+        self.model = model
+        self.strategy = strategy
+        self.budget = budget
+        self.max_turns = max_turns
+        self.summarizer = summarizer
+        self.lock = threading.Lock()
+        self.seen = 0
+        self.system: Optional[Tuple[Any, int]] = None
+        self.summary: Optional[Tuple[Dict, int]] = None
+        self.entries: Deque[Tuple[Any, int]] = deque()
+        self.tokens = 0
+
+    def _pinned_tokens(self) -> int:
+        return (self.system[1] if self.system else 0) + (self.summary[1] if self.summary else 0)
+
+    def extend(self, messages: List):
+        """
+        Adds new messages from the conversation.
+        """
+        for message in messages:
+            entry = (message, count_tokens(message, self.model))
+            if message["role"] == "system" and self.system is None and not self.entries:
+                self.system = entry
+            else:
+                self.entries.append(entry)
+                self.tokens += entry[1]
+        self.seen += len(messages)
+
+    def trim(self, budget: int):
+        """
+        Evicts the oldest messages until the window fits a prompt token budget, summarizing
+        them with the summary strategy. The newest message is always kept.
+        """
+        while True:
+            evicted = []
+            while len(self.entries) > 1 and self._over_limit(budget):
+                entry = self.entries.popleft()
+                self.tokens -= entry[1]
+                evicted.append(entry)
+            if not evicted or self.strategy != SUMMARY or self.summarizer is None:
+                return
+            self._summarize(evicted)
+            # A longer summary may push the window over the budget again
+
+    def _summarize(self, evicted: List[Tuple[Any, int]]):
+        """
+        Folds evicted messages into the summary, in chunks that fit one summarizer call.
+        """
+        reserve = SUMMARY_PROMPT_TOKENS + getattr(self.summarizer, "max_tokens", 0)
+        chunk: List = []
+        chunk_tokens = 0
+        for message, tokens in evicted:
+            limit = self.budget - reserve - (self.summary[1] if self.summary else 0)
+            if chunk and chunk_tokens + tokens > limit:
+                self._fold(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(message)
+            chunk_tokens += tokens
+        if chunk:
+            self._fold(chunk)
+
+    def _fold(self, messages: List):
+        previous = self.summary[0]["content"] if self.summary else ""
+        summary = {"role": "system", "content": self.summarizer(previous, [to_wire_message(m) for m in messages])}
+        self.summary = (summary, count_tokens(summary, self.model))
+
+    def _over_limit(self, budget: int) -> bool:
+        if self.strategy == LAST_TURNS and len(self.entries) > 2 * self.max_turns:
+            return True
+        return self.tokens + self._pinned_tokens() + REPLY_OVERHEAD_TOKENS > budget
+
+    def build(self, budget: int) -> List[Dict]:
+        """
+        Returns the messages to send, newest last, within a token budget.
+
+        The newest message is always included, even if it alone exceeds the budget.
+        """
+        budget -= REPLY_OVERHEAD_TOKENS + self._pinned_tokens()
+        selected = []
+        for message, tokens in reversed(self.entries):
+            if selected and tokens > budget:
+                break
+            selected.append(message)
+            budget -= tokens
+        pinned = [entry[0] for entry in (self.system, self.summary) if entry]
+        return [to_wire_message(message) for message in pinned + selected[::-1]]
+
+
+class ContextManager:
+    """
+    Assembles the prompt for each conversation turn within the model's context window.
+
+    Windows are kept per conversation and only read the messages the store gained since
+    the last turn. Windows for conversations that have not been used recently are dropped
+    and rebuilt from the store on demand.
+    """
+
+    def __init__(self, store, strategy: str = SLIDING_WINDOW, max_turns: int = 20,
+                 summarizer: Optional[Summarizer] = None, max_windows: int = 1000,
+                 budgets: Optional[Dict[str, int]] = None, reserve_tokens: int = 1024):
+        """
+        Initializes an instance of the ContextManager class.
+
+        Args:
+            store (ConversationStore): The store holding the full conversation histories.
+            strategy (str, optional): One of "sliding", "last_turns" or "summary".
+            max_turns (int, optional): Turns kept besides the system message with "last_turns".
+            summarizer (Callable, optional): Folds evicted messages into the previous summary; required for "summary".
+            max_windows (int, optional): Maximum number of conversation windows kept in memory.
+            budgets (Dict[str, int], optional): Prompt token budgets overriding the model context sizes.
+            reserve_tokens (int, optional): Completion tokens windows leave room for before they evict (and
+                summarize) messages, and the default for turns that do not give max_tokens.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown context strategy: {strategy}. Expected one of {', '.join(STRATEGIES)}.")
+        if strategy == SUMMARY and summarizer is None:
+            raise ValueError("The summary context strategy requires a summarizer.")
+        self.store = store
+        self.strategy = strategy
+        self.max_turns = max_turns
+        self.summarizer = summarizer
+        self.max_windows = max_windows
+        self.budgets = budgets or {}
+        self.reserve_tokens = reserve_tokens
+        self.lock = threading.Lock()
+        self._windows: "OrderedDict[Tuple[str, str], ContextWindow]" = OrderedDict()
+
+    def budget(self, model: str) -> int:
+        """
+        Returns the prompt token budget for a model.
+        """
+        return self.budgets.get(model, context_limit(model))
+
+    def _window(self, conversation_id: str, model: str) -> ContextWindow:
+        key = (conversation_id, model)
+        with self.lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = ContextWindow(model, self.strategy, self.budget(model), self.max_turns, self.summarizer)
+                self._windows[key] = window
+                while len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end(key)
+            return window
+
+    def build(self, conversation_id: str, model: str, max_tokens: int = 0) -> List[Dict]:
+        """
+        Returns the messages to send for the next turn of a conversation.
+
+        Args:
+            conversation_id (str): The conversation ID.
+            model (str): The model the prompt is for.
+            max_tokens (int, optional): Tokens reserved for the completion. Defaults to reserve_tokens.
+
+        Returns:
+            List[Dict]: The messages, oldest first.
+        """
+        window = self._window(conversation_id, model)
+        with window.lock:
+            count = self.store.count(conversation_id)
+            if count > window.seen:
+                window.extend(self.store.get_stored_messages(conversation_id, start=window.seen))
+            # Evictions are permanent, so the window is trimmed to a ceiling that does not depend
+            # on the turn; a turn reserving more for its completion only sends fewer messages
+            window.trim(self.budget(model) - self.reserve_tokens)
+            return window.build(self.budget(model) - (max_tokens or self.reserve_tokens))
+
+    def forget(self, conversation_id: str):
+        """
+        Drops the cached windows of a conversation.
+        """
+        with self.lock:
+            for key in [key for key in self._windows if key[0] == conversation_id]:
+                del self._windows[key]
+
+
+class LLMSummarizer:
+    """
+    Summarizer that asks an LLMAgent to fold evicted messages into the running summary.
+    """
+
+    def __init__(self, agent, max_tokens: int = 256):
+        self.agent = agent
+        self.max_tokens = max_tokens
+
+    def __call__(self, previous: str, evicted: List[Dict]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message.get('content') or ''}" for message in evicted)
+        prompt = (
+            "Update the summary of an ongoing conversation with the messages below. "
+            "Keep every fact, decision and open task needed to continue it.\n\n"
+            f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        request = PromptRequest(prompt=prompt, max_tokens=self.max_tokens, temperature=0)
+        return self.agent.send_prompt(request).response
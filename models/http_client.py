@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from pydantic import BaseModel
+
+
+class HTTPPoolConfig(BaseModel):
+    """
+    Represents the connection pool settings of the HTTP client shared by every LLMAgent.
+    """
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 600.0
+    pool_timeout: float = 30.0
+    http2: bool = False  # Requires the h2 package (pip install "httpx[http2]")
+
+    @classmethod
+    def from_env(cls) -> "HTTPPoolConfig":
+        """
+        Builds the settings from OPENAI_HTTP_* environment variables, falling back to the defaults.
+        """
+        values = {}
+        for field in cls.__fields__:
+            value = os.getenv(f"OPENAI_HTTP_{field.upper()}")
+            if value is not None:
+                values[field] = value.lower() in ("1", "true", "yes") if field == "http2" else value
+        return cls(**values)
+
+
+class PoolStats:
+    """
+    Counters describing how requests use the connection pool.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.connections_opened = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self.lock:
+            self.pool_wait_total += seconds
+            self.pool_wait_max = max(self.pool_wait_max, seconds)
+
+
+class _InFlightStream(httpx.SyncByteStream):
+    """
+    Response body that counts its request as in flight until the body is closed.
+    """
+
+    def __init__(self, stream: httpx.SyncByteStream, stats: PoolStats):
+        self.stream = stream
+        self.stats = stats
+        self.closed = False
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            with self.stats.lock:
+                if not self.closed:
+                    self.closed = True
+                    self.stats.in_flight -= 1
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """
+    HTTP transport that measures how long each request waits for a pooled connection.
+
+    The wait is the time from entering the transport until the request headers are sent,
+    minus any time spent opening a new connection (TCP connect and TLS handshake). A request
+    stays in flight until its response body is closed, which for a streamed completion is
+    after the last chunk.
+    """
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        marks: Dict[str, float] = {}
+        outer_trace = request.extensions.get("trace")
+
+        def trace(event_name: str, info: dict):
+            marks[event_name] = time.perf_counter()
+            if outer_trace is not None:
+                outer_trace(event_name, info)
+
+        request.extensions = dict(request.extensions, trace=trace)
+        with self.stats.lock:
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            with self.stats.lock:
+                self.stats.in_flight -= 1
+            raise
+        else:
+            response.stream = _InFlightStream(response.stream, self.stats)
+            return response
+        finally:
+            with self.stats.lock:
+                if "connection.connect_tcp.complete" in marks:
+                    self.stats.connections_opened += 1
+            sent = next((marks[name] for name in marks if name.endswith("send_request_headers.started")), None)
+            if sent is not None:
+                connecting = 0.0
+                for step in ("connection.connect_tcp", "connection.start_tls"):
+                    if f"{step}.complete" in marks:
+                        connecting += marks[f"{step}.complete"] - marks[f"{step}.started"]
+                self.stats.record_wait(max(0.0, sent - started - connecting))
+
+    def connection_counts(self) -> Dict[str, int]:
+        connections = self._pool.connections
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"connections": len(connections), "connections_in_use": len(connections) - idle, "connections_idle": idle}
+
+
+_lock = threading.Lock()
+_config: Optional[HTTPPoolConfig] = None
+_client: Optional[httpx.Client] = None
+_transport: Optional[InstrumentedTransport] = None
+_stats = PoolStats()
+
+
+def configure(config: HTTPPoolConfig):
+    """
+    Sets the pool settings. Must be called before the shared client is first used.
+    """
+    global _config
+    with _lock:
+        if _client is not None:
+            raise RuntimeError("The shared HTTP client has already been created.")
+        _config = config
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Returns the process-wide HTTP client, creating it on first use.
+    """
+    global _client, _config, _transport
+    if _client is None:
+        with _lock:
+            if _client is None:
+                config = _config = _config or HTTPPoolConfig.from_env()
+                limits = httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=config.keepalive_expiry,
+                )
+                _transport = InstrumentedTransport(_stats, limits=limits, http2=config.http2)
+                timeout = httpx.Timeout(
+                    config.read_timeout, connect=config.connect_timeout, pool=config.pool_timeout
+                )
+                _client = httpx.Client(transport=_transport, timeout=timeout, follow_redirects=True)
+    return _client
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """
+    Returns a new asyncio HTTP client with the shared pool's settings.
+
+    An async client is tied to the event loop that first uses it, so each AsyncLLMAgent
+    gets its own rather than sharing a process-wide one.
+    """
+    config = _config or HTTPPoolConfig.from_env()
+    limits = httpx.Limits(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(config.read_timeout, connect=config.connect_timeout, pool=config.pool_timeout)
+    return httpx.AsyncClient(limits=limits, http2=config.http2, timeout=timeout, follow_redirects=True)
+
+
+def pool_stats() -> Dict:
+    """
+    Returns connection and wait statistics of the shared pool.
+    """
+    with _stats.lock:
+        stats = {
+            "requests": _stats.requests,
+            "in_flight": _stats.in_flight,
+            "connections_opened": _stats.connections_opened,
+            "pool_wait_seconds_total": _stats.pool_wait_total,
+            "pool_wait_seconds_max": _stats.pool_wait_max,
+            "pool_wait_seconds_avg": _stats.pool_wait_total / _stats.requests if _stats.requests else 0.0,
+        }
+    if _transport is not None:
+        stats.update(_transport.connection_counts())
+    return stats
@@ -1,42 +1,70 @@
+import logging
+import math
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
 
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
-from openai import OpenAI
-from pydantic import BaseModel, ValidationError
+from openai import APIConnectionError, APIStatusError, APITimeoutError, OpenAI
+from pydantic import ValidationError
 
 # Adjust the Python module search path to correctly point to the project root directory
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-load_dotenv()  # Load environment variables from .env file
+from models.http_client import get_http_client
+from models.schemas import BatchItemResponse, PromptRequest, PromptResponse
+from utilities.admission import Overloaded
+from utilities.circuit_breaker import CircuitBreaker
+from utilities.concurrency_limiter import AdaptiveConcurrencyLimiter
+from utilities.rate_limiter import RateLimiter, backoff_delay
+from utilities.response_cache import ResponseCache
+from utilities.single_flight import SingleFlight
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-class PromptRequest(BaseModel):
+def is_retryable(error: Exception) -> bool:
     """
-    Represents a prompt request with a prompt, maximum tokens, and temperature.
+    Returns whether a failed API call is worth retrying: rate limits, server errors and transport failures.
     """
-    prompt: str
-    max_tokens: int
-    temperature: float = 0.5
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
 
-    class Config:
-        extra = "ignore"
 
-
-class PromptResponse(BaseModel):
+class RequestCancelled(Exception):
     """
-    Represents a prompt response with an ID and a list of choices.
+    Raised by a cancellable call whose cancel event was set before the response was complete.
     """
-    id: str
-    choices: list[dict]  # Updated to specify a list of dictionaries
 
-    def __getitem__(self, index):
-        return self.choices[index]
 
-    class Config:
-        extra = "ignore"
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after-ms"]) / 1000
+    except (AttributeError, KeyError, TypeError, ValueError):
+        pass
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_delay(error: Exception, attempt: int, max_retries: int) -> Optional[float]:
+    """
+    Returns how long to wait before retrying a failed zero-based attempt, or None if it is not retried.
+
+    Retries wait for the Retry-After delay when the API gives one and otherwise back off
+    exponentially with jitter.
+    """
+    if attempt >= max_retries or not is_retryable(error):
+        return None
+    delay = _retry_after(error)
+    return delay if delay is not None else backoff_delay(attempt)
 
 
 class LLMAgent:
@@ -44,41 +72,372 @@ class LLMAgent:
     Represents an LLM agent that interacts with the OpenAI API.
     """
 
-    def __init__(self, api_key: str, model: str = "gpt-4"):
+    def __init__(self, api_key: str, model: str = "gpt-4", cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None, base_url: Optional[str] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, max_retries: int = 2):
         """
         Initializes an instance of the LLMAgent class.
 
         Args:
             api_key (str): The OpenAI API key.
             model (str, optional): The model to use. Defaults to "gpt-4".
+            cache (ResponseCache, optional): Response cache consulted before calling the API.
+            rate_limiter (RateLimiter, optional): Request and token budget every API call waits for.
+            base_url (str, optional): API endpoint, e.g. a local mock server. Defaults to OPENAI_BASE_URL or the OpenAI API.
+            single_flight (SingleFlight, optional): Shares one upstream call between identical requests in
+                flight at the same time, also across the agents given the same instance.
+            concurrency_limiter (AdaptiveConcurrencyLimiter, optional): Adaptive limit on this agent's calls in flight.
+            circuit_breaker (CircuitBreaker, optional): Fails calls fast while the upstream keeps failing.
+            max_retries (int, optional): Retries of a call failing with a rate limit, server or connection error.
         """
         self.api_key = api_key
         self.model = model
-        self.client = OpenAI(api_key=self.api_key)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.single_flight = single_flight
+        self.concurrency_limiter = concurrency_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max_retries
+        # Every agent shares one connection pool, so connections are reused across agents. The client
+        # does not retry on its own: the agent retries, so that every attempt waits for the rate limiter
+        # and its outcome reaches the concurrency limiter and circuit breaker
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, http_client=get_http_client(), max_retries=0)
+
+    def _build_messages(self, request: PromptRequest, messages: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Builds the message list sent upstream for a request.
+
+        Args:
+            request (PromptRequest): The prompt request.
+            messages (List[Dict], optional): The conversation history. When given it is sent as-is
+                and is expected to already contain the prompt.
+
+        Returns:
+            List[Dict]: The messages for the chat completions call.
+        """
+        if messages:
+            return list(messages)
+        return [{"role": "system", "content": request.prompt}]
+
+    def _cache_key(self, request: PromptRequest, messages: List[Dict]) -> Optional[str]:
+        """
+        Returns the response cache key for a request, or None if it must not be cached.
+        """
+        if self.cache is None or not self.cache.should_cache(request.temperature, request.cache):
+            return None
+        return self.cache.make_key(self.model, messages, request.max_tokens, request.temperature)
+
+    def _flight_key(self, request: PromptRequest, messages: List[Dict]) -> str:
+        return ResponseCache.make_key(self.model, messages, request.max_tokens, request.temperature)
+
+    def _wait_for_budget(self, request: PromptRequest, messages: List[Dict]):
+        """
+        Blocks until the rate limiter admits a call, estimating four characters per prompt token.
+        """
+        if self.rate_limiter is not None:
+            prompt_chars = sum(len(message.get("content") or "") for message in messages)
+            self.rate_limiter.acquire(math.ceil(prompt_chars / 4) + request.max_tokens)
+
+    @contextmanager
+    def _guard(self, timed: bool = True) -> Iterator[None]:
+        """
+        Runs an upstream call under the agent's circuit breaker and concurrency limiter.
+
+        Rate limits, server errors and transport failures count as failures; other errors
+        still show a responsive upstream, and cancelled calls count as neither.
 
-    def send_prompt(self, request: PromptRequest) -> PromptResponse:
+        Args:
+            timed (bool, optional): Whether the call's duration goes into the limiter's median latency.
+        """
+        probe = self.circuit_breaker.before_call() if self.circuit_breaker is not None else False
+        if self.concurrency_limiter is not None:
+            try:
+                self.concurrency_limiter.acquire()
+            except Overloaded:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(None, probe)
+                raise
+        with self._guarded(probe, timed):
+            yield
+
+    @contextmanager
+    def _guarded(self, probe: bool, timed: bool) -> Iterator[None]:
+        """
+        Reports the outcome of a call that holds a limiter slot to the limiter and the circuit breaker.
+        """
+        limiter = self.concurrency_limiter
+        started = time.monotonic()
+        failed: Optional[bool] = None
+        try:
+            yield
+            failed = False
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            failed = is_retryable(e)
+            raise
+        finally:
+            if limiter is not None:
+                latency = time.monotonic() - started if timed and failed is False else None
+                limiter.release(latency, overloaded=bool(failed), started=started)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(failed, probe)
+
+    def model_for(self, request: PromptRequest, messages: Optional[List[Dict]] = None) -> str:
+        """
+        Returns the model a prompt would be sent to.
+        """
+        return self.model
+
+    def available(self) -> bool:
+        """
+        Returns whether the circuit breaker currently lets calls through.
+        """
+        return self.circuit_breaker is None or self.circuit_breaker.allows()
+
+    def upstream_stats(self) -> Dict:
+        """
+        Returns the state of the concurrency limiter and circuit breaker guarding the agent's calls, by model.
+        """
+        return {self.model: {
+            "concurrency": self.concurrency_limiter.stats() if self.concurrency_limiter is not None else None,
+            "circuit": self.circuit_breaker.stats() if self.circuit_breaker is not None else None,
+        }}
+
+    def send_prompt(self, request: PromptRequest, messages: Optional[List[Dict]] = None,
+                    cancel: Optional[threading.Event] = None, max_retries: Optional[int] = None) -> PromptResponse:
         """
         Sends a prompt to the OpenAI API and returns the response.
 
         Args:
             request (PromptRequest): The prompt request.
+            messages (List[Dict], optional): The conversation history to send instead of the bare prompt.
+            cancel (threading.Event, optional): Makes the call cancellable. The response is then streamed
+                internally, and setting the event closes the connection at the next chunk and raises
+                RequestCancelled. Cancellable calls are not retried, since their caller fails over itself.
+            max_retries (int, optional): Retries of rate limit, server and connection errors. Defaults to the agent's.
 
         Returns:
             PromptResponse: The response from the OpenAI API.
         """
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model, messages=[{"role": "system", "content": request.prompt}], max_tokens=request.max_tokens, temperature=request.temperature
+        messages = self._build_messages(request, messages)
+        cache_key = self._cache_key(request, messages)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return PromptResponse.from_cache(cached)
+
+        if cancel is not None:
+            # Not coalesced, since cancelling would also cancel every caller that joined
+            return self._collect(request, messages, cache_key, cancel)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if self.single_flight is not None:
+            return self.single_flight.do(
+                self._flight_key(request, messages), lambda: self._complete(request, messages, cache_key, max_retries)
             )
+        return self._complete(request, messages, cache_key, max_retries)
+
+    def _complete(self, request: PromptRequest, messages: List[Dict], cache_key: Optional[str],
+                  max_retries: int) -> PromptResponse:
+        """
+        Makes the upstream call of send_prompt, retrying it as needed, and caches its response.
+        """
+        for attempt in range(max_retries + 1):
+            self._wait_for_budget(request, messages)
+            try:
+                with self._guard():
+                    response = self.client.chat.completions.create(
+                        model=self.model, messages=messages, max_tokens=request.max_tokens, temperature=request.temperature
+                    )
+                break
+            except Exception as e:
+                delay = retry_delay(e, attempt, max_retries)
+                if delay is None:
+                    logger.error(f"Failed to send prompt: {e}", exc_info=True)
+                    raise
+                logger.warning(f"Retrying a call to {self.model} in {delay:.2f}s: {e}")
+                time.sleep(delay)
+        try:
             # Transform the response to match the expected structure of PromptResponse
-            choices = [{"content": choice['content']} for choice in response.choices]
-            return PromptResponse(id=response.id, choices=choices)
+            choices = [{"content": choice.message.content} for choice in response.choices]
+            usage = response.usage.dict() if response.usage is not None else None
+            prompt_response = PromptResponse(id=response.id, choices=choices, usage=usage, model=self.model)
+            if cache_key is not None:
+                self.cache.set(cache_key, prompt_response.dict())
+            return prompt_response
         except ValidationError as ve:
-            app.logger.error(f"Validation error: {ve}", exc_info=True)
+            logger.error(f"Validation error: {ve}", exc_info=True)
             raise
+
+    def _collect(self, request: PromptRequest, messages: List[Dict], cache_key: Optional[str],
+                 cancel: threading.Event) -> PromptResponse:
+        """
+        Makes the upstream call of a cancellable send_prompt and assembles the streamed response.
+        """
+        if cancel.is_set():
+            raise RequestCancelled(f"Request to {self.model} was cancelled")
+        meta: Dict = {}
+        parts: List[str] = []
+        stream = self._stream(request, messages, cache_key, meta)
+        try:
+            for delta in stream:
+                if cancel.is_set():
+                    raise RequestCancelled(f"Request to {self.model} was cancelled")
+                parts.append(delta)
+        finally:
+            stream.close()
+        return PromptResponse(
+            id=meta.get("id") or "", choices=[{"content": "".join(parts)}], usage=meta.get("usage"), model=self.model
+        )
+
+    def send_prompt_stream(self, request: PromptRequest, messages: Optional[List[Dict]] = None,
+                           meta: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Sends a prompt to the OpenAI API and yields the response tokens as they arrive.
+
+        The upstream stream is closed when the generator is exhausted or closed early,
+        so a client disconnect does not leave the connection open.
+
+        Args:
+            request (PromptRequest): The prompt request.
+            messages (List[Dict], optional): The conversation history to send instead of the bare prompt.
+            meta (Dict, optional): Receives the "model", and once the stream completes its "usage";
+                "cached" is set when the response came from the response cache. A prompt that joined
+                an identical stream in flight gets no usage, since it made no upstream call.
+
+        Yields:
+            str: The content deltas of the first choice.
+        """
+        if meta is not None:
+            meta["model"] = self.model
+        messages = self._build_messages(request, messages)
+        cache_key = self._cache_key(request, messages)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                response = PromptResponse.from_cache(cached)
+                if meta is not None:
+                    meta.update(usage=response.usage, cached=True)
+                if response.response:
+                    yield response.response
+                return
+
+        if self.single_flight is not None:
+            yield from self.single_flight.stream(
+                self._flight_key(request, messages), lambda: self._stream(request, messages, cache_key, meta, retry=True)
+            )
+        else:
+            yield from self._stream(request, messages, cache_key, meta, retry=True)
+
+    def _stream(self, request: PromptRequest, messages: List[Dict], cache_key: Optional[str],
+                meta: Optional[Dict] = None, retry: bool = False) -> Iterator[str]:
+        """
+        Makes the upstream call of send_prompt_stream, yielding its deltas and caching the complete response.
+        The response ID and, once the stream completes, its usage are stored in meta if given.
+
+        With retry, a call that fails before the stream starts is retried up to the agent's max_retries.
+        """
+        max_retries = self.max_retries if retry else 0
+        for attempt in range(max_retries + 1):
+            self._wait_for_budget(request, messages)
+            started = False
+            try:
+                # Stream durations include the time the client takes to read them
+                with self._guard(timed=False):
+                    stream = self.client.chat.completions.create(
+                        model=self.model, messages=messages, max_tokens=request.max_tokens,
+                        temperature=request.temperature, stream=True, stream_options={"include_usage": True}
+                    )
+                    started = True
+                    yield from self._relay(stream, cache_key, meta)
+                return
+            except Exception as e:
+                delay = None if started else retry_delay(e, attempt, max_retries)
+                if delay is None:
+                    if not started:
+                        logger.error(f"Failed to send prompt: {e}", exc_info=True)
+                    raise
+                logger.warning(f"Retrying a call to {self.model} in {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    def _relay(self, stream, cache_key: Optional[str], meta: Optional[Dict]) -> Iterator[str]:
+        """
+        Yields the deltas of an upstream stream, then closes it and caches the complete response.
+        """
+        response_id = None
+        usage = None
+        parts: List[str] = []
+        try:
+            for chunk in stream:
+                response_id = chunk.id
+                if meta is not None:
+                    meta["id"] = response_id
+                # The usage arrives in a last chunk without choices
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage.dict()
+                    if meta is not None:
+                        meta["usage"] = usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            # Only a stream that ran to completion is a reusable response
+            if cache_key is not None and response_id is not None:
+                entry = PromptResponse(
+                    id=response_id, choices=[{"content": "".join(parts)}], usage=usage, model=self.model
+                ).dict()
+                self.cache.set(cache_key, entry)
         except Exception as e:
-            app.logger.error(f"Failed to send prompt: {e}", exc_info=True)
+            logger.error(f"Failed while streaming prompt response: {e}", exc_info=True)
             raise
+        finally:
+            stream.close()
+
+    def send_prompt_with_retry(self, request: PromptRequest, max_retries: int = 5) -> PromptResponse:
+        """
+        Sends a prompt, retrying rate limit, server and connection errors more often than the agent's default.
+
+        Retries wait for the Retry-After delay when the API gives one and otherwise back off
+        exponentially with jitter.
+
+        Args:
+            request (PromptRequest): The prompt request.
+            max_retries (int, optional): Retries after the first attempt.
+
+        Returns:
+            PromptResponse: The response from the OpenAI API.
+        """
+        return self.send_prompt(request, max_retries=max_retries)
+
+    def send_batch(self, requests: List[PromptRequest], max_concurrency: int = 8, max_retries: int = 5) -> List[BatchItemResponse]:
+        """
+        Sends several independent prompts concurrently.
+
+        Calls go through the agent's rate limiter and are retried as in send_prompt_with_retry.
+        A prompt that still fails is reported in its own result instead of failing the batch.
+
+        Args:
+            requests (List[PromptRequest]): The prompt requests.
+            max_concurrency (int, optional): Maximum number of calls in flight at once.
+            max_retries (int, optional): Retries per prompt after the first attempt.
+
+        Returns:
+            List[BatchItemResponse]: One result per request, in input order.
+        """
+        def send(index: int, request: PromptRequest) -> BatchItemResponse:
+            try:
+                return BatchItemResponse(index=index, response=self.send_prompt_with_retry(request, max_retries))
+            except Exception as e:
+                return BatchItemResponse(index=index, error=str(e))
+
+        if not requests:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(requests)))) as executor:
+            return list(executor.map(send, range(len(requests)), requests))
 
     def set_model(self, model: str):
         """
@@ -90,30 +449,37 @@ class LLMAgent:
         self.model = model
 
 
-# Create an instance of the LLMAgent
-api_key = os.getenv("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("OPENAI_API_KEY is not set in the environment variables. Please ensure your OPENAI_API_KEY is set in the .env file.")
-
-agent = LLMAgent(api_key=api_key, model="gpt-4")
-
-# Define a route for the web app
-@app.route('/prompt', methods=['POST'])
-def handle_prompt():
+def create_app() -> Flask:
     """
-    Handles a prompt request and returns the response.
+    Creates a minimal web app that exposes an agent on /prompt.
     """
-    try:
-        data = request.get_json()
-        prompt_request = PromptRequest(**data)
-        response = agent.send_prompt(prompt_request)
-        return jsonify({'id': response.id, 'choices': response.choices})
-    except ValidationError as ve:
-        app.logger.error(f"Validation error on prompt data: {ve.errors()}", exc_info=True)
-        return jsonify({"error": ve.errors()}), 400
-    except Exception as e:
-        app.logger.error(f"Failed to handle prompt: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+    load_dotenv()  # Load environment variables from .env file
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None:
+        raise ValueError("OPENAI_API_KEY is not set in the environment variables. Please ensure your OPENAI_API_KEY is set in the .env file.")
+
+    app = Flask(__name__)
+    agent = LLMAgent(api_key=api_key, model="gpt-4")
+
+    # Define a route for the web app
+    @app.route('/prompt', methods=['POST'])
+    def handle_prompt():
+        """
+        Handles a prompt request and returns the response.
+        """
+        try:
+            data = request.get_json()
+            prompt_request = PromptRequest(**data)
+            response = agent.send_prompt(prompt_request)
+            return jsonify({'id': response.id, 'choices': response.choices})
+        except ValidationError as ve:
+            app.logger.error(f"Validation error on prompt data: {ve.errors()}", exc_info=True)
+            return jsonify({"error": ve.errors()}), 400
+        except Exception as e:
+            app.logger.error(f"Failed to handle prompt: {e}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
+
+    return app
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,332 @@
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+# Adjust the Python module search path to correctly point to the project root directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.context_window import REPLY_OVERHEAD_TOKENS, context_limit, count_tokens
+from models.llm_agent import LLMAgent, RequestCancelled, is_retryable
+from models.schemas import BatchItemResponse, PromptRequest, PromptResponse
+from utilities.rate_limiter import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRoute(BaseModel):
+    """
+    Represents one model of the router's pool and the requests it may serve.
+    """
+    model: str
+    max_prompt_tokens: Optional[int] = None  # Largest estimated prompt the model is used for
+    max_tokens: Optional[int] = None  # Largest requested completion the model is used for
+
+    class Config:
+        extra = "ignore"
+
+    def accepts(self, prompt_tokens: int, max_tokens: int) -> bool:
+        return ((self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens)
+                and (self.max_tokens is None or max_tokens <= self.max_tokens))
+
+
+class ModelStats:
+    """
+    Rolling latency and error statistics of one model over its most recent calls.
+    """
+
+    def __init__(self, window: int = 200):
+        self.lock = threading.Lock()
+        self.latencies: "deque[float]" = deque(maxlen=window)
+        self.outcomes: "deque[bool]" = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency: Optional[float], error: bool = False):
+        with self.lock:
+            self.calls += 1
+            self.errors += error
+            self.outcomes.append(error)
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        Returns the nearest-rank percentile of the recent latencies, or None without any.
+        """
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)]
+
+    def error_rate(self) -> float:
+        with self.lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def samples(self) -> int:
+        with self.lock:
+            return len(self.latencies)
+
+
+class ModelRouter:
+    """
+    Picks a model per request from a pool, and hedges slow calls with a backup request.
+
+    The routes whose limits admit the request's prompt size and max_tokens, and whose context
+    window holds both, are ranked by recent p95 latency, with models whose circuit breaker is open ranked last and
+    models whose recent error rate exceeds max_error_rate just before them; models without statistics yet come first so they get measured, and the
+    configured order breaks ties.
+
+    Once the chosen model has enough samples, a call still running after its
+    hedge_percentile latency gets a backup request on the next-ranked model (or the same
+    one), and whichever succeeds first wins. Hedged calls are made cancellable, so the
+    loser's connection is closed at its next streamed chunk. A call that fails is sent to
+    the next-ranked model instead, if there is one.
+
+    Hedged calls run on a pool of max_workers threads, which bounds the hedged calls in
+    flight; the hedge delay is measured from when a call leaves the pool's queue.
+
+    The router can stand in for an LLMAgent in the app: it has a model, model_for, send_prompt,
+    send_prompt_stream and send_batch. Its model is the route with the largest context window,
+    which prompts are assembled for, and responses name the model that actually served them.
+    """
+
+    def __init__(self, routes: List[ModelRoute], agent_factory: Callable[[str], LLMAgent],
+                 hedge_percentile: Optional[float] = 95, min_samples: int = 20, max_error_rate: float = 0.5,
+                 window: int = 200, max_workers: int = 32):
+        """
+        Initializes an instance of the ModelRouter class.
+
+        Args:
+            routes (List[ModelRoute]): The pool, in order of preference.
+            agent_factory (Callable[[str], LLMAgent]): Creates the agent of a model.
+            hedge_percentile (float, optional): Latency percentile after which a backup request is sent. None disables hedging.
+            min_samples (int, optional): Latencies a model needs before its percentiles are trusted.
+            max_error_rate (float, optional): Recent error rate above which a model is ranked last.
+            window (int, optional): Number of recent calls the statistics cover.
+            max_workers (int, optional): Threads running hedged calls, and so the most hedged calls in flight.
+                Size it to the models' upstream concurrency limits so that it is not the tighter bound.
+        """
+        if not routes:
+            raise ValueError("A model router needs at least one route.")
+        self.routes = routes
+        self.agents = {route.model: agent_factory(route.model) for route in routes}
+        self.stats = {route.model: ModelStats(window) for route in routes}
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @property
+    def model(self) -> str:
+        # Prompts are assembled for the largest context window; candidates() leaves out the models they do not fit
+        return max(self.routes, key=lambda route: context_limit(route.model)).model
+
+    def model_for(self, request: PromptRequest, messages: Optional[List[Dict]] = None) -> str:
+        """
+        Returns the model a prompt would be sent to first.
+        """
+        return self.candidates(request, messages)[0]
+
+    def candidates(self, request: PromptRequest, messages: Optional[List[Dict]] = None) -> List[str]:
+        """
+        Returns the models that may serve a request, best first.
+        """
+        if messages:
+            prompt_tokens = sum(count_tokens(message, self.model) for message in messages) + REPLY_OVERHEAD_TOKENS
+        else:
+            prompt_tokens = count_tokens({"content": request.prompt}, self.model) + REPLY_OVERHEAD_TOKENS
+        fits = [route for route in self.routes if prompt_tokens + request.max_tokens <= context_limit(route.model)]
+        routes = [route for route in fits if route.accepts(prompt_tokens, request.max_tokens)]
+        if not routes:
+            # Nothing is configured for a request this large; the last route it fits is assumed to be the
+            # largest, and a prompt too large for every model goes to the one it was assembled for
+            routes = fits[-1:] or [route for route in self.routes if route.model == self.model]
+
+        def rank(position: int) -> tuple:
+            model = routes[position].model
+            stats = self.stats[model]
+            available = getattr(self.agents[model], "available", None)
+            blocked = available is not None and not available()
+            unhealthy = stats.samples() >= self.min_samples and stats.error_rate() > self.max_error_rate
+            p95 = stats.percentile(95) if stats.samples() >= self.min_samples else None
+            return blocked, unhealthy, p95 if p95 is not None else 0.0, position
+
+        return [routes[position].model for position in sorted(range(len(routes)), key=rank)]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """
+        Returns how long a call to the model runs before a backup is sent, or None if it is not hedged.
+        """
+        stats = self.stats[model]
+        if self.hedge_percentile is None or stats.samples() < self.min_samples:
+            return None
+        return stats.percentile(self.hedge_percentile)
+
+    def _call(self, model: str, request: PromptRequest, messages: Optional[List[Dict]],
+              cancel: Optional[threading.Event] = None) -> PromptResponse:
+        started = time.perf_counter()
+        try:
+            response = self.agents[model].send_prompt(request, messages, cancel=cancel)
+        except RequestCancelled:
+            # Censored at the time of cancelling: the call was at least this slow
+            self.stats[model].record(time.perf_counter() - started)
+            raise
+        except Exception:
+            self.stats[model].record(None, error=True)
+            raise
+        self.stats[model].record(time.perf_counter() - started)
+        if response.model is None:
+            response.model = model
+        return response
+
+    def send_prompt(self, request: PromptRequest, messages: Optional[List[Dict]] = None) -> PromptResponse:
+        """
+        Sends a prompt to the best model for it, hedging with a backup request when it is slow.
+
+        Args:
+            request (PromptRequest): The prompt request.
+            messages (List[Dict], optional): The conversation history to send instead of the bare prompt.
+
+        Returns:
+            PromptResponse: The first successful response.
+        """
+        candidates = self.candidates(request, messages)
+        primary = candidates[0]
+        delay = self.hedge_delay(primary)
+        if delay is None:
+            try:
+                return self._call(primary, request, messages)
+            except Exception as e:
+                return self._failover(candidates, request, messages, e)
+
+        cancels: Dict[Future, threading.Event] = {}
+
+        def submit(model: str, started: Optional[threading.Event] = None) -> Future:
+            cancel = threading.Event()
+
+            def call() -> PromptResponse:
+                if started is not None:
+                    started.set()
+                return self._call(model, request, messages, cancel)
+
+            future = self.executor.submit(call)
+            cancels[future] = cancel
+            return future
+
+        started = threading.Event()
+        first = submit(primary, started)
+        # Time spent queued for a thread is not the model being slow
+        started.wait()
+        done, _ = wait([first], timeout=delay)
+        if done:
+            if first.exception() is None:
+                return first.result()
+            return self._failover(candidates, request, messages, first.exception())
+
+        backup = candidates[1] if len(candidates) > 1 else primary
+        second = submit(backup)
+        with self.lock:
+            self.hedges += 1
+        logger.info(f"Hedging a call to {primary} after {delay:.2f}s with {backup}")
+
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        cancels[loser].set()
+                    if future is second:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _failover(self, candidates: List[str], request: PromptRequest, messages: Optional[List[Dict]],
+                  error: Exception) -> PromptResponse:
+        """
+        Sends a request whose call to the first candidate failed to the second one, or raises the error without one.
+        """
+        if len(candidates) < 2:
+            raise error
+        with self.lock:
+            self.failovers += 1
+        logger.warning(f"Call to {candidates[0]} failed ({error}), failing over to {candidates[1]}")
+        return self._call(candidates[1], request, messages)
+
+    def send_prompt_stream(self, request: PromptRequest, messages: Optional[List[Dict]] = None,
+                           meta: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Streams the response of the best model for the prompt. Streams are not hedged, since
+        the client already receives the first model's tokens.
+
+        Only the outcome of a stream is recorded: its duration depends on the answer's length
+        and would skew the latencies that rank models and set the hedge delay.
+        """
+        model = self.candidates(request, messages)[0]
+        if meta is not None:
+            meta["model"] = model
+        try:
+            yield from self.agents[model].send_prompt_stream(request, messages, meta=meta)
+        except Exception:
+            self.stats[model].record(None, error=True)
+            raise
+        self.stats[model].record(None)
+
+    def send_batch(self, requests: List[PromptRequest], max_concurrency: int = 8, max_retries: int = 5) -> List[BatchItemResponse]:
+        """
+        Sends several independent prompts concurrently, each routed on its own and retried as in LLMAgent.send_batch.
+        """
+        def send(index: int, request: PromptRequest) -> BatchItemResponse:
+            for attempt in range(max_retries + 1):
+                try:
+                    return BatchItemResponse(index=index, response=self.send_prompt(request))
+                except Exception as e:
+                    if attempt == max_retries or not is_retryable(e):
+                        return BatchItemResponse(index=index, error=str(e))
+                    time.sleep(backoff_delay(attempt))
+
+        if not requests:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(requests)))) as executor:
+            return list(executor.map(send, range(len(requests)), requests))
+
+    def upstream_stats(self) -> Dict:
+        """
+        Returns the state of the concurrency limiter and circuit breaker of every model.
+        """
+        stats = {}
+        for agent in self.agents.values():
+            stats.update(agent.upstream_stats())
+        return stats
+
+    def stats_snapshot(self) -> Dict:
+        """
+        Returns the rolling statistics of every model and the hedging counters.
+        """
+        models = {}
+        for model, stats in self.stats.items():
+            models[model] = {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "error_rate": stats.error_rate(),
+                "p50_seconds": stats.percentile(50),
+                "p95_seconds": stats.percentile(95),
+                "hedge_after_seconds": self.hedge_delay(model),
+            }
+        with self.lock:
+            return {"models": models, "hedges": self.hedges, "hedge_wins": self.hedge_wins, "failovers": self.failovers}
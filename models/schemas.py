@@ -0,0 +1,65 @@
+from typing import Optional
+
+from pydantic import BaseModel, PrivateAttr
+
+
+class PromptRequest(BaseModel):
+    """
+    Represents a prompt request with a prompt, maximum tokens, and temperature.
+    """
+    prompt: str
+    max_tokens: int
+    temperature: float = 0.5
+    cache: bool = False  # Opt in to the response cache for non-deterministic requests
+
+    class Config:
+        extra = "ignore"
+
+
+class PromptResponse(BaseModel):
+    """
+    Represents a prompt response with an ID and a list of choices.
+    """
+    id: str
+    choices: list[dict]  # Updated to specify a list of dictionaries
+    usage: Optional[dict] = None  # prompt_tokens, completion_tokens and total_tokens when reported
+    model: Optional[str] = None  # The model that served the request
+    _cached: bool = PrivateAttr(default=False)
+
+    @classmethod
+    def from_cache(cls, entry: dict) -> "PromptResponse":
+        """
+        Rebuilds a response served from the response cache, keeping the usage of the original call.
+        """
+        response = cls(**entry)
+        response._cached = True
+        return response
+
+    @property
+    def cached(self) -> bool:
+        """
+        Whether the response came from the response cache rather than the upstream API.
+        """
+        return self._cached
+
+    def __getitem__(self, index):
+        return self.choices[index]
+
+    @property
+    def response(self) -> str:
+        """
+        The content of the first choice, i.e. the assistant message.
+        """
+        return self.choices[0]["content"] if self.choices else ""
+
+    class Config:
+        extra = "ignore"
+
+
+class BatchItemResponse(BaseModel):
+    """
+    Represents the outcome of one prompt in a batch: either a response or an error.
+    """
+    index: int
+    response: Optional[PromptResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from backend.agent_system import DAGScheduler, TaskPlan
+from models.llm_agent import PromptResponse
+from utilities.external_memory import ExternalMemory
+
+
+class EchoAgent:
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+        self.prompts = []
+
+    def send_prompt(self, request):
+        if self.fail_on and self.fail_on in request.prompt:
+            raise RuntimeError("upstream failed")
+        time.sleep(self.delay)
+        with self.lock:
+            self.prompts.append(request.prompt)
+        return PromptResponse(id="1", choices=[{"content": f"<{request.prompt}>"}])
+
+
+def make_plan():
+    return TaskPlan(steps=[
+        {"id": "spec", "prompt": "spec", "outputs": ["spec"]},
+        {"id": "api", "prompt": "api from {spec}", "inputs": ["spec"], "outputs": ["api"]},
+        {"id": "ui", "prompt": "ui from {spec}", "inputs": ["spec"], "outputs": ["ui"]},
+        {"id": "app", "prompt": "app from {api} and {ui}", "inputs": ["api", "ui"], "outputs": ["app"]},
+    ])
+
+
+def test_outputs_flow_to_dependents(tmp_path):
+    agent = EchoAgent()
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        outputs = DAGScheduler(make_plan(), memory, lambda: agent, max_workers=2).run()
+
+    assert outputs["app"] == "<app from <api from <spec>> and <ui from <spec>>>"
+
+
+def test_independent_steps_run_in_parallel(tmp_path):
+    plan = TaskPlan(steps=[{"id": f"s{i}", "prompt": str(i), "outputs": [f"o{i}"]} for i in range(8)])
+    agent = EchoAgent(delay=0.1)
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        started = time.monotonic()
+        DAGScheduler(plan, memory, lambda: agent, max_workers=8).run()
+
+    assert time.monotonic() - started < 0.5
+
+
+def test_failed_run_resumes_from_completed_steps(tmp_path):
+    filename = str(tmp_path / "memory_db")
+    with ExternalMemory(filename) as memory:
+        with pytest.raises(RuntimeError):
+            DAGScheduler(make_plan(), memory, lambda: EchoAgent(fail_on="app"), max_workers=1).run()
+
+    agent = EchoAgent()
+    with ExternalMemory(filename) as memory:
+        outputs = DAGScheduler(make_plan(), memory, lambda: agent, max_workers=1).run()
+
+    assert agent.prompts == ["app from <api from <spec>> and <ui from <spec>>"]
+    assert outputs["spec"] == "<spec>"
+
+
+def test_seeded_inputs_are_read_from_memory(tmp_path):
+    plan = TaskPlan(steps=[{"id": "s", "prompt": "use {brief}", "inputs": ["brief"], "outputs": ["out"]}])
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        memory.save_data("brief", "a todo app")
+        outputs = DAGScheduler(plan, memory, EchoAgent).run()
+
+    assert outputs["out"] == "<use a todo app>"
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValidationError):
+        TaskPlan(steps=[
+            {"id": "a", "prompt": "{y}", "inputs": ["y"], "outputs": ["x"]},
+            {"id": "b", "prompt": "{x}", "inputs": ["x"], "outputs": ["y"]},
+        ])
+
+
+def test_recall_step_gets_only_relevant_memory(tmp_path):
+    plan = TaskPlan(steps=[
+        {"id": "db", "prompt": "design the sqlite database schema", "outputs": ["db"]},
+        {"id": "ui", "prompt": "design the react frontend", "outputs": ["ui"]},
+        {"id": "review", "prompt": "review: {memory}", "inputs": ["db", "ui"], "outputs": ["review"],
+         "recall": "database schema", "recall_k": 1},
+    ])
+    agent = EchoAgent()
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        outputs = DAGScheduler(plan, memory, lambda: agent, max_workers=2).run()
+
+    assert outputs["review"] == "<review: <design the sqlite database schema>>"
+
+
+def test_recalled_outputs_are_on_disk_once_checkpointed(tmp_path):
+    filename = str(tmp_path / "memory_db")
+    plan = TaskPlan(steps=[
+        {"id": "db", "prompt": "design the sqlite database schema", "outputs": ["db"]},
+        {"id": "review", "prompt": "review: {memory}", "outputs": ["review"], "recall": "database schema"},
+    ])
+    memory = ExternalMemory(filename)
+    DAGScheduler(plan, memory, EchoAgent).run()
+
+    # Opened without closing the first memory, as after a crash
+    with ExternalMemory(filename) as reopened:
+        assert "<design the sqlite database schema>" in reopened.recall("database schema").values()
+    memory.close()
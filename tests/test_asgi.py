@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from mock_openai import MockOpenAIServer
+
+from backend.asgi import create_asgi_app
+from utilities.admission import AdmissionQueue, Overloaded
+
+
+@pytest.fixture
+def mock_api():
+    with MockOpenAIServer(completion_tokens=4) as server:
+        yield server
+
+
+def make_app(mock_api, **config):
+    return create_asgi_app(dict({"OPENAI_API_KEY": "test", "OPENAI_BASE_URL": mock_api.base_url}, **config))
+
+
+def run(app, scenario):
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_prompt_and_history_round_trip(mock_api):
+    async def scenario(client):
+        conversation_id = (await client.post("/start-conversation")).json()["conversation_id"]
+        response = await client.post(f"/prompt/{conversation_id}", json={"prompt": "ping pong", "max_tokens": 3})
+        history = await client.get(f"/history/{conversation_id}")
+        return response, history
+
+    response, history = run(make_app(mock_api), scenario)
+
+    assert response.status_code == 200
+    assert response.json()["choices"] == [{"content": "ping pong ping"}]
+    assert history.json() == [
+        {"role": "user", "content": "ping pong"},
+        {"role": "assistant", "content": "ping pong ping"},
+    ]
+    assert mock_api.counters["requests"] == 1
+
+
+def test_streamed_prompt(mock_api):
+    async def scenario(client):
+        conversation_id = (await client.post("/start-conversation")).json()["conversation_id"]
+        response = await client.post(f"/prompt/{conversation_id}/stream", json={"prompt": "a b", "max_tokens": 10})
+        usage = (await client.get(f"/usage/{conversation_id}")).json()
+        return response, (await client.get(f"/history/{conversation_id}")).json(), usage, (await client.get("/metrics")).text
+
+    response, history, usage, metrics = run(make_app(mock_api), scenario)
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+    assert response.headers["content-type"] == "text/event-stream"
+    assert [event["delta"] for event in events[:-1]] == ["a", " b", " a", " b"]
+    assert events[-1] == {"response": "a b a b"}
+    assert history[-1] == {"role": "assistant", "content": "a b a b"}
+    assert usage["requests"] == 1 and usage["completion_tokens"] == 4
+    assert 'lmauto_upstream_tokens_total{model="gpt-4",kind="completion"} 4' in metrics
+
+
+def test_invalid_prompts_are_rejected(mock_api):
+    async def scenario(client):
+        conversation_id = (await client.post("/start-conversation")).json()["conversation_id"]
+        return (
+            await client.post("/prompt/missing", json={"prompt": "hi"}),
+            await client.post(f"/prompt/{conversation_id}", json={"max_tokens": 3}),
+            await client.post(f"/prompt/{conversation_id}", content=b"not json"),
+        )
+
+    missing, invalid, malformed = run(make_app(mock_api), scenario)
+
+    assert missing.status_code == 404
+    assert invalid.status_code == 400 and invalid.json()["error"][0]["loc"] == ["prompt"]
+    assert malformed.status_code == 400
+    assert mock_api.counters["requests"] == 0
+
+
+def test_load_beyond_the_queue_is_shed_with_503(mock_api):
+    mock_api.sample_latency = lambda: 0.3
+    app = make_app(mock_api, ASYNC_MAX_IN_FLIGHT=2, ASYNC_MAX_QUEUE=1)
+
+    async def scenario(client):
+        conversation_ids = [(await client.post("/start-conversation")).json()["conversation_id"] for _ in range(5)]
+        responses = await asyncio.gather(*(
+            client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 3})
+            for conversation_id in conversation_ids
+        ))
+        return responses, (await client.get("/admission/stats")).json(), (await client.get("/metrics")).text
+
+    responses, stats, metrics = run(app, scenario)
+
+    assert sorted(response.status_code for response in responses) == [200, 200, 200, 503, 503]
+    assert all(response.headers["retry-after"] == "1" for response in responses if response.status_code == 503)
+    assert stats == {"in_flight": 0, "queued": 0, "max_in_flight": 2, "max_queue": 1, "admitted": 3, "shed": 2}
+    assert 'lmauto_admission_total{kind="shed"} 2' in metrics
+    assert 'lmauto_http_requests_total{route="/prompt/<conversation_id>",method="POST",status="503"} 2' in metrics
+
+
+def test_burst_beyond_the_concurrency_limit_waits_for_slots(mock_api):
+    mock_api.sample_latency = lambda: 0.1
+    # An initial adaptive limit of 2 upstream calls
+    app = make_app(mock_api, UPSTREAM_MAX_CONCURRENCY=8)
+
+    async def scenario(client):
+        conversation_ids = [(await client.post("/start-conversation")).json()["conversation_id"] for _ in range(10)]
+        return await asyncio.gather(*(
+            client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 3})
+            for conversation_id in conversation_ids
+        ))
+
+    responses = run(app, scenario)
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert mock_api.counters["requests"] == 10
+
+
+def test_admission_queue_hands_slots_over_in_order_and_times_out():
+    async def scenario():
+        queue = AdmissionQueue(max_in_flight=1, max_queue=2, queue_timeout=0.05)
+        order = []
+
+        async def worker(name, hold):
+            async with queue.admit():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await queue.acquire()
+        waiting = [asyncio.ensure_future(worker(name, 0)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await queue.acquire()
+        queue.release()
+        await asyncio.gather(*waiting)
+
+        await queue.acquire()
+        with pytest.raises(Overloaded):
+            await queue.acquire()
+        return order, queue.stats()
+
+    order, stats = asyncio.run(scenario())
+
+    assert order == ["first", "second"]
+    assert stats["in_flight"] == 1 and stats["queued"] == 0 and stats["shed"] == 2
+
+
+def test_routing_options_the_async_mode_ignores_are_reported(mock_api, caplog):
+    routes = [{"model": "gpt-4o-mini"}, {"model": "gpt-4"}]
+    with caplog.at_level("WARNING", logger="backend.asgi"):
+        make_app(mock_api, MODEL_ROUTES=routes, COALESCE_PROMPTS=True)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("MODEL_ROUTES" in message and "gpt-4o-mini" in message for message in messages)
+    assert any("COALESCE_PROMPTS" in message for message in messages)
+
+
+def test_flask_routes_run_on_their_own_threads(mock_api):
+    app = make_app(mock_api)
+    threads = []
+
+    @app.flask_app.before_request
+    def record_thread():
+        threads.append(threading.current_thread().name)
+
+    run(app, lambda client: client.get("/"))
+
+    assert threads and threads[0].startswith("wsgi")
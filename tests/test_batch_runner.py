@@ -0,0 +1,90 @@
+import json
+
+from backend.batch_runner import Checkpoint, run_jsonl
+from models.llm_agent import PromptResponse
+
+
+class CountingAgent:
+    def __init__(self, crash_on=None):
+        self.crash_on = crash_on
+        self.prompts = []
+
+    def send_prompt_with_retry(self, request, max_retries=5):
+        if request.prompt == self.crash_on:
+            raise KeyboardInterrupt
+        self.prompts.append(request.prompt)
+        usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+        return PromptResponse(id="1", choices=[{"content": request.prompt.upper()}], usage=usage)
+
+
+def write_input(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": i, "prompt": f"p{i}", "max_tokens": 5}) + "\n")
+        f.write("\n")
+        f.write(json.dumps({"id": "bad", "prompt": "no max_tokens"}) + "\n")
+
+
+def read_output(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_every_line_is_processed_once(tmp_path):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_input(input_path, 50)
+
+    report = run_jsonl(str(input_path), str(output_path), CountingAgent(), max_concurrency=4)
+
+    records = read_output(output_path)
+    assert len(records) == 51
+    assert sorted(r["id"] for r in records if "response" in r) == list(range(50))
+    assert [r for r in records if r["id"] == "bad"][0]["error"][0]["loc"] == ["max_tokens"]
+    assert report["rows"] == 51 and report["errors"] == 1
+    assert report["tokens_per_second"] > 0
+
+
+def test_restart_skips_finished_lines(tmp_path):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_input(input_path, 50)
+
+    try:
+        run_jsonl(str(input_path), str(output_path), CountingAgent(crash_on="p30"), max_concurrency=1)
+    except KeyboardInterrupt:
+        pass
+    agent = CountingAgent()
+    run_jsonl(str(input_path), str(output_path), agent, max_concurrency=1)
+
+    assert agent.prompts[0] == "p30"
+    assert len(agent.prompts) == 20
+    assert Checkpoint(str(output_path) + ".checkpoint").watermark == input_path.stat().st_size
+
+
+def test_checkpoint_watermark_only_passes_contiguous_lines(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    checkpoint.mark_done(10, 20)
+    assert checkpoint.watermark == 0 and checkpoint.is_done(10)
+
+    checkpoint.mark_done(0, 10)
+    assert checkpoint.watermark == 20 and not checkpoint.done
+
+
+def test_records_written_after_the_last_checkpoint_are_not_repeated(tmp_path):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_input(input_path, 10)
+    try:
+        run_jsonl(str(input_path), str(output_path), CountingAgent(crash_on="p5"), max_concurrency=4)
+    except KeyboardInterrupt:
+        pass
+    # As if the crash came after records were written but before the checkpoint was saved,
+    # leaving a record cut short at the end
+    Checkpoint(str(output_path) + ".checkpoint").save()
+    with open(output_path, "a") as f:
+        f.write('{"offset": 0, "respo')
+
+    agent = CountingAgent()
+    run_jsonl(str(input_path), str(output_path), agent, max_concurrency=4)
+
+    records = [json.loads(line) for line in open(output_path) if line.endswith("}\n")]
+    assert sorted(r["id"] for r in records if "response" in r) == list(range(10))
+    assert "p0" not in agent.prompts
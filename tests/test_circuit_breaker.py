@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from mock_openai import MockOpenAIServer
+
+from backend.main import create_app
+from models.llm_agent import LLMAgent
+from models.schemas import PromptRequest
+from utilities.circuit_breaker import CircuitBreaker, CircuitOpen
+from utilities.concurrency_limiter import AdaptiveConcurrencyLimiter
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_when_half_open():
+    breaker = CircuitBreaker("gpt-4", consecutive_failures=3, reset_timeout=0.05)
+    for _ in range(3):
+        breaker.record(True, breaker.before_call())
+
+    assert breaker.stats()["state"] == "open"
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_call()
+    assert 0 < raised.value.retry_after <= 0.05
+
+    time.sleep(0.06)
+    assert breaker.stats()["state"] == "half_open"
+    probe = breaker.before_call()
+    assert probe
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record(True, probe)
+    assert breaker.stats()["state"] == "open" and breaker.stats()["times_opened"] == 2
+
+    time.sleep(0.06)
+    breaker.record(False, breaker.before_call())
+    assert breaker.stats()["state"] == "closed"
+
+
+def test_breaker_opens_on_error_rate_and_ignores_cancelled_calls():
+    breaker = CircuitBreaker(consecutive_failures=100, error_rate=0.5, window=10, min_calls=10)
+    for failed in [True, False] * 4 + [None, None, False]:
+        breaker.record(failed, breaker.before_call())
+    assert breaker.stats()["state"] == "closed"
+
+    breaker.record(True, breaker.before_call())
+    assert breaker.stats()["state"] == "open"
+
+
+def test_failing_upstream_opens_the_agents_circuit():
+    with MockOpenAIServer(completion_tokens=2, error_rate=1.0) as mock_api:
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+        agent = LLMAgent(
+            api_key="test", base_url=mock_api.base_url, concurrency_limiter=limiter,
+            circuit_breaker=CircuitBreaker("gpt-4", consecutive_failures=2, reset_timeout=60), max_retries=0,
+        )
+        request = PromptRequest(prompt="hi", max_tokens=2)
+        for _ in range(2):
+            with pytest.raises(Exception):
+                agent.send_prompt(request)
+        with pytest.raises(CircuitOpen):
+            agent.send_prompt(request)
+        with pytest.raises(CircuitOpen):
+            list(agent.send_prompt_stream(request))
+
+        assert mock_api.counters["requests"] == 2
+        assert not agent.available()
+        stats = agent.upstream_stats()["gpt-4"]
+        assert stats["circuit"]["state"] == "open" and stats["circuit"]["rejected"] == 2
+        assert stats["concurrency"]["limit"] < 8 and stats["concurrency"]["in_flight"] == 0
+
+
+def test_prompt_route_fails_fast_with_503_while_the_circuit_is_open():
+    with MockOpenAIServer(completion_tokens=2, error_rate=1.0) as mock_api:
+        app = create_app({"OPENAI_API_KEY": "test", "OPENAI_BASE_URL": mock_api.base_url, "CIRCUIT_FAILURE_THRESHOLD": 3})
+        client = app.test_client()
+        conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+
+        failed = client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 2})
+        shed = client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 2})
+        stats = client.get("/upstream/stats").get_json()
+
+    assert failed.status_code == 500
+    assert shed.status_code == 503 and int(shed.headers["Retry-After"]) >= 1
+    assert stats["gpt-4"]["circuit"]["state"] == "open"
+    # The first prompt and its two retries
+    assert mock_api.counters["requests"] == 3
+    assert 'lmauto_upstream_circuit_state{model="gpt-4",state="open"} 1' in client.get("/metrics").get_data(as_text=True)
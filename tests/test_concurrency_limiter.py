@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import pytest
+
+from utilities.admission import Overloaded
+from utilities.concurrency_limiter import AdaptiveConcurrencyLimiter
+
+
+def test_limit_grows_additively_while_used_and_is_capped():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=6)
+    for _ in range(40):
+        for _ in range(4):
+            limiter.acquire()
+        for _ in range(4):
+            limiter.release(0.1)
+
+    assert limiter.stats()["limit"] == 6
+
+
+def test_idle_limit_does_not_grow():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10)
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(0.1)
+
+    assert limiter.stats()["limit"] == 10
+
+
+def test_overload_cuts_the_limit_multiplicatively_but_slow_calls_do_not():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=20, min_limit=2, backoff=0.5)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(0.1)
+
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.stats()["limit"] == 10
+
+    # A long answer is slow by nature
+    limiter.acquire()
+    limiter.release(30.0)
+    assert limiter.stats()["limit"] == 10
+
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert limiter.stats() == pytest.approx(dict(limiter.stats(), limit=2, decreases=6))
+
+
+def test_calls_already_in_flight_do_not_cut_the_limit_again():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, backoff=0.5)
+    starts = []
+    for _ in range(3):
+        limiter.acquire()
+        starts.append(0.0)
+    for started in starts:
+        limiter.release(overloaded=True, started=started)
+
+    assert limiter.stats()["limit"] == 4 and limiter.stats()["decreases"] == 1
+
+
+def test_callers_beyond_the_limit_wait_then_are_rejected():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, acquire_timeout=0.05)
+    limiter.acquire()
+    assert not limiter.try_acquire()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+
+    released = threading.Timer(0.01, limiter.release)
+    limiter.acquire_timeout = 1.0
+    released.start()
+    limiter.acquire()
+    released.join()
+    assert limiter.stats()["in_flight"] == 1 and limiter.stats()["rejected"] == 2
+
+
+def test_async_callers_wait_for_a_slot_released_by_a_thread():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, acquire_timeout=5)
+    limiter.acquire()
+
+    async def main():
+        threading.Timer(0.05, limiter.release).start()
+        await limiter.acquire_async()
+
+    asyncio.run(main())
+    assert limiter.stats()["in_flight"] == 1 and limiter.stats()["rejected"] == 0
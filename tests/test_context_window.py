@@ -0,0 +1,168 @@
+import tracemalloc
+
+from models.context_window import LAST_TURNS, SUMMARY, ContextManager, context_limit, count_tokens
+from utilities.conversation_store import InMemoryConversationStore
+
+
+def add_turns(store, conversation_id, turns, size=40):
+    for i in range(turns):
+        store.append(conversation_id, {"role": "user", "content": f"q{i} " + "x" * size})
+        store.append(conversation_id, {"role": "assistant", "content": f"a{i} " + "y" * size})
+
+
+def test_context_limit_matches_dated_models():
+    assert context_limit("gpt-4") == 8192
+    assert context_limit("gpt-4-0613") == 8192
+    assert context_limit("gpt-4-32k-0613") == 32768
+    assert context_limit("unknown-model") == 8192
+
+
+def test_sliding_window_keeps_newest_messages_within_budget():
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    add_turns(store, conversation_id, 50)
+    manager = ContextManager(store, budgets={"gpt-4": 400}, reserve_tokens=0)
+
+    messages = manager.build(conversation_id, "gpt-4")
+
+    assert messages[-1]["content"].startswith("a49")
+    assert sum(count_tokens(m) for m in messages) <= 400
+    assert len(messages) < 100
+
+
+def test_system_message_is_pinned():
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    store.append(conversation_id, {"role": "system", "content": "You are a coder."})
+    add_turns(store, conversation_id, 50)
+    manager = ContextManager(store, budgets={"gpt-4": 400}, reserve_tokens=0)
+
+    messages = manager.build(conversation_id, "gpt-4")
+
+    assert messages[0] == {"role": "system", "content": "You are a coder."}
+
+
+def test_last_turns_strategy():
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    add_turns(store, conversation_id, 10)
+    manager = ContextManager(store, strategy=LAST_TURNS, max_turns=3)
+
+    messages = manager.build(conversation_id, "gpt-4")
+
+    assert [m["content"][:2] for m in messages] == ["q7", "a7", "q8", "a8", "q9", "a9"]
+
+
+def test_summary_strategy_folds_evicted_messages_once():
+    calls = []
+
+    def summarize(previous, evicted):
+        calls.append(len(evicted))
+        return f"{previous}+{len(evicted)}"
+
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    manager = ContextManager(store, strategy=SUMMARY, summarizer=summarize, budgets={"gpt-4": 300}, reserve_tokens=0)
+    for i in range(20):
+        add_turns(store, conversation_id, 1)
+        messages = manager.build(conversation_id, "gpt-4")
+
+    assert messages[0]["role"] == "system"
+    assert messages[0]["content"].startswith("+")
+    # Every message is summarized at most once
+    assert sum(calls) <= 40
+
+
+def test_only_new_messages_are_read_from_the_store():
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    add_turns(store, conversation_id, 500)
+    manager = ContextManager(store)
+    manager.build(conversation_id, "gpt-4")
+
+    reads = []
+    get_stored_messages = store.get_stored_messages
+    store.get_stored_messages = lambda cid, start=0: reads.append(start) or get_stored_messages(cid, start)
+    add_turns(store, conversation_id, 1)
+    manager.build(conversation_id, "gpt-4")
+
+    assert reads == [1000]
+
+
+def test_messages_outside_the_reserve_are_summarized():
+    summarized = []
+
+    def summarize(previous, evicted):
+        summarized.extend(m["content"].split()[0] for m in evicted)
+        return "summary"
+
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    add_turns(store, conversation_id, 30)
+    manager = ContextManager(store, strategy=SUMMARY, summarizer=summarize, budgets={"gpt-4": 1000}, reserve_tokens=600)
+
+    messages = manager.build(conversation_id, "gpt-4")
+
+    sent = [m["content"].split()[0] for m in messages[1:]]
+    assert sorted(summarized + sent) == sorted(f"{r}{i}" for i in range(30) for r in "qa")
+    assert summarized
+    assert sum(count_tokens(m) for m in messages) <= 400
+
+
+def test_rebuilt_window_summarizes_in_calls_that_fit_the_budget():
+    calls = []
+
+    def summarize(previous, evicted):
+        calls.append(sum(count_tokens(m) for m in evicted))
+        return f"{previous}+{len(evicted)}"
+
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    add_turns(store, conversation_id, 100)
+    manager = ContextManager(store, strategy=SUMMARY, summarizer=summarize, budgets={"gpt-4": 400}, reserve_tokens=0)
+
+    manager.build(conversation_id, "gpt-4")
+
+    assert len(calls) > 1
+    assert max(calls) <= 400
+
+
+def test_a_large_max_tokens_does_not_shrink_later_prompts():
+    store = InMemoryConversationStore()
+    conversation_id = store.create()
+    add_turns(store, conversation_id, 20)
+    manager = ContextManager(store, budgets={"gpt-4": 1000}, reserve_tokens=0)
+
+    small = manager.build(conversation_id, "gpt-4", max_tokens=100)
+    large = manager.build(conversation_id, "gpt-4", max_tokens=900)
+    small_again = manager.build(conversation_id, "gpt-4", max_tokens=100)
+    fresh = ContextManager(store, budgets={"gpt-4": 1000}, reserve_tokens=0).build(conversation_id, "gpt-4", max_tokens=100)
+
+    assert len(large) < len(small)
+    assert small_again == small == fresh
+
+
+def test_windows_share_message_bodies_with_the_store():
+    store = InMemoryConversationStore(shared_min_chars=100)
+    system_prompt = "You are a careful reviewer. " * 40
+    code = "```python\n" + "print('hello')\n" * 200 + "```"
+    conversation_ids = [store.create() for _ in range(200)]
+    for i, conversation_id in enumerate(conversation_ids):
+        store.append(conversation_id, {"role": "system", "content": system_prompt})
+        for turn in range(5):
+            store.append(conversation_id, {"role": "user", "content": f"Why does this fail? {i} {turn}\n{code}"})
+            store.append(conversation_id, {"role": "assistant", "content": f"Answer {turn}"})
+    manager = ContextManager(store)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for conversation_id in conversation_ids:
+            messages = manager.build(conversation_id, "gpt-4")
+        windows = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    assert messages[-2]["content"].endswith(code)
+    # The windows keep the store's messages and their token counts, not copies of every code block
+    assert windows < 200 * 5 * len(code) / 4
@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+from utilities.conversation_store import InMemoryConversationStore, SQLiteConversationStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryConversationStore()
+    return SQLiteConversationStore(str(tmp_path / "conversations.db"))
+
+
+def test_append_and_read_back(store):
+    conversation_id = store.create()
+    store.append(conversation_id, {"role": "user", "content": "hi"})
+    store.append(conversation_id, {"role": "assistant", "content": "hello"})
+
+    assert store.exists(conversation_id)
+    assert store.get_messages(conversation_id) == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+    ]
+
+
+def test_unknown_conversation(store):
+    assert not store.exists("missing")
+    with pytest.raises(KeyError):
+        store.append("missing", {"role": "user", "content": "hi"})
+    with pytest.raises(KeyError):
+        store.get_messages("missing")
+
+
+def test_delete(store):
+    conversation_id = store.create()
+    store.delete(conversation_id)
+    assert not store.exists(conversation_id)
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    conversation_id = SQLiteConversationStore(path).create()
+    SQLiteConversationStore(path).append(conversation_id, {"role": "user", "content": "hi"})
+
+    assert SQLiteConversationStore(path).get_messages(conversation_id) == [{"role": "user", "content": "hi"}]
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = InMemoryConversationStore(max_conversations=2)
+    first, second = store.create(), store.create()
+    store.exists(first)
+    third = store.create()
+
+    assert store.exists(first) and store.exists(third)
+    assert not store.exists(second)
+    assert store.evictions == 1
+
+
+def test_memory_store_respects_byte_cap():
+    store = InMemoryConversationStore(max_bytes=1000)
+    old = store.create()
+    store.append(old, {"role": "user", "content": "x" * 600})
+    new = store.create()
+    store.append(new, {"role": "user", "content": "y" * 600})
+
+    assert not store.exists(old)
+    assert store.exists(new)
+
+
+def test_memory_store_keeps_the_conversation_appended_to():
+    store = InMemoryConversationStore(max_bytes=1000)
+    conversation_id = store.create()
+    store.append(conversation_id, {"role": "user", "content": "x" * 1200})
+    store.append(conversation_id, {"role": "assistant", "content": "ok"})
+
+    assert store.count(conversation_id) == 2
+    assert store.evictions == 0
+
+
+def test_idle_conversations_expire(tmp_path):
+    for store in (InMemoryConversationStore(ttl=0.01), SQLiteConversationStore(str(tmp_path / "c.db"), ttl=0.01)):
+        conversation_id = store.create()
+        time.sleep(0.02)
+        assert not store.exists(conversation_id)
+
+
+def test_get_messages_limit(store):
+    conversation_id = store.create()
+    for i in range(5):
+        store.append(conversation_id, {"role": "user", "content": str(i)})
+
+    assert [m["content"] for m in store.get_messages(conversation_id, start=1, limit=2)] == ["1", "2"]
+    assert [m["content"] for m in store.get_messages(conversation_id, start=4, limit=10)] == ["4"]
+
+
+def test_memory_store_shares_large_bodies_across_conversations():
+    store = InMemoryConversationStore(shared_min_chars=100)
+    system_prompt = "You are a careful reviewer. " * 20
+    code = "```python\n" + "print('hello')\n" * 20 + "```"
+    first, second = store.create(), store.create()
+    for conversation_id in (first, second):
+        store.append(conversation_id, {"role": "system", "content": system_prompt})
+        store.append(conversation_id, {"role": "user", "content": f"Why does this fail?\n{code}\nThanks", "name": "dev"})
+
+    stats = store.stats()
+    assert stats["shared_bodies"] == 2 and stats["shared_references"] == 4
+    assert stats["shared_bytes"] == len(system_prompt) + len(code)
+    assert store.get_messages(second) == [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Why does this fail?\n{code}\nThanks", "name": "dev"},
+    ]
+
+    store.delete(first)
+    assert store.stats()["shared_references"] == 2
+    store.delete(second)
+    assert store.stats() == {"conversations": 0, "bytes": 0, "shared_bodies": 0, "shared_bytes": 0, "shared_references": 0}
+
+
+def test_memory_store_counts_shared_bodies_once_against_byte_cap():
+    store = InMemoryConversationStore(max_bytes=5000, shared_min_chars=100)
+    body = "x" * 3000
+    conversation_ids = [store.create() for _ in range(10)]
+    for conversation_id in conversation_ids:
+        store.append(conversation_id, {"role": "user", "content": body})
+
+    assert all(store.exists(conversation_id) for conversation_id in conversation_ids)
+    assert store.stats()["bytes"] == 3000 + 10 * 64
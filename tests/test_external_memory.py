@@ -0,0 +1,57 @@
+import threading
+
+from utilities.external_memory import ExternalMemory
+
+
+def test_save_and_retrieve_round_trip(tmp_path):
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        memory.save_data("task", {"step": 1, "files": ["a.py"]})
+
+        assert memory.retrieve_data("task") == {"step": 1, "files": ["a.py"]}
+        assert memory.retrieve_data("missing") is None
+
+
+def test_bulk_operations_cover_every_key(tmp_path):
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        memory.save_many({f"key-{i}": i for i in range(1200)})
+
+        found = memory.retrieve_many([f"key-{i}" for i in range(1200)] + ["missing"])
+
+    assert len(found) == 1201
+    assert found["key-1199"] == 1199
+    assert found["missing"] is None
+
+
+def test_data_persists_across_instances(tmp_path):
+    filename = str(tmp_path / "memory_db")
+    with ExternalMemory(filename) as memory:
+        memory.save_data("key", "value")
+
+    with ExternalMemory(filename) as memory:
+        assert memory.retrieve_data("key") == "value"
+
+
+def test_concurrent_readers_and_writer(tmp_path):
+    errors = []
+    with ExternalMemory(str(tmp_path / "memory_db")) as memory:
+        memory.save_data("shared", 0)
+
+        def write():
+            for i in range(200):
+                memory.save_data("shared", i)
+
+        def read():
+            try:
+                for _ in range(200):
+                    assert memory.retrieve_data("shared") in range(200)
+            except AssertionError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert memory.retrieve_data("shared") == 199
+    assert not errors
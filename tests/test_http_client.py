@@ -0,0 +1,72 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from models import http_client
+from models.http_client import HTTPPoolConfig, get_http_client, pool_stats
+from models.llm_agent import LLMAgent
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_agents_share_one_client():
+    first, second = LLMAgent(api_key="a"), LLMAgent(api_key="b")
+    assert first.client._client is second.client._client is get_http_client()
+
+
+def test_connections_are_reused_and_counted(server):
+    before = pool_stats()
+    client = get_http_client()
+    for _ in range(5):
+        assert client.get(server).text == "ok"
+
+    stats = pool_stats()
+    assert stats["requests"] - before["requests"] == 5
+    assert stats["connections_opened"] - before["connections_opened"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["connections_idle"] >= 1
+
+
+def test_streamed_response_is_in_flight_until_closed(server):
+    before = pool_stats()["in_flight"]
+    with get_http_client().stream("GET", server) as response:
+        assert pool_stats()["in_flight"] == before + 1
+        assert response.read() == b"ok"
+    assert pool_stats()["in_flight"] == before
+
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv("OPENAI_HTTP_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("OPENAI_HTTP_HTTP2", "false")
+
+    config = HTTPPoolConfig.from_env()
+
+    assert config.max_connections == 7
+    assert config.http2 is False
+
+
+def test_configure_after_first_use_is_rejected():
+    get_http_client()
+    with pytest.raises(RuntimeError):
+        http_client.configure(HTTPPoolConfig())
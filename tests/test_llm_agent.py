@@ -0,0 +1,209 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from models.llm_agent import LLMAgent, PromptRequest, RequestCancelled
+from utilities.response_cache import ResponseCache
+from utilities.single_flight import SingleFlight
+
+
+class FakeStream:
+    def __init__(self, deltas):
+        self.chunks = [SimpleNamespace(id="cmpl-1", choices=[SimpleNamespace(delta=SimpleNamespace(content=d))]) for d in deltas]
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            return self.stream
+        message = SimpleNamespace(content="hello world")
+        return SimpleNamespace(id="cmpl-1", choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def make_agent(completions, cache=None, single_flight=None):
+    agent = LLMAgent(api_key="test-key", cache=cache, single_flight=single_flight)
+    agent.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return agent
+
+
+def test_send_prompt_uses_history():
+    completions = FakeCompletions()
+    agent = make_agent(completions)
+    history = [{"role": "user", "content": "hi"}]
+
+    response = agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10), history)
+
+    assert response.response == "hello world"
+    assert completions.calls[0]["messages"] == history
+
+
+def test_send_prompt_stream_yields_deltas_and_closes():
+    stream = FakeStream(["hel", None, "lo"])
+    agent = make_agent(FakeCompletions(stream))
+
+    deltas = list(agent.send_prompt_stream(PromptRequest(prompt="hi", max_tokens=10)))
+
+    assert deltas == ["hel", "lo"]
+    assert stream.closed
+
+
+def test_send_prompt_stream_closes_on_early_exit():
+    stream = FakeStream(["a", "b", "c"])
+    agent = make_agent(FakeCompletions(stream))
+
+    deltas = agent.send_prompt_stream(PromptRequest(prompt="hi", max_tokens=10))
+    assert next(deltas) == "a"
+    deltas.close()
+
+    assert stream.closed
+
+
+def test_send_prompt_serves_deterministic_requests_from_cache(tmp_path):
+    completions = FakeCompletions()
+    agent = make_agent(completions, ResponseCache(directory=str(tmp_path)))
+    request = PromptRequest(prompt="hi", max_tokens=10, temperature=0)
+
+    first = agent.send_prompt(request)
+    second = agent.send_prompt(request)
+
+    assert first == second
+    assert len(completions.calls) == 1
+    assert agent.cache.stats()["memory_hits"] == 1
+
+
+def test_send_prompt_skips_cache_for_sampled_requests_unless_opted_in(tmp_path):
+    completions = FakeCompletions()
+    agent = make_agent(completions, ResponseCache(directory=str(tmp_path)))
+
+    agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10, temperature=0.7))
+    agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10, temperature=0.7))
+    assert len(completions.calls) == 2
+
+    agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10, temperature=0.7, cache=True))
+    agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10, temperature=0.7, cache=True))
+    assert len(completions.calls) == 3
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after": "0"})
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class FlakyCompletions(FakeCompletions):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if prompt == "bad":
+            raise ValueError("bad prompt")
+        if self.failures.get(prompt, 0) > 0:
+            self.failures[prompt] -= 1
+            raise rate_limit_error()
+        return super().create(**kwargs)
+
+
+def test_send_prompt_and_streams_retry_transient_errors():
+    completions = FlakyCompletions({"hi": 2, "stream": 1})
+    completions.stream = FakeStream(["a", "b"])
+    agent = make_agent(completions)
+
+    response = agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10))
+    deltas = list(agent.send_prompt_stream(PromptRequest(prompt="stream", max_tokens=10)))
+
+    assert response.response == "hello world"
+    assert deltas == ["a", "b"]
+    assert len(completions.calls) == 2
+
+
+def test_send_batch_keeps_order_and_reports_item_errors():
+    completions = FlakyCompletions({"p1": 2})
+    agent = make_agent(completions)
+    requests = [PromptRequest(prompt=p, max_tokens=10) for p in ("p0", "p1", "bad", "p3")]
+
+    results = agent.send_batch(requests, max_concurrency=2)
+
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert results[1].response.response == "hello world"
+    assert results[2].response is None and results[2].error == "bad prompt"
+    # p1 was retried after two 429s
+    assert completions.failures["p1"] == 0
+    assert len(completions.calls) == 3
+
+
+def test_send_batch_gives_up_after_max_retries():
+    agent = make_agent(FlakyCompletions({"p0": 5}))
+
+    results = agent.send_batch([PromptRequest(prompt="p0", max_tokens=10)], max_retries=1)
+
+    assert results[0].error == "rate limited"
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    class SlowCompletions(FakeCompletions):
+        def create(self, **kwargs):
+            time.sleep(0.1)
+            return super().create(**kwargs)
+
+    completions = SlowCompletions()
+    flight = SingleFlight()
+    agents = [make_agent(completions, single_flight=flight) for _ in range(2)]
+    request = PromptRequest(prompt="hi", max_tokens=10, temperature=0.7)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda i: agents[i % 2].send_prompt(request), range(4)))
+
+    assert [response.response for response in responses] == ["hello world"] * 4
+    assert len(completions.calls) == 1
+    assert flight.stats()["joins"] == 3
+
+
+
+def test_cancelled_prompt_closes_its_stream():
+    cancel = threading.Event()
+
+    class CancellingStream(FakeStream):
+        def __iter__(self):
+            for chunk in self.chunks:
+                yield chunk
+                cancel.set()
+
+    stream = CancellingStream(["a", "b"])
+    agent = make_agent(FakeCompletions(stream))
+
+    with pytest.raises(RequestCancelled):
+        agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10), cancel=cancel)
+    assert stream.closed
+
+
+def test_cancellable_prompt_reports_the_streamed_usage():
+    stream = FakeStream(["a", "b"])
+    usage = SimpleNamespace(dict=lambda: {"prompt_tokens": 2, "completion_tokens": 2, "total_tokens": 4})
+    stream.chunks.append(SimpleNamespace(id="cmpl-1", choices=[], usage=usage))
+    completions = FakeCompletions(stream)
+    agent = make_agent(completions)
+
+    response = agent.send_prompt(PromptRequest(prompt="hi", max_tokens=10), cancel=threading.Event())
+
+    assert response.response == "ab"
+    assert response.usage["total_tokens"] == 4
+    assert completions.calls[0]["stream_options"] == {"include_usage": True}
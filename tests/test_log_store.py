@@ -0,0 +1,105 @@
+import os
+import threading
+
+from utilities.external_memory import ExternalMemory
+from utilities.log_store import LogStore
+
+
+def test_values_survive_reopen_with_overwrites_and_deletes(tmp_path):
+    path = str(tmp_path / "store.log")
+    store = LogStore(path)
+    store.put_many([("a", 1), ("b", {"x": [1, 2]}), ("c", "three")])
+    store.put_many([("a", "one")])
+    store.delete_many(["c", "missing"])
+    assert store.get_many(["a", "b", "c"]) == {"a": "one", "b": {"x": [1, 2]}}
+    store.close()
+
+    reopened = LogStore(path)
+    assert reopened.get_many(["a", "b", "c"]) == {"a": "one", "b": {"x": [1, 2]}}
+    assert reopened.stats()["keys"] == 2
+    reopened.close()
+
+
+def test_torn_write_is_discarded_on_open(tmp_path):
+    path = str(tmp_path / "store.log")
+    store = LogStore(path)
+    store.put_many([("kept", 1)])
+    store.close()
+    intact = os.path.getsize(path)
+
+    # A batch cut off before its commit record, as left by a crash mid-write
+    store = LogStore(path)
+    store.put_many([("lost", 2), ("also lost", 3)])
+    store.close()
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    reopened = LogStore(path)
+    assert reopened.get_many(["kept", "lost", "also lost"]) == {"kept": 1}
+    assert os.path.getsize(path) == intact
+    reopened.put_many([("after", 4)])
+    reopened.close()
+
+    with open(path, "ab") as f:
+        f.write(b"\x00garbage")
+    assert LogStore(path).get_many(["kept", "after"]) == {"kept": 1, "after": 4}
+
+
+def test_compaction_drops_dead_records(tmp_path):
+    path = str(tmp_path / "store.log")
+    store = LogStore(path, compact_min_bytes=0)
+    store.put_many([(f"key{i}", "x" * 100) for i in range(50)])
+    grown = store.stats()["file_bytes"]
+    for round_ in range(10):
+        store.put_many([(f"key{i}", f"value {round_}") for i in range(50)])
+    store.delete_many([f"key{i}" for i in range(25, 50)])
+    store.close()
+
+    assert store.compactions >= 1
+    reopened = LogStore(path)
+    assert reopened.get_many([f"key{i}" for i in range(50)]) == {f"key{i}": "value 9" for i in range(25)}
+    reopened.compact()
+    assert os.path.getsize(path) < grown
+    assert reopened.stats()["dead_bytes"] == reopened.stats()["file_bytes"] - reopened.stats()["live_bytes"]
+    reopened.close()
+
+
+def test_writes_made_during_compaction_are_kept(tmp_path):
+    path = str(tmp_path / "store.log")
+    store = LogStore(path)
+    store.put_many([(f"key{i}", i) for i in range(200)])
+    store.put_many([(f"key{i}", -i) for i in range(200)])
+
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        n = 0
+        while not stop.is_set() or n < 50:
+            store.put_many([(f"new{n}", n)])
+            written.append(n)
+            n += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    for _ in range(3):
+        store.compact()
+    stop.set()
+    thread.join()
+
+    expected = {f"new{n}": n for n in written}
+    expected.update({f"key{i}": -i for i in range(200)})
+    assert store.get_many(list(expected)) == expected
+    store.close()
+    assert LogStore(path).get_many(list(expected)) == expected
+
+
+def test_external_memory_with_log_engine(tmp_path):
+    filename = str(tmp_path / "memory")
+    with ExternalMemory(filename, engine="log") as memory:
+        memory.save_many({"a": 1, "b": 2})
+        memory.delete_many(["b"])
+    assert os.path.exists(f"{filename}.log")
+
+    with ExternalMemory(filename, engine="log") as memory:
+        assert memory.retrieve_many(["a", "b"]) == {"a": 1, "b": None}
@@ -1,87 +1,87 @@
-import logging
+import json
 import os
 import sys
-import uuid
-from typing import Dict, List
-
-from dotenv import load_dotenv
-from flask import Flask, jsonify, request
-from pydantic import ValidationError
-
-# Adjust the Python module search path to correctly point to the project root directory
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
-from backend.models.llm_agent import LLMAgent, PromptRequest
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)  # Changed to DEBUG for detailed logging
-
-# Load environment variables
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set in the environment variables.")  # Ensure your OPENAI_API_KEY is set in the .env file.
-
-# Initialize Flask app
-app = Flask(__name__)
-
-# Initialize the LLM agent
-agent = LLMAgent(api_key=OPENAI_API_KEY, model="gpt-4")
-
-# In-memory storage for conversation history (replace with a database for production)
-conversations: Dict[str, List[Dict]] = {}
-
-@app.route('/')
-def hello_world():
-    app.logger.info("Hello world endpoint called.")
-    return 'Hello, LMAuto!'
-
-@app.route('/start-conversation', methods=['POST'])
-def start_conversation():
-    conversation_id = str(uuid.uuid4())
-    conversations[conversation_id] = []
-    app.logger.info(f"Started new conversation with ID: {conversation_id}")
-    return jsonify({"conversation_id": conversation_id}), 201
-
-@app.route('/prompt/<conversation_id>', methods=['POST'])
-def send_prompt(conversation_id: str):
-    if conversation_id not in conversations:
-        app.logger.error(f"Invalid conversation ID: {conversation_id}")
-        return jsonify({"error": "Invalid conversation ID"}), 404
-
-    try:
-        prompt_data = request.get_json()
-        prompt_request = PromptRequest(**prompt_data)
-
-        # Add prompt to conversation history
-        conversations[conversation_id].append({"role": "user", "content": prompt_request.prompt})
-
-        response = agent.send_prompt(prompt_request, conversations[conversation_id])
-
-        # Add response to conversation history
-        conversations[conversation_id].append({"role": "assistant", "content": response.response})
-
-        app.logger.info(f"Prompt sent successfully in conversation {conversation_id}")
-        return jsonify(response.dict()), 200
-
-    except ValidationError as e:
-        app.logger.error(f"Validation error on prompt data: {e.errors()}", exc_info=True)
-        return jsonify({"error": e.errors()}), 400
-    except Exception as e:
-        app.logger.error(f"Failed to send prompt in conversation {conversation_id}: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/history/<conversation_id>', methods=['GET'])
-def get_conversation_history(conversation_id: str):
-    if conversation_id not in conversations:
-        app.logger.error(f"Invalid conversation ID: {conversation_id}")
-        return jsonify({"error": "Invalid conversation ID"}), 404
-    app.logger.info(f"Retrieving conversation history for ID: {conversation_id}")
-    return jsonify(conversations[conversation_id]), 200
-
-if __name__ == '__main__':
-    try:
-        app.run(port=8000)
-        app.logger.info("Flask server started successfully on port 8000")
-    except Exception as e:
-        app.logger.error(f"Failed to start the Flask application: {e}", exc_info=True)
\ No newline at end of file
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import load
+from mock_openai import MockOpenAIServer
+
+from backend.main import create_app
+
+
+@pytest.fixture
+def mock_api():
+    with MockOpenAIServer(completion_tokens=4) as server:
+        yield server
+
+
+def make_client(mock_api):
+    app = create_app({"OPENAI_API_KEY": "test", "OPENAI_BASE_URL": mock_api.base_url})
+    return app.test_client()
+
+
+def test_conversation_round_trip_through_the_api(mock_api):
+    client = make_client(mock_api)
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+
+    response = client.post(f"/prompt/{conversation_id}", json={"prompt": "ping pong", "max_tokens": 3})
+
+    assert response.status_code == 200
+    assert response.get_json()["choices"] == [{"content": "ping pong ping"}]
+    assert response.get_json()["usage"]["completion_tokens"] == 3
+    assert client.get(f"/history/{conversation_id}").get_json() == [
+        {"role": "user", "content": "ping pong"},
+        {"role": "assistant", "content": "ping pong ping"},
+    ]
+    assert mock_api.counters["requests"] == 1
+
+
+def test_streamed_prompt_through_the_api(mock_api):
+    client = make_client(mock_api)
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+
+    response = client.post(f"/prompt/{conversation_id}/stream", json={"prompt": "a b", "max_tokens": 10})
+    events = [json.loads(line[len("data: "):]) for line in response.get_data(as_text=True).splitlines()
+              if line.startswith("data: ")]
+
+    assert [event["delta"] for event in events[:-1] if event.get("delta")] == ["a", " b", " a", " b"]
+    assert events[-1] == {"response": "a b a b"}
+    assert mock_api.counters["streams"] == 1
+    usage = client.get(f"/usage/{conversation_id}").get_json()
+    assert usage["requests"] == 1 and usage["completion_tokens"] == 4
+    assert 'lmauto_upstream_tokens_total{model="gpt-4",kind="completion"} 4' in client.get("/metrics").get_data(as_text=True)
+
+
+def test_rate_limited_prompt_is_retried_then_reported(mock_api):
+    mock_api.rate_limit_rate = 1.0
+    client = make_client(mock_api)
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+
+    response = client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 3})
+
+    assert response.status_code == 500
+    # The agent's two retries, each through the rate limiter; the OpenAI client itself does not retry
+    assert mock_api.counters["rate_limited"] == 3
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert load.percentile(values, 50) == 50
+    assert load.percentile(values, 99) == 99
+    assert load.percentile([0.3], 95) == 0.3
+    assert load.percentile([], 50) == 0.0
+
+
+def test_load_level_reports_every_route(mock_api):
+    with load.local_app(mock_api) as target:
+        level = load.run_level(target, concurrency=2, users=3, turns=2, prompt="hi", max_tokens=2)
+
+    routes = level["routes"]
+    assert routes["start-conversation"]["requests"] == 3
+    assert routes["prompt"]["requests"] == routes["history"]["requests"] == 6
+    assert all(summary["errors"] == 0 for summary in routes.values())
+    assert routes["prompt"]["p50_ms"] <= routes["prompt"]["p99_ms"]
+    assert load.compare({"levels": [level]}, {"levels": [level]})
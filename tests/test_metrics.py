@@ -0,0 +1,43 @@
+from utilities.metrics import MetricsRegistry, TokenUsage
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, route="/a")
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP latency_seconds Latency.", "# TYPE latency_seconds histogram"]
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 3.65' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+
+
+def test_counter_and_gauge_labels_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter("calls_total", "Calls.", ("name",))
+    gauge = registry.gauge("in_flight", "In flight.")
+    counter.inc(name='say "hi"')
+    counter.inc(2, name='say "hi"')
+    with gauge.track_inprogress():
+        assert gauge.get() == 1
+
+    body = registry.render()
+
+    assert 'calls_total{name="say \\"hi\\""} 3' in body
+    assert "in_flight 0" in body
+
+
+def test_token_usage_keeps_recent_conversations():
+    usage = TokenUsage(max_conversations=2)
+    usage.add("a", 10, 5)
+    usage.add("b", 1, 1)
+    usage.add("a", 10, 5)
+    usage.add("c", 1, 1)
+
+    assert usage.get("a") == {"prompt_tokens": 20, "completion_tokens": 10, "requests": 2}
+    assert usage.get("b") is None
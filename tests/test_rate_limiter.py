@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from utilities.rate_limiter import RateLimiter, TokenBucket, backoff_delay
+
+
+def test_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(per_minute=60)
+    now = time.monotonic()
+
+    assert bucket.reserve(60, now) == 0
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+    assert bucket.reserve(1, now + 1.0) == pytest.approx(1.0)
+
+
+def test_oversized_reservation_is_capped_to_capacity():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(1000, time.monotonic()) == 0
+
+
+def test_limiter_waits_for_the_tighter_budget(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)
+
+    limiter.acquire(tokens=60)
+    limiter.acquire(tokens=30)
+
+    assert len(sleeps) == 1
+    assert 29 < sleeps[0] <= 30
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=0.5, cap=4) <= 4
@@ -0,0 +1,64 @@
+import time
+
+from utilities.response_cache import ResponseCache
+
+
+def test_key_is_stable_and_sensitive_to_parameters():
+    messages = [{"role": "user", "content": "hi"}]
+    key = ResponseCache.make_key("gpt-4", messages, 10, 0)
+
+    assert key == ResponseCache.make_key("gpt-4", [{"content": "hi", "role": "user"}], 10, 0)
+    assert key != ResponseCache.make_key("gpt-4", messages, 11, 0)
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", messages, 10, 0)
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResponseCache(directory=str(tmp_path)).set("abc", {"id": "1"})
+
+    cache = ResponseCache(directory=str(tmp_path))
+
+    assert cache.get("abc") == {"id": "1"}
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(directory=None, max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.stats()["memory_evictions"] == 1
+
+
+def test_disk_tier_is_bounded_in_bytes(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), max_entries=1, max_disk_bytes=150)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"value": key * 10})
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 150
+    assert stats["disk_evictions"] >= 1
+    assert cache.get("c") == {"value": "c" * 10}
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), ttl=0.01)
+    cache.set("a", {"v": 1})
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["misses"] == 1
+
+
+def test_entries_written_by_another_worker_are_found(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    ResponseCache(directory=str(tmp_path)).set("abc", {"id": "1"})
+
+    assert cache.get("abc") == {"id": "1"}
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1 and stats["disk_entries"] == 1
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from models.llm_agent import RequestCancelled
+from models.router import ModelRoute, ModelRouter
+from models.schemas import PromptRequest, PromptResponse
+
+
+class FakeAgent:
+    def __init__(self, model, delay=0.0, fail=False):
+        self.model = model
+        self.delay = delay
+        self.fail = fail
+        self.cancelled = threading.Event()
+
+    def send_prompt(self, request, messages=None, cancel=None):
+        deadline = time.monotonic() + self.delay
+        while time.monotonic() < deadline:
+            if cancel is not None and cancel.is_set():
+                self.cancelled.set()
+                raise RequestCancelled(self.model)
+            time.sleep(0.005)
+        if self.fail:
+            raise RuntimeError(f"{self.model} failed")
+        return PromptResponse(id=self.model, choices=[{"content": self.model}])
+
+
+def make_router(agents, routes=None, **kwargs):
+    routes = routes or [ModelRoute(model=model) for model in agents]
+    return ModelRouter(routes, lambda model: agents[model], **kwargs)
+
+
+def warm_up(router, model, latency, count=20, error=False):
+    for _ in range(count):
+        router.stats[model].record(None if error else latency, error=error)
+
+
+def test_routes_filter_by_prompt_size_and_max_tokens():
+    agents = {name: FakeAgent(name) for name in ("small", "large")}
+    router = make_router(agents, [ModelRoute(model="small", max_prompt_tokens=10, max_tokens=100), ModelRoute(model="large")])
+
+    assert router.candidates(PromptRequest(prompt="short", max_tokens=50)) == ["small", "large"]
+    assert router.candidates(PromptRequest(prompt="x" * 100, max_tokens=50)) == ["large"]
+    assert router.candidates(PromptRequest(prompt="short", max_tokens=500)) == ["large"]
+
+
+def test_prompts_only_go_to_models_whose_context_window_holds_them():
+    agents = {name: FakeAgent(name) for name in ("gpt-4o-mini", "gpt-4")}
+    router = make_router(agents, [ModelRoute(model="gpt-4"), ModelRoute(model="gpt-4o-mini")])
+    history = [{"role": "user", "content": "word " * 10000}]
+
+    assert router.model == "gpt-4o-mini"
+    assert router.candidates(PromptRequest(prompt="short", max_tokens=50)) == ["gpt-4", "gpt-4o-mini"]
+    assert router.candidates(PromptRequest(prompt="long", max_tokens=50), history) == ["gpt-4o-mini"]
+    assert router.send_prompt(PromptRequest(prompt="long", max_tokens=50), history).model == "gpt-4o-mini"
+
+
+def test_ranking_prefers_fast_and_healthy_models():
+    agents = {name: FakeAgent(name) for name in ("a", "b", "c")}
+    router = make_router(agents)
+    warm_up(router, "a", 2.0)
+    warm_up(router, "b", 0.5)
+    warm_up(router, "c", 0.1)
+    warm_up(router, "c", None, count=40, error=True)
+
+    assert router.candidates(PromptRequest(prompt="hi", max_tokens=5)) == ["b", "a", "c"]
+
+
+def test_models_with_an_open_circuit_are_ranked_last():
+    agents = {name: FakeAgent(name) for name in ("a", "b")}
+    agents["a"].available = lambda: False
+    router = make_router(agents)
+    warm_up(router, "a", 0.1)
+    warm_up(router, "b", 2.0)
+
+    assert router.candidates(PromptRequest(prompt="hi", max_tokens=5)) == ["b", "a"]
+
+
+def test_slow_call_is_hedged_and_loser_cancelled():
+    agents = {"slow": FakeAgent("slow", delay=2.0), "fast": FakeAgent("fast", delay=0.02)}
+    router = make_router(agents)
+    warm_up(router, "slow", 0.05)
+    warm_up(router, "fast", 0.5)
+
+    started = time.monotonic()
+    response = router.send_prompt(PromptRequest(prompt="hi", max_tokens=5))
+
+    assert response.response == "fast"
+    assert time.monotonic() - started < 0.5
+    assert agents["slow"].cancelled.wait(1)
+    snapshot = router.stats_snapshot()
+    assert (snapshot["hedges"], snapshot["hedge_wins"]) == (1, 1)
+
+
+def test_failed_backup_falls_back_to_primary():
+    agents = {"primary": FakeAgent("primary", delay=0.2), "backup": FakeAgent("backup", fail=True)}
+    router = make_router(agents)
+    warm_up(router, "primary", 0.01)
+    warm_up(router, "backup", 0.5)
+
+    assert router.send_prompt(PromptRequest(prompt="hi", max_tokens=5)).response == "primary"
+
+
+def test_router_needs_routes():
+    with pytest.raises(ValueError):
+        ModelRouter([], lambda model: None)
+
+
+def test_failed_primary_fails_over_before_the_hedge_delay():
+    agents = {"primary": FakeAgent("primary", fail=True), "backup": FakeAgent("backup")}
+    router = make_router(agents)
+    warm_up(router, "primary", 1.0)
+    warm_up(router, "backup", 2.0)
+
+    started = time.monotonic()
+    assert router.send_prompt(PromptRequest(prompt="hi", max_tokens=5)).response == "backup"
+    assert time.monotonic() - started < 0.5
+    assert router.stats_snapshot()["failovers"] == 1
+
+
+def test_hedge_delay_starts_when_the_call_leaves_the_queue():
+    agents = {"a": FakeAgent("a", delay=0.15), "b": FakeAgent("b", delay=0.15)}
+    router = make_router(agents, max_workers=1)
+    warm_up(router, "a", 0.2)
+    warm_up(router, "b", 0.2)
+    request = PromptRequest(prompt="hi", max_tokens=5)
+
+    # The second call waits for the only thread, but is not hedged for it
+    threads = [threading.Thread(target=router.send_prompt, args=(request,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert router.stats_snapshot()["hedges"] == 0
+
+
+def test_streams_do_not_record_latencies():
+    class StreamingAgent(FakeAgent):
+        def send_prompt_stream(self, request, messages=None, meta=None):
+            time.sleep(0.05)
+            yield "token"
+
+    router = make_router({"a": StreamingAgent("a")})
+
+    assert list(router.send_prompt_stream(PromptRequest(prompt="hi", max_tokens=5))) == ["token"]
+    assert router.stats["a"].calls == 1
+    assert router.stats["a"].samples() == 0
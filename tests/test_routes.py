@@ -0,0 +1,223 @@
+import json
+
+from backend.main import create_app
+from models.schemas import BatchItemResponse, PromptResponse
+
+
+class FakeAgent:
+    model = "gpt-4"
+
+    def model_for(self, request, messages=None):
+        return self.model
+
+    def send_prompt(self, request, messages=None):
+        usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+        return PromptResponse(id="1", choices=[{"content": f"echo {request.prompt}"}], usage=usage)
+
+    def send_prompt_stream(self, request, messages=None, meta=None):
+        yield "Hello"
+        yield ", world"
+
+    def send_batch(self, requests, max_concurrency=8):
+        return [BatchItemResponse(index=i, response=PromptResponse(id=str(i), choices=[{"content": r.prompt}]))
+                for i, r in enumerate(requests)]
+
+
+def make_app(**config):
+    return create_app(dict({"AGENT_FACTORY": lambda services: FakeAgent()}, **config))
+
+
+def test_app_is_created_without_an_api_key():
+    app = create_app({"OPENAI_API_KEY": None})
+    client = app.test_client()
+
+    assert client.get("/").status_code == 200
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+    response = client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 5})
+    assert response.status_code == 500
+    assert "OPENAI_API_KEY" in response.get_json()["error"]
+
+
+def test_prompt_route_records_history():
+    app = make_app()
+    client = app.test_client()
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+
+    response = client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 5})
+
+    assert response.get_json()["choices"] == [{"content": "echo hi"}]
+    assert client.get(f"/history/{conversation_id}").get_json() == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "echo hi"},
+    ]
+
+
+def test_stream_route_sends_events_and_records_history():
+    app = make_app()
+    client = app.test_client()
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+
+    response = client.post(f"/prompt/{conversation_id}/stream", json={"prompt": "hi", "max_tokens": 5})
+    body = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/event-stream"
+    assert 'data: {"delta": "Hello"}' in body
+    assert "event: done" in body
+    conversations = app.extensions["lmauto"].conversations
+    assert conversations.get_messages(conversation_id)[-1] == {"role": "assistant", "content": "Hello, world"}
+    events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+    assert events[-1] == {"response": "Hello, world"}
+
+
+def test_stream_route_rejects_unknown_conversation():
+    response = make_app().test_client().post("/prompt/missing/stream", json={"prompt": "hi", "max_tokens": 5})
+    assert response.status_code == 404
+
+
+def test_batch_route_reports_invalid_items_in_place():
+    response = make_app().test_client().post("/prompt/batch", json={"prompts": [
+        {"prompt": "a", "max_tokens": 5},
+        {"prompt": "b"},
+        {"prompt": "c", "max_tokens": 5},
+    ]})
+
+    results = response.get_json()["results"]
+    assert response.status_code == 200
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert results[0]["response"]["choices"] == [{"content": "a"}]
+    assert results[1]["error"][0]["loc"] == ["max_tokens"]
+    assert results[2]["response"]["choices"] == [{"content": "c"}]
+
+
+def test_malformed_batches_are_rejected_with_400():
+    client = make_app().test_client()
+
+    array = client.post("/prompt/batch", json=[{"prompt": "a", "max_tokens": 5}])
+    concurrency = client.post("/prompt/batch", json={"prompts": [], "max_concurrency": "x"})
+
+    assert array.status_code == 400 and "error" in array.get_json()
+    assert concurrency.status_code == 400 and concurrency.get_json() == {"error": "max_concurrency must be an integer"}
+
+
+def test_metrics_report_phases_tokens_and_requests():
+    app = make_app()
+    client = app.test_client()
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+    client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 5})
+    client.post(f"/prompt/{conversation_id}", json={"prompt": "again", "max_tokens": 5})
+
+    response = client.get("/metrics")
+    body = response.get_data(as_text=True)
+
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert 'lmauto_http_requests_total{route="/prompt/<conversation_id>",method="POST",status="200"} 2' in body
+    for phase in ("validate", "context", "upstream", "store", "serialize"):
+        assert f'lmauto_request_phase_seconds_count{{route="/prompt/<conversation_id>",phase="{phase}"}} 2' in body
+    assert 'lmauto_upstream_tokens_total{model="gpt-4",kind="completion"} 4' in body
+    assert 'lmauto_http_requests_in_flight{route="/metrics"} 1' in body
+    assert client.get(f"/usage/{conversation_id}").get_json() == {"prompt_tokens": 6, "completion_tokens": 4, "requests": 2}
+
+
+def test_cached_responses_do_not_count_as_upstream_tokens(tmp_path):
+    class CachedAgent(FakeAgent):
+        def send_prompt(self, request, messages=None):
+            response = super().send_prompt(request, messages)
+            return PromptResponse.from_cache(response.dict()) if request.prompt == "again" else response
+
+    app = create_app({"AGENT_FACTORY": lambda services: CachedAgent(), "RESPONSE_CACHE_DIR": str(tmp_path)})
+    client = app.test_client()
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+    client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 5})
+    client.post(f"/prompt/{conversation_id}", json={"prompt": "again", "max_tokens": 5})
+
+    body = client.get("/metrics").get_data(as_text=True)
+
+    assert 'lmauto_upstream_tokens_total{model="gpt-4",kind="completion"} 2' in body
+    assert '# TYPE lmauto_response_cache_lookups_total counter' in body
+    assert client.get(f"/usage/{conversation_id}").get_json()["requests"] == 2
+
+
+def test_usage_is_attributed_to_the_model_that_served_the_prompt():
+    class RoutingAgent(FakeAgent):
+        def model_for(self, request, messages=None):
+            return "gpt-4o-mini"
+
+        def send_prompt(self, request, messages=None):
+            return super().send_prompt(request, messages).copy(update={"model": "gpt-4o-mini"})
+
+    app = create_app({"AGENT_FACTORY": lambda services: RoutingAgent()})
+    client = app.test_client()
+    conversation_id = client.post("/start-conversation").get_json()["conversation_id"]
+    client.post(f"/prompt/{conversation_id}", json={"prompt": "hi", "max_tokens": 5})
+
+    body = client.get("/metrics").get_data(as_text=True)
+
+    assert 'lmauto_upstream_tokens_total{model="gpt-4o-mini",kind="completion"} 2' in body
+    assert 'model="gpt-4",' not in body
+
+
+def make_history(app, count):
+    conversations = app.extensions["lmauto"].conversations
+    conversation_id = conversations.create()
+    for i in range(count):
+        conversations.append(conversation_id, {"role": "user", "content": f"m{i}"})
+    return conversation_id
+
+
+def test_history_pages_with_cursor_and_since():
+    app = make_app()
+    client = app.test_client()
+    conversation_id = make_history(app, 5)
+
+    first = client.get(f"/history/{conversation_id}?limit=2").get_json()
+    second = client.get(f"/history/{conversation_id}?limit=2&cursor={first['next_cursor']}").get_json()
+    new = client.get(f"/history/{conversation_id}?since=4").get_json()
+
+    assert [m["content"] for m in first["messages"]] == ["m0", "m1"]
+    assert (first["count"], first["next_cursor"]) == (5, 2)
+    assert [m["content"] for m in second["messages"]] == ["m2", "m3"]
+    assert new == {"messages": [{"role": "user", "content": "m4"}], "start": 4, "count": 5, "next_cursor": None}
+    assert client.get(f"/history/{conversation_id}?since=9").get_json()["messages"] == []
+    assert client.get(f"/history/{conversation_id}?limit=zero").status_code == 400
+
+
+def test_unchanged_history_returns_304():
+    app = make_app()
+    client = app.test_client()
+    conversation_id = make_history(app, 2)
+
+    response = client.get(f"/history/{conversation_id}?since=2")
+    etag = response.headers["ETag"]
+    unchanged = client.get(f"/history/{conversation_id}?since=2", headers={"If-None-Match": etag})
+    app.extensions["lmauto"].conversations.append(conversation_id, {"role": "assistant", "content": "new"})
+    changed = client.get(f"/history/{conversation_id}?since=2", headers={"If-None-Match": etag})
+
+    assert unchanged.status_code == 304 and unchanged.get_data() == b""
+    assert changed.status_code == 200
+    assert changed.get_json()["messages"] == [{"role": "assistant", "content": "new"}]
+
+
+def test_history_etag_depends_on_the_page():
+    app = make_app()
+    client = app.test_client()
+    conversation_id = make_history(app, 4)
+
+    etag = client.get(f"/history/{conversation_id}?limit=2").headers["ETag"]
+    next_page = client.get(f"/history/{conversation_id}?cursor=2&limit=2", headers={"If-None-Match": etag})
+    invalid = client.get(f"/history/{conversation_id}?limit=zero", headers={"If-None-Match": etag})
+    full = client.get(f"/history/{conversation_id}", headers={"If-None-Match": etag})
+
+    assert next_page.status_code == 200
+    assert [m["content"] for m in next_page.get_json()["messages"]] == ["m2", "m3"]
+    assert invalid.status_code == 400
+    assert full.status_code == 200 and len(full.get_json()) == 4
+
+
+def test_long_history_export_is_streamed():
+    app = make_app(HISTORY_PAGE_SIZE=3)
+    conversation_id = make_history(app, 7)
+
+    response = app.test_client().get(f"/history/{conversation_id}")
+
+    assert response.is_streamed
+    assert [m["content"] for m in json.loads(response.get_data())] == [f"m{i}" for i in range(7)]
@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utilities.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: flight.do("k", slow), range(5)))
+
+    assert results == ["result"] * 5
+    assert len(runs) == 1
+    assert flight.stats()["joins"] == 4
+    assert flight.do("k", lambda: "again") == "again"
+
+
+def test_error_is_shared_with_joined_callers():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "k", failing)
+        started.wait()
+        follower = executor.submit(flight.do, "k", lambda: "not run")
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert flight.stats()["joins"] == 1
+
+
+def test_late_stream_reader_replays_and_survives_leader_leaving():
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def source():
+        runs.append(1)
+        yield "a"
+        release.wait()
+        yield "b"
+        yield "c"
+
+    leader = flight.stream("k", source)
+    assert next(leader) == "a"
+    follower = flight.stream("k", source)
+    leader.close()
+    release.set()
+
+    assert list(follower) == ["a", "b", "c"]
+    assert len(runs) == 1
+    assert flight.stats()["stream_joins"] == 1 and flight.stats()["streams_in_flight"] == 0
+
+
+def test_abandoned_stream_closes_its_source():
+    flight = SingleFlight()
+    closed = []
+
+    def source():
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            closed.append(True)
+
+    reader = flight.stream("k", source)
+    assert next(reader) == "a"
+    reader.close()
+
+    assert closed == [True]
+    assert list(flight.stream("k", source)) == ["a", "b"]
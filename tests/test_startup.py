@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import startup
+
+
+@pytest.mark.parametrize("name", ["cli-help", "create-app"])
+def test_startup_stays_within_budget_and_defers_heavy_imports(name):
+    report = startup.run_scenario(name, repeat=1)
+
+    assert report["forbidden_imports"] == []
+    assert not report["over_budget"], report["slowest_imports"]
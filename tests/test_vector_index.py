@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from utilities.external_memory import ExternalMemory
+from utilities.vector_index import HashingEmbedder, VectorIndex
+
+
+def test_hashing_embedder_is_normalized_and_stable():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["connection pooling", "connection pooling", ""])
+
+    assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+
+def test_search_ranks_by_similarity_after_add_and_delete():
+    index = VectorIndex(dim=3)
+    index.add(["x", "y", "z"], np.eye(3, dtype=np.float32))
+    index.add(["xy"], np.array([[0.7, 0.7, 0]], dtype=np.float32))
+
+    assert [key for key, _ in index.search(np.array([1, 0.1, 0]), k=2)] == ["x", "xy"]
+
+    assert index.delete(["x", "missing"]) == 1
+    assert len(index) == 3 and "x" not in index
+    assert [key for key, _ in index.search(np.array([1, 0.1, 0]), k=5)] == ["xy", "y", "z"]
+    assert index.search(np.array([1, 0, 0]), k=5, min_score=0.5) == [("xy", pytest.approx(0.7))]
+
+
+def test_saved_index_is_memory_mapped_and_copied_on_write(tmp_path):
+    path = str(tmp_path / "index")
+    index = VectorIndex(dim=2, embedder_name="test")
+    index.add(["a", "b"], np.array([[1, 0], [0, 1]], dtype=np.float32))
+    index.save(path)
+
+    loaded = VectorIndex.load(path)
+    assert isinstance(loaded.vectors, np.memmap) and loaded.embedder_name == "test"
+    assert loaded.search(np.array([0, 1]), k=1)[0][0] == "b"
+
+    loaded.delete(["a"])
+    loaded.add(["c"], np.array([[1, 1]], dtype=np.float32))
+    assert [key for key, _ in loaded.search(np.array([1, 0]), k=2)] == ["c", "b"]
+    assert VectorIndex.load(path).keys == ["a", "b"]
+
+
+def test_memory_recalls_relevant_chunks_across_reopen(tmp_path):
+    filename = str(tmp_path / "memory_db")
+    with ExternalMemory(filename) as memory:
+        memory.save_data("plain", "not indexed")
+        memory.save_chunks({
+            "db": "The database layer uses SQLite in WAL mode with one writer.",
+            "ui": "The frontend renders the chat transcript with React components.",
+            "http": "Connections to the API are pooled and kept alive between requests.",
+        })
+
+    with ExternalMemory(filename) as memory:
+        assert list(memory.recall("which database does the storage use, sqlite?", k=1)) == ["db"]
+        memory.delete_many(["db"])
+        assert "db" not in memory.recall("sqlite database", k=3)
+        assert memory.retrieve_data("db") is None
+        assert memory.retrieve_data("plain") == "not indexed"
+
+
+def test_memory_rejects_index_of_another_embedder(tmp_path):
+    filename = str(tmp_path / "memory_db")
+    with ExternalMemory(filename) as memory:
+        memory.save_chunks({"a": "alpha"})
+
+    with ExternalMemory(filename, embedder=HashingEmbedder(dim=32)) as memory:
+        with pytest.raises(ValueError):
+            memory.search("alpha")
@@ -0,0 +1,105 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed because the server is at capacity.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Bounds the requests of an event loop that are in flight, and those waiting for a slot.
+
+    Up to max_in_flight requests run at once; the next max_queue wait in arrival order, and
+    any beyond that are rejected at once with Overloaded, as is a request that waited longer
+    than queue_timeout. Latency therefore stays bounded by roughly the queue's length
+    instead of growing with the load. Not thread-safe: it belongs to one event loop.
+    """
+
+    def __init__(self, max_in_flight: int = 1000, max_queue: int = 1000, queue_timeout: Optional[float] = 30.0):
+        """
+        Initializes an instance of the AdmissionQueue class.
+
+        Args:
+            max_in_flight (int, optional): Requests admitted at once.
+            max_queue (int, optional): Requests that may wait for a slot. 0 rejects whatever does not fit.
+            queue_timeout (float, optional): Seconds a request waits before it is rejected. None waits indefinitely.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.admitted = 0
+        self.shed = 0
+
+    async def acquire(self):
+        """
+        Waits for a slot. Raises Overloaded if the queue is full or the wait times out.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise Overloaded(f"Server is at capacity ({self.in_flight} in flight, {len(self._waiters)} queued)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed += 1
+                raise Overloaded(f"Waited more than {self.queue_timeout}s for capacity") from None
+            raise
+        self.admitted += 1
+
+    def release(self):
+        """
+        Frees a slot, handing it straight to the longest waiting request if there is one.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Holds a slot for the duration of the block.
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from utilities.admission import Overloaded
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Overloaded):
+    """
+    Raised instead of calling an upstream that is failing, until its circuit breaker lets a probe through.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails calls to an unhealthy upstream fast instead of letting each one wait for its timeout.
+
+    The circuit opens after consecutive_failures failures in a row, or once at least
+    min_calls of the last window calls were made and error_rate of them failed. While open,
+    calls raise CircuitOpen. After reset_timeout the circuit is half open and lets
+    half_open_probes calls through: a success closes it, a failure opens it again.
+    """
+
+    def __init__(self, name: str = "upstream", consecutive_failures: int = 5, error_rate: float = 0.5,
+                 window: int = 20, min_calls: int = 10, reset_timeout: float = 30.0, half_open_probes: int = 1):
+        """
+        Initializes an instance of the CircuitBreaker class.
+
+        Args:
+            name (str, optional): What is guarded, e.g. the model, for messages.
+            consecutive_failures (int, optional): Failures in a row that open the circuit.
+            error_rate (float, optional): Share of failed recent calls that opens the circuit.
+            window (int, optional): Number of recent calls the error rate covers.
+            min_calls (int, optional): Calls in the window before the error rate is judged.
+            reset_timeout (float, optional): Seconds the circuit stays open before probing.
+            half_open_probes (int, optional): Calls let through at once while half open.
+        """
+        self.name = name
+        self.consecutive_failures = consecutive_failures
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.outcomes: "deque[bool]" = deque(maxlen=window)
+        self.failures_in_row = 0
+        self.opened_at: Optional[float] = None
+        self.probes = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _current_state(self, now: float) -> str:
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.probes = 0
+        return self.state
+
+    def allows(self) -> bool:
+        """
+        Returns whether a call would currently be let through, without making one.
+        """
+        with self.lock:
+            state = self._current_state(time.monotonic())
+            return state == CLOSED or (state == HALF_OPEN and self.probes < self.half_open_probes)
+
+    def before_call(self) -> bool:
+        """
+        Admits a call or raises CircuitOpen. Returns whether the call is a half-open probe.
+        """
+        with self.lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self.probes < self.half_open_probes:
+                self.probes += 1
+                return True
+            self.rejected += 1
+            retry_after = max(0.0, self.opened_at + self.reset_timeout - now) if state == OPEN else 1.0
+        raise CircuitOpen(f"Circuit for {self.name} is {state}; failing fast", retry_after=retry_after)
+
+    def record(self, failed: Optional[bool], probe: bool = False):
+        """
+        Records the outcome of an admitted call. None means no outcome, e.g. the call was cancelled.
+        """
+        with self.lock:
+            if probe:
+                self.probes -= 1
+            if failed is None:
+                return
+            self.outcomes.append(failed)
+            if not failed:
+                self.failures_in_row = 0
+                if self.state == HALF_OPEN and probe:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                return
+            self.failures_in_row += 1
+            if self.state == HALF_OPEN and probe:
+                self._open()
+            elif self.state == CLOSED and (
+                self.failures_in_row >= self.consecutive_failures
+                or (len(self.outcomes) >= self.min_calls and sum(self.outcomes) / len(self.outcomes) >= self.error_rate)
+            ):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            return {
+                "state": state,
+                "failures_in_row": self.failures_in_row,
+                "recent_error_rate": sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0,
+                "open_for_seconds": max(0.0, self.opened_at + self.reset_timeout - now) if state == OPEN else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,145 @@
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from utilities.admission import Overloaded
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit on concurrent upstream calls that adapts to how the upstream copes (AIMD).
+
+    Each successful call raises the limit by 1/limit, about one per round of calls, while the
+    limit is actually being used. A failure that signals overload (rate limit, server error,
+    timeout) cuts it by the backoff factor. Callers beyond the limit wait up to acquire_timeout
+    for a slot and are then rejected with Overloaded, so a struggling upstream sees fewer calls
+    instead of every worker at once. Threads and asyncio tasks share the same slots.
+
+    Latency is reported but does not adapt the limit: a completion takes as long as the answer
+    it generates, so a slow call says nothing about the upstream's health.
+    """
+
+    def __init__(self, initial_limit: int = 20, min_limit: int = 1, max_limit: int = 200, backoff: float = 0.75,
+                 window: int = 100, acquire_timeout: Optional[float] = 30.0):
+        """
+        Initializes an instance of the AdaptiveConcurrencyLimiter class.
+
+        Args:
+            initial_limit (int, optional): Calls allowed in flight at first.
+            min_limit (int, optional): Lowest the limit is cut to.
+            max_limit (int, optional): Highest the limit grows to.
+            backoff (float, optional): Factor the limit is multiplied by on an overload signal.
+            window (int, optional): Number of recent latencies the reported median covers.
+            acquire_timeout (float, optional): Seconds a caller waits for a slot. None waits indefinitely.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.backoff = backoff
+        self.acquire_timeout = acquire_timeout
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.latencies: "deque[float]" = deque(maxlen=window)
+        self.decreases = 0
+        self.rejected = 0
+        # The limit is not cut again by the calls that were already in flight when it was cut
+        self._cut_at = 0.0
+        # Futures of asyncio tasks waiting for a slot, woken on their own loop by release()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a slot if one is free, without waiting.
+        """
+        with self.cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def acquire(self):
+        """
+        Waits for a slot. Raises Overloaded if none frees up within acquire_timeout.
+        """
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.rejected += 1
+                    raise Overloaded(f"Upstream concurrency limit of {int(self.limit)} reached")
+                self.cond.wait(remaining)
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """
+        Waits for a slot without blocking the event loop. Raises Overloaded if none frees up within acquire_timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        while True:
+            with self.cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.rejected += 1
+                    raise Overloaded(f"Upstream concurrency limit of {int(self.limit)} reached")
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1], remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False, started: Optional[float] = None):
+        """
+        Frees a slot and adapts the limit to the call's outcome.
+
+        Args:
+            latency (float, optional): Duration of a successful call, recorded for the median latency.
+            overloaded (bool, optional): Whether the call failed in a way that signals overload.
+            started (float, optional): time.monotonic() at the start of the call.
+        """
+        with self.cond:
+            used = self.in_flight >= self.limit / 2
+            self.in_flight -= 1
+            if latency is not None and not overloaded:
+                self.latencies.append(latency)
+            if overloaded:
+                if started is None or started >= self._cut_at:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self.decreases += 1
+                    self._cut_at = time.monotonic()
+            elif used:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def stats(self) -> Dict:
+        with self.cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "decreases": self.decreases,
+                "rejected": self.rejected,
+                "median_latency_seconds": statistics.median(self.latencies) if self.latencies else None,
+            }
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,418 @@
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+# Rough per-message bookkeeping cost on top of the content itself
+_MESSAGE_OVERHEAD_BYTES = 64
+
+# Fenced code blocks are split out of a body so that a block quoted again in a later message is shared
+_CODE_BLOCK = re.compile(r"(```.*?```)", re.DOTALL)
+
+
+class ConversationStore(ABC):
+    """
+    Storage for conversation histories, keyed by conversation ID.
+    """
+
+    @abstractmethod
+    def create(self) -> str:
+        """
+        Creates an empty conversation and returns its ID.
+        """
+
+    @abstractmethod
+    def exists(self, conversation_id: str) -> bool:
+        """
+        Returns whether a conversation exists.
+        """
+
+    @abstractmethod
+    def append(self, conversation_id: str, message: Dict):
+        """
+        Appends a message to a conversation. Raises KeyError if it does not exist.
+        """
+
+    @abstractmethod
+    def get_messages(self, conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Returns the messages of a conversation in order, beginning at index start and at most
+        limit of them if given. Raises KeyError if it does not exist.
+        """
+
+    def get_stored_messages(self, conversation_id: str, start: int = 0) -> List:
+        """
+        Returns the messages of a conversation from index start on, in the form the store keeps them.
+
+        Stored messages support message["role"] and message.get(key) like dicts, and are
+        turned into wire dicts with to_wire_message. Keeping them, rather than the dicts of
+        get_messages, shares their bodies with the store. Raises KeyError if the conversation
+        does not exist.
+        """
+        return self.get_messages(conversation_id, start=start)
+
+    @abstractmethod
+    def count(self, conversation_id: str) -> int:
+        """
+        Returns the number of messages in a conversation. Raises KeyError if it does not exist.
+        """
+
+    @abstractmethod
+    def delete(self, conversation_id: str):
+        """
+        Deletes a conversation if it exists.
+        """
+
+
+class _BodyPool:
+    """
+    Content-addressed, reference-counted storage of large message bodies.
+
+    Equal bodies appended to any conversation resolve to one shared string, which is
+    released once the last message referring to it is dropped.
+    """
+
+    def __init__(self):
+        # body -> [the shared string, references]
+        self._bodies: Dict[str, list] = {}
+        self.bytes = 0
+
+    def acquire(self, body: str) -> Tuple[str, int]:
+        """
+        Returns the shared copy of a body and the number of bytes newly stored for it.
+        """
+        entry = self._bodies.get(body)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0], 0
+        self._bodies[body] = [body, 1]
+        self.bytes += len(body)
+        return body, len(body)
+
+    def release(self, body: str) -> int:
+        """
+        Drops one reference to a body and returns the number of bytes freed.
+        """
+        entry = self._bodies[body]
+        entry[1] -= 1
+        if entry[1]:
+            return 0
+        del self._bodies[body]
+        self.bytes -= len(body)
+        return len(body)
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def references(self) -> int:
+        return sum(entry[1] for entry in self._bodies.values())
+
+
+def to_wire_message(message) -> Dict:
+    """
+    Returns the dict sent to the API for a message returned by get_stored_messages.
+    """
+    return message if isinstance(message, dict) else message.to_dict()
+
+
+class _Message:
+    """
+    Compact form of a stored message.
+
+    The role is interned, and the content is either kept as is or, when it holds bodies
+    large enough to share, as a tuple of pieces whose large ones live in the body pool.
+    The wire dict is only built when the message is read.
+    """
+
+    __slots__ = ("role", "content", "extra")
+
+    def __init__(self, role: str, content: Union[str, Tuple[str, ...], None], extra: Optional[Dict] = None):
+        self.role = role
+        self.content = content
+        self.extra = extra
+
+    def pieces(self) -> Tuple[str, ...]:
+        return self.content if isinstance(self.content, tuple) else ()
+
+    def get(self, key: str, default=None):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return "".join(self.content) if isinstance(self.content, tuple) else self.content
+        return (self.extra or {}).get(key, default)
+
+    def __getitem__(self, key: str):
+        if key not in ("role", "content") and key not in (self.extra or {}):
+            raise KeyError(key)
+        return self.get(key)
+
+    def to_dict(self) -> Dict:
+        content = "".join(self.content) if isinstance(self.content, tuple) else self.content
+        message = {"role": self.role, "content": content}
+        if self.extra:
+            message.update(self.extra)
+        return message
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Process-local conversation store bounded by idle time, conversation count and memory.
+
+    Conversations are kept in least-recently-used order; once any bound is exceeded the
+    least recently used ones are dropped.
+
+    Messages are stored compactly: roles are interned, and bodies of at least
+    shared_min_chars (whole contents, or fenced code blocks within them) are kept once in a
+    reference-counted pool shared by all conversations, so a system prompt or code block
+    repeated across conversations is stored, and counted against max_bytes, only once.
+    """
+
+    def __init__(self, max_conversations: int = 10000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[float] = 24 * 60 * 60, shared_min_chars: int = 256):
+        """
+        Initializes an instance of the InMemoryConversationStore class.
+
+        Args:
+            max_conversations (int, optional): Maximum number of conversations kept.
+            max_bytes (int, optional): Approximate cap on the memory used by message contents.
+            ttl (float, optional): Seconds a conversation survives without being used. None means forever.
+            shared_min_chars (int, optional): Length from which a body is stored once in the shared pool.
+        """
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared_min_chars = shared_min_chars
+        self.lock = threading.Lock()
+        # conversation_id -> [messages, last_access, size_bytes], where size_bytes excludes pooled bodies
+        self._conversations: "OrderedDict[str, list]" = OrderedDict()
+        self._bodies = _BodyPool()
+        self._bytes = 0
+        self.evictions = 0
+
+    def _compact(self, message: Dict) -> Tuple[_Message, int, int]:
+        """
+        Converts a message to its stored form. Returns it with its own size and the bytes newly added to the pool.
+        """
+        content = message.get("content")
+        extra = {key: value for key, value in message.items() if key not in ("role", "content")} or None
+        size, pooled = _MESSAGE_OVERHEAD_BYTES, 0
+        if content is None or len(content) < self.shared_min_chars:
+            return _Message(sys.intern(message["role"]), content, extra), size + len(content or ""), 0
+
+        pieces = []
+        for piece in _CODE_BLOCK.split(content) if "```" in content else (content,):
+            if len(piece) >= self.shared_min_chars:
+                piece, added = self._bodies.acquire(piece)
+                pooled += added
+            else:
+                size += len(piece)
+            if piece:
+                pieces.append(piece)
+        return _Message(sys.intern(message["role"]), tuple(pieces), extra), size, pooled
+
+    def _touch(self, conversation_id: str) -> list:
+        entry = self._conversations.get(conversation_id)
+        if entry is None:
+            raise KeyError(conversation_id)
+        now = time.monotonic()
+        if self.ttl is not None and now - entry[1] > self.ttl:
+            self._drop(conversation_id)
+            raise KeyError(conversation_id)
+        entry[1] = now
+        self._conversations.move_to_end(conversation_id)
+        return entry
+
+    def _drop(self, conversation_id: str):
+        entry = self._conversations.pop(conversation_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            for message in entry[0]:
+                for piece in message.pieces():
+                    if len(piece) >= self.shared_min_chars:
+                        self._bytes -= self._bodies.release(piece)
+
+    def _evict(self, keep: Optional[str] = None):
+        # The conversation being written to is kept even if it alone exceeds max_bytes
+        now = time.monotonic()
+        while self._conversations:
+            oldest_id, oldest = next(iter(self._conversations.items()))
+            if oldest_id == keep:
+                break
+            expired = self.ttl is not None and now - oldest[1] > self.ttl
+            if not (expired or len(self._conversations) > self.max_conversations or self._bytes > self.max_bytes):
+                break
+            self._drop(oldest_id)
+            self.evictions += 1
+
+    def create(self) -> str:
+        conversation_id = str(uuid.uuid4())
+        with self.lock:
+            self._conversations[conversation_id] = [[], time.monotonic(), 0]
+            self._evict(keep=conversation_id)
+        return conversation_id
+
+    def exists(self, conversation_id: str) -> bool:
+        with self.lock:
+            try:
+                self._touch(conversation_id)
+            except KeyError:
+                return False
+            return True
+
+    def append(self, conversation_id: str, message: Dict):
+        with self.lock:
+            entry = self._touch(conversation_id)
+            compact, size, pooled = self._compact(message)
+            entry[0].append(compact)
+            entry[2] += size
+            self._bytes += size + pooled
+            self._evict(keep=conversation_id)
+
+    def get_messages(self, conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        with self.lock:
+            messages = self._touch(conversation_id)[0][start:None if limit is None else start + limit]
+        return [message.to_dict() for message in messages]
+
+    def get_stored_messages(self, conversation_id: str, start: int = 0) -> List:
+        # The compact messages themselves, so that their pooled bodies are not copied
+        with self.lock:
+            return self._touch(conversation_id)[0][start:]
+
+    def count(self, conversation_id: str) -> int:
+        with self.lock:
+            return len(self._touch(conversation_id)[0])
+
+    def delete(self, conversation_id: str):
+        with self.lock:
+            self._drop(conversation_id)
+
+    def stats(self) -> Dict:
+        """
+        Returns the number of conversations, the accounted bytes and the state of the shared body pool.
+        """
+        with self.lock:
+            return {
+                "conversations": len(self._conversations),
+                "bytes": self._bytes,
+                "shared_bodies": len(self._bodies),
+                "shared_bytes": self._bodies.bytes,
+                "shared_references": self._bodies.references(),
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversation store in a SQLite database that every worker process on the host can share.
+
+    Each message is its own row, so appending never rewrites the existing history.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 7 * 24 * 60 * 60):
+        """
+        Initializes an instance of the SQLiteConversationStore class.
+
+        Args:
+            path (str): Path to the database file.
+            ttl (float, optional): Seconds a conversation survives without being used. None means forever.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT,
+                PRIMARY KEY (conversation_id, position)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _is_live(self, conn: sqlite3.Connection, conversation_id: str) -> bool:
+        row = conn.execute("SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None and (self.ttl is None or time.time() - row[0] <= self.ttl)
+
+    def purge_expired(self) -> int:
+        """
+        Deletes conversations idle for longer than the TTL and returns how many were removed.
+        """
+        if self.ttl is None:
+            return 0
+        cursor = self._conn().execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def create(self) -> str:
+        conversation_id = str(uuid.uuid4())
+        self.purge_expired()
+        self._conn().execute("INSERT INTO conversations (id, updated_at) VALUES (?, ?)", (conversation_id, time.time()))
+        return conversation_id
+
+    def exists(self, conversation_id: str) -> bool:
+        return self._is_live(self._conn(), conversation_id)
+
+    def append(self, conversation_id: str, message: Dict):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._is_live(conn, conversation_id):
+                raise KeyError(conversation_id)
+            (position,) = conn.execute("SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            conn.execute(
+                "INSERT INTO messages (conversation_id, position, role, content) VALUES (?, ?, ?, ?)",
+                (conversation_id, position, message["role"], message.get("content")),
+            )
+            conn.execute(
+                "UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?",
+                (position + 1, time.time(), conversation_id),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get_messages(self, conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            if not self._is_live(conn, conversation_id):
+                raise KeyError(conversation_id)
+            rows = conn.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? AND position >= ? ORDER BY position LIMIT ?",
+                (conversation_id, start, -1 if limit is None else limit),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def count(self, conversation_id: str) -> int:
+        conn = self._conn()
+        row = conn.execute("SELECT updated_at, message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[0] > self.ttl):
+            raise KeyError(conversation_id)
+        return row[1]
+
+    def delete(self, conversation_id: str):
+        self._conn().execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
@@ -1,42 +1,257 @@
+import dbm
+import logging
+import os
+import pickle
 import shelve
+import sqlite3
 import threading
-from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+from utilities.log_store import LogStore
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement; stay well below it
+_MAX_VARIABLES = 500
+
+
+class SQLiteStore:
+    """
+    Key-value store backed by a single SQLite database in WAL mode.
+
+    One long-lived connection serves all writes behind a lock, while every reading thread
+    gets its own connection, so reads run concurrently with each other and with the writer.
+    Values are pickled, matching what shelve accepted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.write_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("CREATE TABLE IF NOT EXISTS memory (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self._writer.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL makes NORMAL durable against application crashes without an fsync per commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        rows = [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in items]
+        with self.write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                self._writer.executemany("INSERT OR REPLACE INTO memory (key, value) VALUES (?, ?)", rows)
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._writer.execute("COMMIT")
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        conn = self._reader()
+        found = {}
+        # A single read transaction gives every chunk the same snapshot
+        conn.execute("BEGIN")
+        try:
+            for start in range(0, len(keys), _MAX_VARIABLES):
+                chunk = keys[start:start + _MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                for key, value in conn.execute(f"SELECT key, value FROM memory WHERE key IN ({placeholders})", chunk):
+                    found[key] = pickle.loads(value)
+        finally:
+            conn.execute("COMMIT")
+        return found
+
+    def delete_many(self, keys: List[str]):
+        with self.write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(keys), _MAX_VARIABLES):
+                    chunk = keys[start:start + _MAX_VARIABLES]
+                    self._writer.execute(f"DELETE FROM memory WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._writer.execute("COMMIT")
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self.write_lock:
+            self._writer.close()
 
 
 class ExternalMemory:
-    def __init__(self, filename="memory_db"):
+    def __init__(self, filename="memory_db", embedder=None, engine: str = "sqlite"):
+        """
+        Initializes an instance of the ExternalMemory class.
+
+        Args:
+            filename (str, optional): Base name of the database files.
+            embedder (optional): Object with a `dim`, a `name` and an `embed(texts)` method returning
+                normalized vectors, used for similarity search. Defaults to a HashingEmbedder.
+            engine (str, optional): "sqlite" for a SQLite database, or "log" for an append-only log
+                (see LogStore) suited to write-heavy runs.
+        """
+        if engine not in ("sqlite", "log"):
+            raise ValueError(f"Unknown storage engine: {engine}")
         self.filename = filename
-        self.lock = threading.Lock()
+        self.path = f"{filename}.sqlite3" if engine == "sqlite" else f"{filename}.log"
+        self.index_path = f"{filename}.index"
+        is_new = not os.path.exists(self.path)
+        self.store = SQLiteStore(self.path) if engine == "sqlite" else LogStore(self.path)
+        if is_new:
+            self._import_shelve()
+        self.embedder = embedder
+        self._index = None
+        self._index_lock = threading.Lock()
+        self._index_dirty = False
 
-    @contextmanager
-    def shelve_open(self):
-        with self.lock:
-            with shelve.open(self.filename, writeback=True) as shelf:
-                yield shelf
+    def _import_shelve(self):
+        """
+        Copies the entries of a shelve database left by earlier versions into the store.
+        """
+        if not dbm.whichdb(self.filename):
+            return
+        try:
+            with shelve.open(self.filename, flag="r") as shelf:
+                self.store.put_many((key, shelf[key]) for key in shelf.keys())
+            logger.info("Imported shelve database %s into %s", self.filename, self.path)
+        except Exception as e:
+            logger.warning("Could not import shelve database %s: %s", self.filename, e)
 
     def save_data(self, key, data):
+        self.save_many({key: data})
+
+    def retrieve_data(self, key):
+        return self.retrieve_many([key])[key]
+
+    def save_many(self, items: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]]):
+        """
+        Saves several entries in a single transaction.
+        """
+        if isinstance(items, Mapping):
+            items = items.items()
         try:
-            with self.shelve_open() as shelf:
-                shelf[key] = data
-                shelf.sync()  # Ensure data is written
-            print(f"Data saved under key: {key}")
+            self.store.put_many(items)
         except Exception as e:
-            print(f"Failed to save data: {str(e)}")
+            logger.error("Failed to save data: %s", e, exc_info=True)
             raise
 
-    def retrieve_data(self, key):
+    def retrieve_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Retrieves several entries from one consistent snapshot. Missing keys map to None.
+        """
+        keys = list(keys)
         try:
-            with self.shelve_open() as shelf:
-                data = shelf.get(key, None)
-            print(f"Data retrieved for key: {key}")
-            return data
+            found = self.store.get_many(keys)
         except Exception as e:
-            print(f"Failed to retrieve data: {str(e)}")
+            logger.error("Failed to retrieve data: %s", e, exc_info=True)
             raise
+        return {key: found.get(key) for key in keys}
+
+    def delete_many(self, keys: Iterable[str]):
+        """
+        Deletes several entries, together with their vectors if they were saved as chunks.
+        """
+        keys = list(keys)
+        self.store.delete_many(keys)
+        if self._index is not None or os.path.exists(f"{self.index_path}.json"):
+            if self.index.delete(keys):
+                self._index_dirty = True
+
+    @property
+    def index(self):
+        """
+        The similarity index over the chunks, loaded memory-mapped from disk on first use.
+        """
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    # Imported here so that key-value use does not need NumPy
+                    from utilities.vector_index import HashingEmbedder, VectorIndex
+
+                    self.embedder = self.embedder or HashingEmbedder()
+                    if VectorIndex.exists(self.index_path):
+                        index = VectorIndex.load(self.index_path)
+                        if (index.dim, index.embedder_name) != (self.embedder.dim, self.embedder.name):
+                            raise ValueError(
+                                f"Index {self.index_path} was built by {index.embedder_name or 'an unknown embedder'} "
+                                f"with dimension {index.dim}, not {self.embedder.name}"
+                            )
+                    else:
+                        index = VectorIndex(self.embedder.dim, self.embedder.name)
+                    self._index = index
+        return self._index
+
+    def save_chunks(self, chunks: Mapping[str, str]):
+        """
+        Saves text chunks under their keys and adds them to the similarity index.
+        """
+        index = self.index
+        vectors = self.embedder.embed(list(chunks.values()))
+        self.save_many(chunks)
+        index.add(list(chunks.keys()), vectors)
+        self._index_dirty = True
+
+    def search(self, query: str, k: int = 5, min_score: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        Returns the keys of the k chunks most similar to the query, with their cosine similarity.
+        """
+        index = self.index
+        return index.search(self.embedder.embed([query])[0], k, min_score)
+
+    def recall(self, query: str, k: int = 5, min_score: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns the k chunks most similar to the query, most similar first.
+        """
+        keys = [key for key, _ in self.search(query, k, min_score)]
+        found = self.retrieve_many(keys)
+        return {key: found[key] for key in keys if found[key] is not None}
+
+    def flush(self):
+        """
+        Writes the similarity index to disk if it changed.
+        """
+        if self._index is not None and self._index_dirty:
+            # Cleared first, so chunks added by another thread during the save mark it dirty again
+            self._index_dirty = False
+            try:
+                self._index.save(self.index_path)
+            except BaseException:
+                self._index_dirty = True
+                raise
+
+    def close(self):
+        self.flush()
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 # Example usage within the module for testing
 if __name__ == "__main__":
     em = ExternalMemory()
     em.save_data("test_key", {"data": "test_value"})
     retrieved_data = em.retrieve_data("test_key")
-    print(retrieved_data)
\ No newline at end of file
+    print(retrieved_data)
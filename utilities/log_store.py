@@ -0,0 +1,245 @@
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Record layout: CRC32 of the rest, kind, key length, value length, key, value
+_HEADER = struct.Struct("<IBII")
+_PUT, _DELETE, _COMMIT = 1, 2, 3
+
+
+def _encode(kind: int, key: bytes = b"", value: bytes = b"") -> bytes:
+    body = _HEADER.pack(0, kind, len(key), len(value))[4:] + key + value
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+class _Segment:
+    """
+    One log file together with the index of its live records.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "a+b")
+        # key -> (value offset, value length, record size)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self.size = 0
+        self.live_bytes = 0
+        self.mmap: Optional[mmap.mmap] = None
+
+    def remap(self):
+        # Earlier maps stay valid for readers still holding them and are released by garbage collection
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def apply(self, ops: List[Tuple[int, str, int, int, int]]):
+        for kind, key, offset, length, record_size in ops:
+            old = self.index.pop(key, None)
+            if old is not None:
+                self.live_bytes -= old[2]
+            if kind == _PUT:
+                self.index[key] = (offset, length, record_size)
+                self.live_bytes += record_size
+
+    def scan(self, start: int, end: int) -> int:
+        """
+        Replays the committed batches between two offsets into the index and returns the end
+        of the last valid commit. Anything after it is a torn or corrupt write.
+        """
+        if end <= start:
+            return start
+        view = memoryview(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ))
+        try:
+            position = committed = start
+            pending = []
+            while position + _HEADER.size <= end:
+                crc, kind, key_length, value_length = _HEADER.unpack_from(view, position)
+                record_end = position + _HEADER.size + key_length + value_length
+                if kind not in (_PUT, _DELETE, _COMMIT) or record_end > end:
+                    break
+                if zlib.crc32(view[position + 4:record_end]) != crc:
+                    break
+                if kind == _COMMIT:
+                    self.apply(pending)
+                    pending = []
+                    committed = record_end
+                else:
+                    key_start = position + _HEADER.size
+                    key = bytes(view[key_start:key_start + key_length]).decode("utf-8")
+                    pending.append((kind, key, key_start + key_length, value_length, record_end - position))
+                position = record_end
+            return committed
+        finally:
+            view.release()
+
+    def close(self):
+        # The map is left to readers that may still hold this segment
+        self.file.close()
+
+
+class LogStore:
+    """
+    Key-value store kept as an append-only log of checksummed records.
+
+    Writes append one batch of records followed by a commit record, so a batch is applied
+    completely or not at all; on open the log is replayed into an in-memory key -> offset
+    index and truncated after the last intact commit, dropping a torn write. Reads are a
+    single slice of a read-only memory map. Overwritten and deleted records become dead
+    space, and once it exceeds compact_ratio of the file a background thread rewrites the
+    live records into a new log, catching up on writes made meanwhile before swapping it in.
+    Values are pickled, as in SQLiteStore.
+    """
+
+    def __init__(self, path: str, fsync: bool = False, compact_ratio: float = 0.5,
+                 compact_min_bytes: int = 4 * 1024 * 1024):
+        """
+        Initializes an instance of the LogStore class.
+
+        Args:
+            path (str): Path to the log file.
+            fsync (bool, optional): Whether every batch is flushed to disk before returning, which
+                also survives power loss. Otherwise batches survive crashes of the process only.
+            compact_ratio (float, optional): Share of dead bytes that triggers a compaction.
+            compact_min_bytes (int, optional): Size below which the log is never compacted.
+        """
+        self.path = path
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.write_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self.compactions = 0
+        self._segment = self._open(path)
+
+    @staticmethod
+    def _open(path: str) -> _Segment:
+        segment = _Segment(path)
+        size = os.fstat(segment.file.fileno()).st_size
+        segment.size = segment.scan(0, size)
+        if segment.size < size:
+            logger.warning("Discarding %d bytes after the last intact commit of %s", size - segment.size, path)
+            segment.file.truncate(segment.size)
+        segment.remap()
+        return segment
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        self._write([(_PUT, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in items])
+
+    def delete_many(self, keys: List[str]):
+        self._write([(_DELETE, key, b"") for key in keys])
+
+    def _write(self, records: List[Tuple[int, str, bytes]]):
+        if not records:
+            return
+        with self.write_lock:
+            segment = self._segment
+            chunks, ops = [], []
+            position = segment.size
+            for kind, key, value in records:
+                encoded_key = key.encode("utf-8")
+                record = _encode(kind, encoded_key, value)
+                value_offset = position + _HEADER.size + len(encoded_key)
+                ops.append((kind, key, value_offset, len(value), len(record)))
+                chunks.append(record)
+                position += len(record)
+            chunks.append(_encode(_COMMIT))
+            try:
+                segment.file.write(b"".join(chunks))
+                segment.file.flush()
+                if self.fsync:
+                    os.fsync(segment.file.fileno())
+            except BaseException:
+                # Drop a partial batch so that later offsets stay right
+                segment.file.truncate(segment.size)
+                raise
+            segment.size = position + _HEADER.size
+            # Remapped before the index update, so a reader finding a new offset also finds it mapped
+            segment.remap()
+            segment.apply(ops)
+            if self._should_compact(segment):
+                self._start_compaction()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        segment = self._segment
+        entries = [(key, segment.index.get(key)) for key in keys]
+        data = segment.mmap
+        return {key: pickle.loads(data[entry[0]:entry[0] + entry[1]]) for key, entry in entries if entry is not None}
+
+    def stats(self) -> Dict:
+        segment = self._segment
+        return {
+            "keys": len(segment.index),
+            "file_bytes": segment.size,
+            "live_bytes": segment.live_bytes,
+            "dead_bytes": segment.size - segment.live_bytes,
+            "compactions": self.compactions,
+        }
+
+    def _should_compact(self, segment: _Segment) -> bool:
+        dead = segment.size - segment.live_bytes
+        return segment.size >= self.compact_min_bytes and dead > self.compact_ratio * segment.size
+
+    def _start_compaction(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="log-compaction", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """
+        Rewrites the live records into a new log and swaps it in.
+
+        Writers are only blocked while the batches appended during the copy are carried over.
+        """
+        with self._compact_lock:
+            with self.write_lock:
+                old = self._segment
+                snapshot = dict(old.index)
+                end = old.size
+                data = old.mmap
+            temp_path = f"{self.path}.compact"
+            index: Dict[str, Tuple[int, int, int]] = {}
+            position = 0
+            with open(temp_path, "wb") as out:
+                # Live records are copied as one batch, so a crash mid-copy leaves no commit behind
+                for key, (offset, length, _) in snapshot.items():
+                    encoded_key = key.encode("utf-8")
+                    record = _encode(_PUT, encoded_key, data[offset:offset + length])
+                    index[key] = (position + _HEADER.size + len(encoded_key), length, len(record))
+                    out.write(record)
+                    position += len(record)
+                out.write(_encode(_COMMIT))
+                position += _HEADER.size
+
+            with self.write_lock:
+                old = self._segment
+                segment = _Segment(temp_path)
+                segment.index = index
+                segment.live_bytes = sum(entry[2] for entry in index.values())
+                if old.size > end:
+                    # Batches committed during the copy are appended unchanged and replayed
+                    segment.file.write(old.mmap[end:old.size])
+                    segment.file.flush()
+                segment.size = segment.scan(position, position + old.size - end)
+                os.fsync(segment.file.fileno())
+                os.replace(temp_path, self.path)
+                segment.path = self.path
+                segment.remap()
+                self._segment = segment
+                old.close()
+                self.compactions += 1
+        logger.info("Compacted %s from %d to %d bytes", self.path, end, segment.size)
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self.write_lock:
+            self._segment.close()
+            self._segment.mmap = None
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate.
+
+    Callers reserve capacity up front and the bucket may go into debt; the returned wait
+    is how long the caller has to sleep before the reservation is covered. Reservations are
+    therefore served in arrival order without polling.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        """
+        Initializes an instance of the TokenBucket class.
+
+        Args:
+            per_minute (float): The refill rate per minute.
+            capacity (float, optional): The burst size. Defaults to one minute of refill.
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Takes an amount from the bucket and returns the seconds until it is covered.
+        """
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        # A single reservation larger than the bucket could never be covered
+        self.available -= min(amount, self.capacity)
+        return max(0.0, -self.available / self.rate)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget shared by every caller in the process.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        """
+        Initializes an instance of the RateLimiter class.
+
+        Args:
+            requests_per_minute (float, optional): Request budget. None means unlimited.
+            tokens_per_minute (float, optional): Token budget. None means unlimited.
+        """
+        self.lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserves one request using the given number of tokens and returns the seconds to wait before making it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until one request using the given number of tokens fits in the budget.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Returns an exponential backoff delay with full jitter for a zero-based retry attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
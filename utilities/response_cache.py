@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for chat completion responses.
+
+    Entries are keyed by a stable hash of the request and live in two tiers: a bounded
+    in-memory LRU and a directory of JSON files on local disk that survives restarts.
+    Both tiers honour the same TTL; the disk tier is additionally bounded in bytes and
+    evicts the least recently written files first.
+    """
+
+    def __init__(self, directory: str = ".response_cache", max_entries: int = 1024,
+                 max_disk_bytes: int = 256 * 1024 * 1024, ttl: Optional[float] = 24 * 60 * 60,
+                 cache_nondeterministic: bool = False):
+        """
+        Initializes an instance of the ResponseCache class.
+
+        Args:
+            directory (str, optional): Directory for the on-disk tier. None disables it.
+            max_entries (int, optional): Maximum number of entries kept in memory.
+            max_disk_bytes (int, optional): Maximum total size of the on-disk tier.
+            ttl (float, optional): Seconds an entry stays valid. None means no expiry.
+            cache_nondeterministic (bool, optional): Serve requests with a non-zero temperature
+                without the caller opting in.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.cache_nondeterministic = cache_nondeterministic
+        self.lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expirations": 0,
+        }
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+        """
+        Returns the stable hash identifying a request.
+        """
+        payload = json.dumps(
+            {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature},
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def should_cache(self, temperature: float, opt_in: bool = False) -> bool:
+        """
+        Returns whether a request with the given temperature may be served from the cache.
+        """
+        return temperature == 0 or opt_in or self.cache_nondeterministic
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Returns the cached value for a key, or None on a miss.
+
+        A key missing from the disk index is still looked up on disk, since other worker
+        processes sharing the directory may have written it. Files are read and removed
+        outside the lock.
+        """
+        now = time.time()
+        stale = False
+        with self.lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                # Both tiers share the expiry, so the disk copy is stale as well
+                del self._memory[key]
+                self._forget_disk(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                stale = True
+        if stale:
+            self._remove_files([key])
+            return None
+
+        record, size = self._read_disk(key) if self.directory else (None, 0)
+        with self.lock:
+            if record is not None and (record["expires_at"] is None or record["expires_at"] > now):
+                self._remember(key, record["expires_at"], record["value"])
+                if key not in self._disk_index:
+                    self._disk_index[key] = size
+                    self._disk_bytes += size
+                self._counters["disk_hits"] += 1
+                return record["value"]
+            self._counters["misses"] += 1
+            if record is None:
+                return None
+            self._forget_disk(key)
+            self._counters["expirations"] += 1
+        self._remove_files([key])
+        return None
+
+    def set(self, key: str, value: Dict):
+        """
+        Stores a JSON-serializable value under a key in both tiers.
+        """
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self._remember(key, expires_at, value)
+        if not self.directory:
+            return
+        size = self._write_disk(key, {"expires_at": expires_at, "value": value})
+        evicted = []
+        with self.lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            self._disk_index[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk_index) > 1:
+                oldest = next(iter(self._disk_index))
+                self._forget_disk(oldest)
+                evicted.append(oldest)
+                self._counters["disk_evictions"] += 1
+        self._remove_files(evicted)
+
+    def clear(self):
+        """
+        Removes every entry from both tiers.
+        """
+        with self.lock:
+            self._memory.clear()
+            keys = list(self._disk_index)
+            for key in keys:
+                self._forget_disk(key)
+        self._remove_files(keys)
+
+    def stats(self) -> Dict:
+        """
+        Returns the hit, miss and eviction counters together with the current tier sizes.
+        """
+        with self.lock:
+            stats = dict(self._counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = len(self._disk_index)
+            stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def _remember(self, key: str, expires_at: Optional[float], value: Dict):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key: str) -> Tuple[Optional[Dict], int]:
+        """
+        Returns the record stored on disk for a key and its size in bytes, or (None, 0).
+        """
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            return json.loads(data), len(data)
+        except (OSError, ValueError):
+            return None, 0
+
+    def _write_disk(self, key: str, record: Dict) -> int:
+        """
+        Writes a record to disk and returns its size in bytes.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        # Write to a temporary file first so readers in other processes never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _forget_disk(self, key: str):
+        # Called with the lock held; the file itself is removed afterwards by _remove_files
+        self._disk_bytes -= self._disk_index.pop(key, 0)
+
+    def _remove_files(self, keys: List[str]):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
@@ -0,0 +1,171 @@
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class _Call:
+    """
+    One in-flight call whose result or error is handed to every caller that joined it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Stream:
+    """
+    One in-flight stream shared by several readers.
+
+    Chunks are buffered so that a reader joining late first replays what it missed. There is
+    no pumping thread: whichever reader needs the next chunk first pulls it from the source
+    while the others wait, so the stream keeps going if its first reader goes away. The
+    source is closed once the last reader leaves before it is exhausted.
+    """
+
+    def __init__(self, source: Iterator, flight: "SingleFlight", key: str):
+        self.source = source
+        self.flight = flight
+        self.key = key
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.pumping = False
+        self.readers = 0
+
+    def _pump(self):
+        try:
+            chunk = next(self.source)
+        except StopIteration:
+            self._finish()
+        except BaseException as e:
+            self._finish(e)
+        else:
+            with self.cond:
+                self.chunks.append(chunk)
+                self.pumping = False
+                self.cond.notify_all()
+
+    def _finish(self, error: Optional[BaseException] = None):
+        self.flight._forget_stream(self.key, self)
+        with self.cond:
+            self.finished = True
+            self.error = error
+            self.pumping = False
+            self.cond.notify_all()
+
+    def read(self) -> Iterator:
+        position = 0
+        try:
+            while True:
+                with self.cond:
+                    while position >= len(self.chunks) and not self.finished and self.pumping:
+                        self.cond.wait()
+                    if position < len(self.chunks):
+                        chunk, pump = self.chunks[position], False
+                        position += 1
+                    elif self.finished:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                    else:
+                        chunk, pump = None, True
+                        self.pumping = True
+                if pump:
+                    self._pump()
+                else:
+                    yield chunk
+        finally:
+            if self.flight._leave_stream(self):
+                getattr(self.source, "close", lambda: None)()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller of a key runs the call; callers arriving while it is in flight wait and
+    receive the same result, or the same exception. Once it finishes the key is forgotten, so
+    unlike a cache nothing is kept beyond the burst.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self._counters = {"calls": 0, "joins": 0, "stream_calls": 0, "stream_joins": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Returns fn(), sharing one run of it with every concurrent caller using the same key.
+        """
+        with self.lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters["calls"] += 1
+            else:
+                self._counters["joins"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stream(self, key: str, source: Callable[[], Iterator]) -> Iterator:
+        """
+        Yields the items of source(), sharing one run of it with every concurrent reader using the same key.
+        """
+        with self.lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = self._streams[key] = _Stream(source(), self, key)
+                self._counters["stream_calls"] += 1
+            else:
+                self._counters["stream_joins"] += 1
+            with shared.cond:
+                shared.readers += 1
+        return shared.read()
+
+    def _forget_stream(self, key: str, shared: _Stream):
+        with self.lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def _leave_stream(self, shared: _Stream) -> bool:
+        """
+        Unregisters a reader and returns whether it was the last one of an unfinished stream.
+        """
+        # Under the flight lock, so nobody can join a stream that is about to be closed
+        with self.lock:
+            with shared.cond:
+                shared.readers -= 1
+                abandoned = shared.readers == 0 and not shared.finished
+            if abandoned and self._streams.get(shared.key) is shared:
+                del self._streams[shared.key]
+        return abandoned
+
+    def stats(self) -> Dict:
+        """
+        Returns how many calls ran, how many callers joined one already in flight, and the current in-flight counts.
+        """
+        with self.lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._calls)
+            stats["streams_in_flight"] = len(self._streams)
+        total = stats["calls"] + stats["joins"] + stats["stream_calls"] + stats["stream_joins"]
+        stats["join_rate"] = (stats["joins"] + stats["stream_joins"]) / total if total else 0.0
+        return stats
@@ -0,0 +1,202 @@
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Offline embedder hashing word unigrams and bigrams plus character n-grams into a fixed-size vector.
+
+    Needs no model download or network access. Hashes are CRC32, so vectors are stable across
+    processes (unlike Python's salted hash), and a second hash bit picks the sign of each
+    feature so that collisions cancel out on average. Vectors are L2-normalized, making the
+    dot product the cosine similarity.
+    """
+
+    def __init__(self, dim: int = 256, char_ngrams: Tuple[int, int] = (3, 5)):
+        """
+        Initializes an instance of the HashingEmbedder class.
+
+        Args:
+            dim (int, optional): Vector size.
+            char_ngrams (Tuple[int, int], optional): Smallest and largest character n-gram length.
+        """
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+
+    @property
+    def name(self) -> str:
+        return f"hashing-{self.dim}-{self.char_ngrams[0]}-{self.char_ngrams[1]}"
+
+    def _features(self, text: str) -> Counter:
+        words = _WORD.findall(text.lower())
+        features = Counter(words)
+        features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(low, min(high, len(padded)) + 1):
+                features.update(f"#{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Returns one normalized float32 row per text.
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                # Sublinear term frequency keeps repeated words from dominating
+                weight = 1.0 + math.log(count)
+                vectors[row, digest % self.dim] += weight if digest & 0x80000000 else -weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class VectorIndex:
+    """
+    Exact nearest-neighbour index over a contiguous float32 matrix.
+
+    Rows are kept packed: a delete moves the last row into the freed slot, so a search is
+    always one matrix-vector product over the first `count` rows followed by a partial sort.
+    The matrix grows by doubling, making adds amortized O(1). A loaded index is memory-mapped
+    read-only and only copied into memory when it is first modified.
+    """
+
+    def __init__(self, dim: int, embedder_name: str = ""):
+        """
+        Initializes an instance of the VectorIndex class.
+
+        Args:
+            dim (int): Vector size.
+            embedder_name (str, optional): Recorded on save, so vectors of another embedder are not mixed in.
+        """
+        self.dim = dim
+        self.embedder_name = embedder_name
+        self.lock = threading.Lock()
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.count = 0
+        self.keys: List[str] = []
+        self.positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.positions
+
+    def _reserve(self, rows: int):
+        if rows <= self.vectors.shape[0] and self.vectors.flags.writeable:
+            return
+        capacity = max(rows, 2 * self.vectors.shape[0], 1024)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self.count] = self.vectors[:self.count]
+        self.vectors = grown
+
+    def add(self, keys: Sequence[str], vectors: np.ndarray):
+        """
+        Adds or replaces the vectors of the given keys.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dim)
+        with self.lock:
+            new = sum(1 for key in set(keys) if key not in self.positions)
+            self._reserve(self.count + new)
+            for key, vector in zip(keys, vectors):
+                position = self.positions.get(key)
+                if position is None:
+                    position = self.positions[key] = self.count
+                    self.keys.append(key)
+                    self.count += 1
+                self.vectors[position] = vector
+
+    def delete(self, keys: Iterable[str]) -> int:
+        """
+        Removes the given keys, ignoring unknown ones, and returns how many were removed.
+        """
+        removed = 0
+        with self.lock:
+            for key in keys:
+                position = self.positions.pop(key, None)
+                if position is None:
+                    continue
+                if not self.vectors.flags.writeable:
+                    self._reserve(self.count)
+                last = self.count - 1
+                if position != last:
+                    moved = self.keys[last]
+                    self.vectors[position] = self.vectors[last]
+                    self.keys[position] = moved
+                    self.positions[moved] = position
+                self.keys.pop()
+                self.count -= 1
+                removed += 1
+        return removed
+
+    def search(self, vector: np.ndarray, k: int = 5, min_score: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (key, score) pairs with the highest dot product, best first.
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self.lock:
+            if self.count == 0 or k <= 0:
+                return []
+            scores = self.vectors[:self.count] @ query
+            k = min(k, self.count)
+            top = np.argpartition(-scores, k - 1)[:k] if k < self.count else np.arange(self.count)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results = [(self.keys[i], float(scores[i])) for i in top]
+        if min_score is not None:
+            results = [(key, score) for key, score in results if score >= min_score]
+        return results
+
+    def save(self, path: str):
+        """
+        Writes the index to <path>.npy and <path>.json, replacing each file atomically.
+        """
+        with self.lock:
+            vectors = self.vectors[:self.count]
+            meta = {"dim": self.dim, "embedder": self.embedder_name, "keys": list(self.keys)}
+            directory = os.path.dirname(os.path.abspath(path))
+            # The matrix goes first: a crash in between leaves keys that are checked against its row count on load
+            with tempfile.NamedTemporaryFile(dir=directory, suffix=".npy", delete=False) as file:
+                np.save(file, vectors)
+            os.replace(file.name, f"{path}.npy")
+            with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".json", delete=False) as file:
+                json.dump(meta, file)
+            os.replace(file.name, f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorIndex":
+        """
+        Loads an index written by save, memory-mapping the matrix unless mmap is False.
+        """
+        with open(f"{path}.json") as file:
+            meta = json.load(file)
+        vectors = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        if vectors.shape != (len(meta["keys"]), meta["dim"]):
+            raise ValueError(f"Vector index {path} is inconsistent: {vectors.shape} rows for {len(meta['keys'])} keys")
+        index = cls(meta["dim"], meta.get("embedder", ""))
+        index.vectors = vectors
+        index.count = len(meta["keys"])
+        index.keys = meta["keys"]
+        index.positions = {key: position for position, key in enumerate(index.keys)}
+        return index
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(f"{path}.json") and os.path.exists(f"{path}.npy")